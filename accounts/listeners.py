@@ -1,4 +1,17 @@
 def profile_changed(sender, instance, **kwargs):
     from accounts.services import UserService
 
-    UserService.invalidate_profile_cache(instance.id)
+    # The profile is cached by user_id, not by its own id
+    UserService.invalidate_profile_cache(instance.user_id)
+
+
+def update_profile_cache(sender, instance, **kwargs):
+    from django.conf import settings
+    from accounts.services import UserService
+    from utils.transactions import run_on_commit
+
+    if not settings.CACHE_WRITE_THROUGH:
+        UserService.invalidate_profile_cache(instance.user_id)
+        return
+
+    run_on_commit(lambda: UserService.update_profile_cache(instance.user_id))
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_friendship_counts(apps, schema_editor):
+    # The counters were added with 0 for everyone, count the friendships
+    # which already exist. Profiles are created lazily, users who have
+    # friendships but no profile yet get one here.
+    Friendship = apps.get_model('friendships', 'Friendship')
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+    profile_user_ids = set(
+        UserProfile.objects.values_list('user_id', flat=True),
+    )
+    for attr, user_id_field in [
+        ('followers_count', 'to_user_id'),
+        ('followings_count', 'from_user_id'),
+    ]:
+        counts = Friendship.objects.filter(
+            **{user_id_field + '__isnull': False},
+        ).values_list(user_id_field).annotate(count=Count('id')).order_by()
+        for user_id, count in counts.iterator():
+            if user_id not in profile_user_ids:
+                UserProfile.objects.create(user_id=user_id)
+                profile_user_ids.add(user_id)
+            UserProfile.objects.filter(user_id=user_id).update(**{
+                attr: count,
+            })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_auto_20261018_1106'),
+        ('friendships', '0004_auto_20261018_1103'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_friendship_counts,
+            migrations.RunPython.noop,
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='followers_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='followings_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
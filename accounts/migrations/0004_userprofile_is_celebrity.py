@@ -0,0 +1,18 @@
+# Generated by Django 3.1.13 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_backfill_friendship_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='is_celebrity',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.13 on 2026-10-18 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_userprofile_is_celebrity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='newsfeeds_pruned_before',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -2,8 +2,8 @@ from django.contrib.auth.models import User
 from django.db import models
 from django.db.models.signals import post_save, pre_delete
 
-from accounts.listeners import profile_changed
-from utils.listeners import invalidate_object_cache
+from accounts.listeners import profile_changed, update_profile_cache
+from utils.listeners import invalidate_object_cache, update_object_cache
 
 
 class UserProfile(models.Model):
@@ -15,6 +15,16 @@ class UserProfile(models.Model):
     # Url to access the file
     avatar = models.FileField(null=True)
     nickname = models.CharField(null=True, max_length=200)
+    # Denormalized friendship counters, updated with F() expressions by the
+    # friendship listeners so that paging followers never runs a COUNT(*)
+    followers_count = models.IntegerField(default=0)
+    followings_count = models.IntegerField(default=0)
+    # Tweets of celebrities are pulled by their followers instead of being
+    # fanned out. Sticky, once set it is never cleared.
+    is_celebrity = models.BooleanField(default=False, db_index=True)
+    # Newsfeeds created before it were deleted by the retention job, older
+    # ones are pulled from the tweets of the followings instead
+    newsfeeds_pruned_before = models.DateTimeField(null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -38,7 +48,7 @@ User.profile = property(get_profile)
 
 # hook up with listeners to invalidate cache
 pre_delete.connect(invalidate_object_cache, sender=User)
-post_save.connect(invalidate_object_cache, sender=User)
+post_save.connect(update_object_cache, sender=User)
 
 pre_delete.connect(profile_changed, sender=UserProfile)
-post_save.connect(profile_changed, sender=UserProfile)
+post_save.connect(update_profile_cache, sender=UserProfile)
@@ -1,30 +1,108 @@
-from django.conf import settings
-from django.core.cache import caches
+from django.contrib.auth.models import User
+from django.db.models import F
 
 from accounts.models import UserProfile
 from twitter.cache import USER_PROFILE_PATTERN
-
-cache = caches['testing'] if settings.TESTING else caches['default']
+from utils.memcached_helper import MemchachedHelper
+from utils.redis_helper import RedisHelper
 
 
 class UserService:
 
     @classmethod
     def get_profile_through_cache(cls, user_id):
-        key = USER_PROFILE_PATTERN.format(user_id=user_id)
+        # Cache miss reads from db, creates the profile if there is none yet
+        return MemchachedHelper.load_object_through_cache(
+            UserProfile,
+            USER_PROFILE_PATTERN.format(user_id=user_id),
+            lambda: UserProfile.objects.get_or_create(user_id=user_id)[0],
+        )
+
+    @classmethod
+    def get_profiles_through_cache(cls, user_ids):
+        user_ids = set(user_ids)
+        key_to_user_id = {USER_PROFILE_PATTERN.format(user_id=user_id): user_id
+                          for user_id in user_ids}
+        cached_profiles = MemchachedHelper.get_cached_objects(
+            UserProfile,
+            key_to_user_id,
+        )
+        profiles = {
+            key_to_user_id[key]: profile
+            for key, profile in cached_profiles.items()
+        }
+
+        missing_user_ids = user_ids - set(profiles)
+        if not missing_user_ids:
+            return profiles
+
+        db_profiles = UserProfile.objects.filter(user_id__in=missing_user_ids)
+        profiles.update({profile.user_id: profile for profile in db_profiles})
+        # Users without a profile yet, create them one by one same as
+        # get_profile_through_cache, this rarely happens
+        for user_id in missing_user_ids - set(profiles):
+            profiles[user_id], _ = UserProfile.objects.get_or_create(
+                user_id=user_id,
+            )
+        MemchachedHelper.set_cached_objects(UserProfile, {
+            USER_PROFILE_PATTERN.format(user_id=user_id): profiles[user_id]
+            for user_id in missing_user_ids
+        })
+        return profiles
+
+    @classmethod
+    def prefetch_users_through_cache(cls, objects, user_id_attr='user_id',
+                                     cached_attr='_cached_user'):
+        """
+        Load the users of all the objects and their profiles with one
+        get_many each, so that serializing obj.cached_user.profile does not
+        hit the cache once per row.
+        """
+        MemchachedHelper.prefetch_objects_through_cache(
+            objects,
+            User,
+            user_id_attr,
+            cached_attr,
+        )
+        users = [
+            getattr(obj, cached_attr)
+            for obj in objects
+            if hasattr(obj, cached_attr)
+        ]
+        profiles = cls.get_profiles_through_cache(user.id for user in users)
+        for user in users:
+            setattr(user, '_cached_user_profile', profiles[user.id])
+
+    @classmethod
+    def update_profile_cache(cls, user_id):
+        MemchachedHelper.write_through(
+            UserProfile,
+            USER_PROFILE_PATTERN.format(user_id=user_id),
+            UserProfile.objects.filter(user_id=user_id),
+        )
 
-        # Cache hit, return immediately
-        profile = cache.get(key)
-        if profile is not None:
-            return profile
+    @classmethod
+    def get_profile_count(cls, user_id, attr):
+        profile = cls.get_profile_through_cache(user_id)
+        return RedisHelper.get_count(UserProfile, profile.id, attr)
 
-        # Cache miss, read from db
-        profile, _ = UserProfile.objects.get_or_create(user_id=user_id)
-        # profile = User.objects.get(id=user_id).profile
-        cache.set(key, profile)
-        return profile
+    @classmethod
+    def incr_profile_count(cls, user_id, attr):
+        profile = cls.get_profile_through_cache(user_id)
+        UserProfile.objects.filter(id=profile.id).update(**{
+            attr: F(attr) + 1,
+        })
+        RedisHelper.incr_count(UserProfile, profile.id, attr)
+
+    @classmethod
+    def decr_profile_count(cls, user_id, attr):
+        profile = cls.get_profile_through_cache(user_id)
+        UserProfile.objects.filter(id=profile.id).update(**{
+            attr: F(attr) - 1,
+        })
+        RedisHelper.decr_count(UserProfile, profile.id, attr)
 
     @classmethod
     def invalidate_profile_cache(cls, user_id):
         key = USER_PROFILE_PATTERN.format(user_id=user_id)
-        cache.delete(key)
+        MemchachedHelper.delete_cached_object(UserProfile, key)
@@ -1,12 +1,42 @@
 from accounts.models import UserProfile
+from accounts.services import UserService
 from testing.testcases import TestCase
 
 
 class UserProfileTests(TestCase):
 
+    def setUp(self):
+        self.clear_cache()
+
     def test_profile_property(self):
         user1 = self.create_user('user1')
         self.assertEqual(UserProfile.objects.count(), 0)
         p = user1.profile
         self.assertEqual(isinstance(p, UserProfile), True)
         self.assertEqual(UserProfile.objects.count(), 1)
+
+    def test_get_profiles_through_cache(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        user1.profile
+        profiles = UserService.get_profiles_through_cache([user1.id, user2.id])
+        self.assertEqual(profiles[user1.id].user_id, user1.id)
+        # missing profile is created same as user.profile does
+        self.assertEqual(profiles[user2.id].user_id, user2.id)
+        self.assertEqual(UserProfile.objects.count(), 2)
+
+        with self.assertNumQueries(0):
+            profiles = UserService.get_profiles_through_cache(
+                [user1.id, user2.id],
+            )
+        self.assertEqual(len(profiles), 2)
+
+    def test_profile_write_through(self):
+        user1 = self.create_user('user1')
+        profile = user1.profile
+        profile.nickname = 'new nickname'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        with self.assertNumQueries(0):
+            cached_profile = UserService.get_profile_through_cache(user1.id)
+        self.assertEqual(cached_profile.nickname, 'new nickname')
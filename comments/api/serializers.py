@@ -2,9 +2,11 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from accounts.api.serializers import UserSerializerForTweet
+from accounts.services import UserService
 from comments.models import Comment
 from tweets.models import Tweet
 from likes.service import LikeService
+from utils.serializers import PrefetchListSerializer
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -14,6 +16,7 @@ class CommentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Comment
+        list_serializer_class = PrefetchListSerializer
         fields = (
             'id',
             'tweet_id',
@@ -26,10 +29,31 @@ class CommentSerializer(serializers.ModelSerializer):
         )
 
     def get_likes_count(self, obj):
-        return obj.like_set.count()
+        # Set by prefetch
+        if hasattr(obj, '_cached_likes_count'):
+            return obj._cached_likes_count
+        return LikeService.get_likes_count(Comment, obj.id)
 
     def get_has_liked(self, obj):
-        return LikeService.has_liked(self.context['request'].user, obj)
+        return LikeService.has_liked_in_context(self.context, obj)
+
+    def prefetch(self, comments):
+        UserService.prefetch_users_through_cache(comments)
+        LikeService.prefetch_has_liked(self.context, Comment, comments)
+        likes_counts = LikeService.get_likes_counts(
+            Comment,
+            [comment.id for comment in comments],
+        )
+        for comment in comments:
+            comment._cached_likes_count = likes_counts[comment.id]
+
+
+class CommentSerializerForNotification(serializers.ModelSerializer):
+    # Same as TweetSerializerForNotification
+
+    class Meta:
+        model = Comment
+        fields = ('id', 'tweet_id', 'user_id', 'content', 'created_at')
 
 
 class CommentSerializerForCreate(serializers.ModelSerializer):
@@ -63,6 +87,6 @@ class CommentSerializerForUpdate(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         instance.content = validated_data['content']
-        instance.save()
+        instance.save(update_fields=['content', 'updated_at'])
         # update function needs to return updated instance
         return instance
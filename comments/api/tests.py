@@ -2,6 +2,7 @@ from rest_framework.test import APIClient
 
 from comments.models import Comment
 from testing.testcases import TestCase
+from utils.paginations import CommentPagination
 
 COMMENT_URL = '/api/comments/'
 COMMENT_DETAIL_URL = '/api/comments/{}/'
@@ -28,6 +29,8 @@ class CommentApiTests(TestCase):
         # Missing tweet_id
         response = self.anonymous_client.get(COMMENT_URL)
         self.assertEqual(response.status_code, 400)
+        response = self.anonymous_client.get(COMMENT_URL, {'tweet_id': 'a'})
+        self.assertEqual(response.status_code, 400)
 
         # With tweet_id
         # No comments at first
@@ -195,3 +198,62 @@ class CommentApiTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['results']
                          [0]['tweet']['comments_count'], 2)
+
+    def test_pagination(self):
+        page_size = CommentPagination.page_size
+        comments = [
+            self.create_comment(self.user2, self.tweet, f'comment {i}')
+            for i in range(page_size * 2 + 1)
+        ]
+        # Comments created in the same microsecond are paged by id
+        Comment.objects.update(created_at=comments[0].created_at)
+        self.clear_cache()
+
+        comment_ids = []
+        params = {'tweet_id': self.tweet.id}
+        while True:
+            response = self.anonymous_client.get(COMMENT_URL, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['comments']), page_size)
+            comment_ids.extend(
+                comment['id'] for comment in response.data['comments']
+            )
+            if not response.data['has_next_page']:
+                break
+            params['cursor'] = response.data['next_cursor']
+        self.assertEqual(comment_ids, [comment.id for comment in comments])
+
+        # created_at__lt pages from the newest, comments are read from the
+        # oldest
+        response = self.anonymous_client.get(COMMENT_URL, {
+            'tweet_id': self.tweet.id,
+            'created_at__lt': comments[-1].created_at,
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_first_page_cache(self):
+        comment = self.create_comment(self.user2, self.tweet, '1')
+        self.create_like(self.user1, comment)
+        params = {'tweet_id': self.tweet.id}
+        self.user1_client.get(COMMENT_URL, params)
+
+        # Comments, users, profiles and like counts all come from cache
+        with self.assertNumQueries(0):
+            response = self.anonymous_client.get(COMMENT_URL, params)
+        self.assertEqual(response.data['comments'][0]['likes_count'], 1)
+
+        # Creating, updating and deleting comments invalidate the page
+        new_comment = self.create_comment(self.user1, self.tweet, '2')
+        response = self.anonymous_client.get(COMMENT_URL, params)
+        self.assertEqual(len(response.data['comments']), 2)
+
+        self.user1_client.put(
+            COMMENT_DETAIL_URL.format(new_comment.id),
+            {'content': 'new content'},
+        )
+        response = self.anonymous_client.get(COMMENT_URL, params)
+        self.assertEqual(response.data['comments'][1]['content'], 'new content')
+
+        new_comment.delete()
+        response = self.anonymous_client.get(COMMENT_URL, params)
+        self.assertEqual(len(response.data['comments']), 1)
@@ -1,4 +1,6 @@
+from django.conf import settings
 from rest_framework import status, viewsets
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
@@ -9,14 +11,17 @@ from comments.api.serializers import (
     CommentSerializerForUpdate,
 )
 from comments.models import Comment
+from comments.services import CommentService
 from inbox.services import NotificationService
 from utils.decorators import required_params
+from utils.paginations import CommentPagination
 
 
 class CommentViewSet(viewsets.GenericViewSet):
     serializer_class = CommentSerializerForCreate
     queryset = Comment.objects.all()
     filterset_fields = ('tweet_id', )
+    pagination_class = CommentPagination
 
     def get_permissions(self):
         if self.action == 'create':
@@ -27,17 +32,36 @@ class CommentViewSet(viewsets.GenericViewSet):
 
     @required_params(params=['tweet_id'])
     def list(self, request, *args, **kwargs):
-        queryset = self.queryset
-        comments = self.filter_queryset(queryset).prefetch_related(
-            'user').order_by('created_at')
+        # '1' and '01' must not be cached under two keys
+        try:
+            tweet_id = int(request.query_params['tweet_id'])
+        except ValueError:
+            raise ValidationError({'tweet_id': 'Invalid tweet_id.'})
+        page = None
+        if self.paginator.is_first_page(request):
+            comments = CommentService.get_cached_first_page(
+                tweet_id,
+                self.paginator.page_size,
+            )
+            # The cache holds one more comment than a page unless there are
+            # no more, or the list length limit cuts it short
+            cache_size = min(
+                self.paginator.page_size + 1,
+                settings.REDIS_LIST_LENGTH_LIMIT,
+            )
+            page = self.paginator.paginate_cached_list(
+                comments,
+                request,
+                is_complete=len(comments) < cache_size,
+            )
+        if page is None:
+            page = self.paginate_queryset(self.filter_queryset(self.queryset))
         serializer = CommentSerializer(
-            comments,
+            page,
             context={'request': request},
             many=True,
         )
-        return Response({
-            'comments': serializer.data
-        }, status=status.HTTP_200_OK)
+        return self.get_paginated_response(serializer.data)
 
     def create(self, request, *args, **kwargs):
         data = {
@@ -0,0 +1,36 @@
+from django.db.models import F
+
+from utils.redis_helper import RedisHelper
+
+
+def incr_comments_count(sender, instance, created, **kwargs):
+    from tweets.models import Tweet
+
+    if not created or instance.tweet_id is None:
+        return
+
+    Tweet.objects.filter(id=instance.tweet_id).update(
+        comments_count=F('comments_count') + 1,
+    )
+    RedisHelper.incr_count(Tweet, instance.tweet_id, 'comments_count')
+
+
+def decr_comments_count(sender, instance, **kwargs):
+    from tweets.models import Tweet
+
+    if instance.tweet_id is None:
+        return
+
+    Tweet.objects.filter(id=instance.tweet_id).update(
+        comments_count=F('comments_count') - 1,
+    )
+    RedisHelper.decr_count(Tweet, instance.tweet_id, 'comments_count')
+
+
+def invalidate_cached_comments(sender, instance, **kwargs):
+    # A created, updated or deleted comment can change the cached first page
+    if instance.tweet_id is None:
+        return
+
+    from comments.services import CommentService
+    CommentService.invalidate_cached_comments(instance.tweet_id)
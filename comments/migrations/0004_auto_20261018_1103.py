@@ -0,0 +1,18 @@
+# Generated by Django 3.1.13 on 2026-10-18 11:03
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0006_auto_20261018_1103'),
+        ('comments', '0003_comment_likes_count'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='comment',
+            index_together={('tweet', 'created_at', 'id')},
+        ),
+    ]
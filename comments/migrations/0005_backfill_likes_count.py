@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import F, Func, OuterRef, Subquery
+
+
+def backfill_likes_count(apps, schema_editor):
+    # Same as the tweets counters, count the likes which already exist
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Like = apps.get_model('likes', 'Like')
+    Comment = apps.get_model('comments', 'Comment')
+    content_type = ContentType.objects.filter(
+        app_label='comments',
+        model='comment',
+    ).first()
+    if content_type is None:
+        return
+    Comment.objects.update(likes_count=Subquery(
+        Like.objects.filter(
+            content_type_id=content_type.id,
+            object_id=OuterRef('id'),
+        ).order_by().annotate(
+            count=Func(F('id'), function='COUNT'),
+        ).values('count'),
+        output_field=models.IntegerField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('comments', '0004_auto_20261018_1103'),
+        ('likes', '0002_auto_20230301_1952'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_likes_count,
+            migrations.RunPython.noop,
+        ),
+    ]
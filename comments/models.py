@@ -1,9 +1,15 @@
 from django.contrib.auth.models import User
-from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_delete
 
-from likes.models import Like
+from comments.listeners import (
+    decr_comments_count,
+    incr_comments_count,
+    invalidate_cached_comments,
+)
+from likes.service import LikeService
 from tweets.models import Tweet
+from utils.listeners import invalidate_object_cache, update_object_cache
 from utils.memcached_helper import MemchachedHelper
 
 
@@ -14,8 +20,12 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Denormalized counter, see Tweet.likes_count
+    likes_count = models.IntegerField(default=0)
+
     class Meta:
-        index_together = (('tweet', 'created_at'), )
+        # id breaks created_at ties for keyset pagination
+        index_together = (('tweet', 'created_at', 'id'), )
         ordering = ('-created_at', )
 
     def __str__(self):
@@ -23,11 +33,21 @@ class Comment(models.Model):
 
     @property
     def like_set(self):
-        return Like.objects.filter(
-            content_type=ContentType.objects.get_for_model(Comment),
-            object_id=self.id,
-        ).order_by('-created_at')
+        return LikeService.likes_for_comment_ids([self.id]).order_by(
+            '-created_at',
+        )
 
     @property
     def cached_user(self):
+        # Set by UserService.prefetch_users_through_cache
+        if hasattr(self, '_cached_user'):
+            return self._cached_user
         return MemchachedHelper.get_object_through_cache(User, self.user_id)
+
+
+post_save.connect(update_object_cache, sender=Comment)
+pre_delete.connect(invalidate_object_cache, sender=Comment)
+post_save.connect(incr_comments_count, sender=Comment)
+post_delete.connect(decr_comments_count, sender=Comment)
+post_save.connect(invalidate_cached_comments, sender=Comment)
+post_delete.connect(invalidate_cached_comments, sender=Comment)
@@ -0,0 +1,22 @@
+from comments.models import Comment
+from twitter.cache import TWEET_COMMENTS_PATTERN
+from utils.redis_client import RedisClient
+from utils.redis_helper import RedisHelper
+
+
+class CommentService(object):
+
+    @classmethod
+    def get_cached_first_page(cls, tweet_id, page_size):
+        # Only the oldest page_size + 1 comments are cached, the extra one
+        # tells whether there is a next page. Deeper pages are read from db.
+        queryset = Comment.objects.filter(
+            tweet_id=tweet_id,
+        ).order_by('created_at', 'id')[:page_size + 1]
+        key = TWEET_COMMENTS_PATTERN.format(tweet_id=tweet_id)
+        return RedisHelper.load_objects(key, queryset)
+
+    @classmethod
+    def invalidate_cached_comments(cls, tweet_id):
+        conn = RedisClient.get_connection()
+        conn.delete(TWEET_COMMENTS_PATTERN.format(tweet_id=tweet_id))
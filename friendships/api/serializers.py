@@ -3,22 +3,38 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from accounts.api.serializers import UserSerializerForFriendship
+from accounts.services import UserService
 from friendships.models import Friendship
 from friendships.services import FriendshipService
+from utils.serializers import PrefetchListSerializer
 
 
 class FollowingUserUdSetMixin:
 
-    @property
-    def following_user_id_set(self: serializers.ModelSerializer):
+    def prefetch_has_followed(self: serializers.ModelSerializer, user_ids):
+        # Only check the users of the page, the whole following set of the
+        # request user is never fetched
+        user_ids = set(user_ids)
         if self.context['request'].user.is_anonymous:
-            return set()
-        if hasattr(self, '_cached_following_user_id_set'):
-            return self._cached_following_user_id_set
-        user_id_set = FriendshipService.get_following_user_id_set(
-            self.context['request'].user.id,
-        )
-        return user_id_set
+            followed_user_ids = set()
+        else:
+            followed_user_ids = FriendshipService.get_followed_user_ids(
+                self.context['request'].user.id,
+                user_ids,
+            )
+        self._cached_has_followed = {
+            user_id: user_id in followed_user_ids
+            for user_id in user_ids
+        }
+
+    def has_followed(self: serializers.ModelSerializer, user_id):
+        if self.context['request'].user.is_anonymous:
+            return False
+        cached_has_followed = getattr(self, '_cached_has_followed', {})
+        if user_id not in cached_has_followed:
+            self.prefetch_has_followed([user_id])
+            cached_has_followed = self._cached_has_followed
+        return cached_has_followed[user_id]
 
 
 class FollowerSerializer(serializers.ModelSerializer, FollowingUserUdSetMixin):
@@ -27,10 +43,21 @@ class FollowerSerializer(serializers.ModelSerializer, FollowingUserUdSetMixin):
 
     class Meta:
         model = Friendship
+        list_serializer_class = PrefetchListSerializer
         fields = ('user', 'created_at', 'has_followed',)
 
+    def prefetch(self, friendships):
+        UserService.prefetch_users_through_cache(
+            friendships,
+            'from_user_id',
+            '_cached_from_user',
+        )
+        self.prefetch_has_followed(
+            friendship.from_user_id for friendship in friendships
+        )
+
     def get_has_followed(self, obj):
-        return obj.from_user_id in self.following_user_id_set
+        return self.has_followed(obj.from_user_id)
 
 
 class FollowingSerializer(serializers.ModelSerializer, FollowingUserUdSetMixin):
@@ -39,10 +66,21 @@ class FollowingSerializer(serializers.ModelSerializer, FollowingUserUdSetMixin):
 
     class Meta:
         model = Friendship
+        list_serializer_class = PrefetchListSerializer
         fields = ('user', 'created_at', 'has_followed',)
 
+    def prefetch(self, friendships):
+        UserService.prefetch_users_through_cache(
+            friendships,
+            'to_user_id',
+            '_cached_to_user',
+        )
+        self.prefetch_has_followed(
+            friendship.to_user_id for friendship in friendships
+        )
+
     def get_has_followed(self, obj):
-        return obj.to_user_id in self.following_user_id_set
+        return self.has_followed(obj.to_user_id)
 
 
 class FriendshipSerializerForCreate(serializers.ModelSerializer):
@@ -1,8 +1,11 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 
 from friendships.models import Friendship
 from testing.testcases import TestCase
-from utils.paginations import FriendshipPagination
+from utils.paginations import FriendshipPagination, encode_cursor
+from utils.time_helpers import utc_now
 
 FOLLOW_URL = '/api/friendships/{}/follow/'
 UNFOLLOW_URL = '/api/friendships/{}/unfollow/'
@@ -220,39 +223,62 @@ class FriendshipApiTests(TestCase):
             self.assertEqual(reuslt['has_followed'], True)
 
     def _test_friendship_pagination(self, url, max_page_size, page_size):
-        response = self.anonymous_client.get(url, {'page': 1})
+        response = self.anonymous_client.get(url)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data['results']), page_size)
         self.assertEqual(response.data['total_pages'], 2)
         self.assertEqual(response.data['total_results'], page_size * 2)
-        self.assertEqual(response.data['page_number'], 1)
         self.assertEqual(response.data['has_next_page'], True)
+        first_page = response.data['results']
 
-        response = self.anonymous_client.get(url, {'page': 2})
+        response = self.anonymous_client.get(
+            url, {'cursor': response.data['next_cursor']})
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data['results']), page_size)
         self.assertEqual(response.data['total_pages'], 2)
         self.assertEqual(response.data['total_results'], page_size * 2)
-        self.assertEqual(response.data['page_number'], 2)
         self.assertEqual(response.data['has_next_page'], False)
-
-        # Page 3 should be empty
-        response = self.anonymous_client.get(url, {'page': 3})
-        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['next_cursor'], None)
+        second_page = response.data['results']
+        self.assertEqual(
+            {result['user']['id'] for result in first_page} &
+            {result['user']['id'] for result in second_page},
+            set(),
+        )
+
+        # Past the last page the total is still reported
+        response = self.anonymous_client.get(url, {
+            'cursor': encode_cursor(utc_now().replace(year=2000), 0),
+        })
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['total_results'], page_size * 2)
 
         # Test user cannot customize page size exceeds max_page_size
         response = self.anonymous_client.get(
-            url, {'page': 1, 'page_size': max_page_size + 1})
+            url, {'page_size': max_page_size + 1})
         self.assertEqual(len(response.data['results']), max_page_size)
         self.assertEqual(response.data['total_pages'], 2)
         self.assertEqual(response.data['total_results'], page_size * 2)
-        self.assertEqual(response.data['page_number'], 1)
         self.assertEqual(response.data['has_next_page'], True)
 
         # Test user can customize page size
-        response = self.anonymous_client.get(url, {'page': 1, 'page_size': 2})
+        response = self.anonymous_client.get(url, {'page_size': 2})
         self.assertEqual(len(response.data['results']), 2)
         self.assertEqual(response.data['total_pages'], page_size)
         self.assertEqual(response.data['total_results'], page_size * 2)
-        self.assertEqual(response.data['page_number'], 1)
         self.assertEqual(response.data['has_next_page'], True)
+
+        # No COUNT(*) over the friendships, the counter is read from redis
+        with CaptureQueriesContext(connection) as queries:
+            self.anonymous_client.get(url)
+        self.assertFalse(any(
+            'COUNT' in query['sql'] for query in queries.captured_queries
+        ))
+
+    def test_friendships_of_missing_user(self):
+        for url in [FOLLOWERS_URL, FOLLOWINGS_URL]:
+            response = self.anonymous_client.get(url.format(0))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['results'], [])
+            self.assertEqual(response.data['total_results'], 0)
+            self.assertEqual(response.data['total_pages'], 1)
@@ -9,6 +9,8 @@ from friendships.api.serializers import (
     FriendshipSerializerForCreate,
 )
 from django.contrib.auth.models import User
+from friendships.services import FriendshipService
+from utils.memcached_helper import MemchachedHelper
 from utils.paginations import FriendshipPagination
 
 
@@ -17,13 +19,24 @@ class FriendshipViewSet(viewsets.GenericViewSet):
     serializer_class = FriendshipSerializerForCreate
     pagination_class = FriendshipPagination
 
+    def _get_total_results(self, pk, get_count):
+        # The counters live on the profile, a user with id=pk which does not
+        # exist gets an empty page instead of a profile
+        user_id = int(pk)
+        if not MemchachedHelper.get_objects_through_cache(User, [user_id]):
+            return 0
+        return get_count(user_id)
+
     @action(methods=['GET'], detail=True, permission_classes=[AllowAny])
     def followers(self, request, pk):
         # pk is the user id
         # GET /api/friendships/{user_id}/followers/
-        friendships = Friendship.objects.filter(
-            to_user_id=pk).order_by('-created_at')
+        friendships = Friendship.objects.filter(to_user_id=pk)
         page = self.paginate_queryset(friendships)
+        self.paginator.total_results = self._get_total_results(
+            pk,
+            FriendshipService.get_follower_count,
+        )
         serializer = FollowerSerializer(
             page, many=True, context={'request': request})
         return self.get_paginated_response(serializer.data)
@@ -32,9 +45,12 @@ class FriendshipViewSet(viewsets.GenericViewSet):
     def followings(self, request, pk):
         # pk is the user id
         # GET /api/friendships/{user_id}/followings/
-        friendships = Friendship.objects.filter(
-            from_user_id=pk).order_by('-created_at')
+        friendships = Friendship.objects.filter(from_user_id=pk)
         page = self.paginate_queryset(friendships)
+        self.paginator.total_results = self._get_total_results(
+            pk,
+            FriendshipService.get_following_count,
+        )
         serializer = FollowingSerializer(
             page, many=True, context={'request': request})
         return self.get_paginated_response(serializer.data)
@@ -1,3 +1,40 @@
-def invalidate_following_cache(sender, instance, **kwargs):
+def add_friendship_to_cache(sender, instance, created, **kwargs):
+    if not created:
+        return
+
     from friendships.services import FriendshipService
-    FriendshipService.invalidate_following_cache(instance.from_user_id)
+    from utils.transactions import run_on_commit
+    run_on_commit(lambda: FriendshipService.add_friendship_to_cache(
+        instance.from_user_id,
+        instance.to_user_id,
+    ))
+
+
+def remove_friendship_from_cache(sender, instance, **kwargs):
+    from friendships.services import FriendshipService
+    from utils.transactions import run_on_commit
+    run_on_commit(lambda: FriendshipService.remove_friendship_from_cache(
+        instance.from_user_id,
+        instance.to_user_id,
+    ))
+
+
+def incr_friendship_counts(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    from accounts.services import UserService
+    UserService.incr_profile_count(instance.from_user_id, 'followings_count')
+    UserService.incr_profile_count(instance.to_user_id, 'followers_count')
+
+
+def decr_friendship_counts(sender, instance, **kwargs):
+    from accounts.services import UserService
+    # The user ids are None once the users have been deleted
+    if instance.from_user_id is not None:
+        UserService.decr_profile_count(
+            instance.from_user_id,
+            'followings_count',
+        )
+    if instance.to_user_id is not None:
+        UserService.decr_profile_count(instance.to_user_id, 'followers_count')
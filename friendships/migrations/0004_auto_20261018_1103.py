@@ -0,0 +1,19 @@
+# Generated by Django 3.1.13 on 2026-10-18 11:03
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('friendships', '0003_auto_20230301_1952'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='friendship',
+            index_together={('to_user_id', 'created_at', 'id'), ('from_user_id', 'created_at', 'id')},
+        ),
+    ]
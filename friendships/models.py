@@ -1,9 +1,14 @@
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 from accounts.services import UserService
-from friendships.listeners import invalidate_following_cache
+from friendships.listeners import (
+    add_friendship_to_cache,
+    decr_friendship_counts,
+    incr_friendship_counts,
+    remove_friendship_from_cache,
+)
 from utils.memcached_helper import MemchachedHelper
 
 
@@ -25,9 +30,9 @@ class Friendship(models.Model):
     class Meta:
         index_together = (
             # Get all people I followed and order by created_at
-            ('from_user_id', 'created_at'),
+            ('from_user_id', 'created_at', 'id'),
             # Get all people followed me and order by created_at
-            ('to_user_id', 'created_at'),
+            ('to_user_id', 'created_at', 'id'),
         )
         unique_together = (('from_user_id', 'to_user_id'), )
 
@@ -36,13 +41,20 @@ class Friendship(models.Model):
 
     @property
     def cached_from_user(self):
+        # Set by UserService.prefetch_users_through_cache
+        if hasattr(self, '_cached_from_user'):
+            return self._cached_from_user
         return MemchachedHelper.get_object_through_cache(User, self.from_user_id)
 
     @property
     def cached_to_user(self):
+        if hasattr(self, '_cached_to_user'):
+            return self._cached_to_user
         return MemchachedHelper.get_object_through_cache(User, self.to_user_id)
 
 
-# Hook up with listeners to invalidate cache
-pre_delete.connect(invalidate_following_cache, sender=Friendship)
-post_save.connect(invalidate_following_cache, sender=Friendship)
+# Hook up with listeners to apply the follow/unfollow to the cached sets
+post_save.connect(add_friendship_to_cache, sender=Friendship)
+post_delete.connect(remove_friendship_from_cache, sender=Friendship)
+post_save.connect(incr_friendship_counts, sender=Friendship)
+pre_delete.connect(decr_friendship_counts, sender=Friendship)
@@ -1,50 +1,105 @@
-from django.conf import settings
-from django.core.cache import caches
-
+from accounts.services import UserService
 from friendships.models import Friendship
 from twitter.cache import FOLLOWINGS_PATTERN
-
-cache = caches['testing'] if settings.TESTING else caches['default']
+from utils.paginations import filter_by_cursor
+from utils.redis_client import RedisClient
+from utils.redis_helper import RedisHelper
 
 
 class FriendshipService(object):
 
     @classmethod
-    def get_followers(cls, user):
-        # get all friendships where to_user=user
-        # select * from friendships where to_user_id = user.id
-        # This way is not prefered because it will query the database N times
-        # friendships = Friendship.objects.filter(to_user=user)
-        # return [friendship.from_user for friendship in friendships]
+    def get_follower_count(cls, to_user_id):
+        return UserService.get_profile_count(to_user_id, 'followers_count')
+
+    @classmethod
+    def get_following_count(cls, from_user_id):
+        return UserService.get_profile_count(from_user_id, 'followings_count')
 
-        # This way is also not perfered because selct_related will result
-        # in table join operation, it joins the table friendships and users
-        # by from_user. Which is really slow.
-        # friendships = Friendship.objects.filter(
-        #     to_user=user,
-        # ).select_related('from_user')
-        # return [Friendship.from_user for Friendship in friendships]
+    @classmethod
+    def iter_follower_ids(cls, to_user_id, batch_size=1000):
+        """
+        Stream the follower ids of a user, reading batch_size rows at a time
+        off the (to_user_id, created_at) index with keyset pagination. Only
+        one batch of ids is held in memory, however many followers there are.
+        """
+        queryset = Friendship.objects.filter(
+            to_user_id=to_user_id,
+        ).order_by('created_at', 'id')
+        last_row = None
+        while True:
+            batch_queryset = queryset
+            if last_row is not None:
+                batch_queryset = filter_by_cursor(
+                    batch_queryset,
+                    last_row[:2],
+                    reverse=False,
+                )
+            rows = list(batch_queryset.values_list(
+                'created_at',
+                'id',
+                'from_user_id',
+            )[:batch_size])
+            for _, _, from_user_id in rows:
+                yield from_user_id
+            if len(rows) < batch_size:
+                return
+            last_row = rows[-1]
 
-        # This way is prefered because it will query the database only once
-        friendships = Friendship.objects.filter(
-            to_user=user,
-        ).prefetch_related('from_user')
-        return [friendship.from_user for friendship in friendships]
+    @classmethod
+    def _load_following_user_ids(cls, from_user_id):
+        return Friendship.objects.filter(
+            from_user_id=from_user_id,
+        ).values_list('to_user_id', flat=True)
 
     @classmethod
     def get_following_user_id_set(cls, from_user_id):
         key = FOLLOWINGS_PATTERN.format(user_id=from_user_id)
-        user_id_set = cache.get(key)
-        if user_id_set is not None:
-            return user_id_set
+        return RedisHelper.load_set(
+            key,
+            lambda: cls._load_following_user_ids(from_user_id),
+        )
 
-        friendships = Friendship.objects.filter(from_user_id=from_user_id)
-        user_id_set = set(
-            {friendship.to_user_id for friendship in friendships})
-        cache.set(key, user_id_set)
-        return user_id_set
+    @classmethod
+    def get_followed_user_ids(cls, from_user_id, user_ids):
+        """
+        Return which of user_ids the user follows. It takes one SMISMEMBER,
+        so the cost depends on len(user_ids) instead of how many users the
+        user follows.
+        """
+        user_ids = list(user_ids)
+        key = FOLLOWINGS_PATTERN.format(user_id=from_user_id)
+        is_members = RedisHelper.check_set_members(
+            key,
+            user_ids,
+            lambda: cls._load_following_user_ids(from_user_id),
+        )
+        return {
+            user_id
+            for user_id, is_member in zip(user_ids, is_members)
+            if is_member
+        }
+
+    @classmethod
+    def add_friendship_to_cache(cls, from_user_id, to_user_id):
+        # Only the following graph is cached as a Redis set. The follower
+        # graph is read by fanout alone, which streams it from the database
+        # with iter_follower_ids, so a cached follower set would have no
+        # reader.
+        RedisHelper.add_to_set(
+            FOLLOWINGS_PATTERN.format(user_id=from_user_id),
+            to_user_id,
+        )
+
+    @classmethod
+    def remove_friendship_from_cache(cls, from_user_id, to_user_id):
+        RedisHelper.remove_from_set(
+            FOLLOWINGS_PATTERN.format(user_id=from_user_id),
+            to_user_id,
+        )
 
     @classmethod
     def invalidate_following_cache(cls, from_user_id):
         key = FOLLOWINGS_PATTERN.format(user_id=from_user_id)
-        cache.delete(key)
+        conn = RedisClient.get_connection()
+        conn.delete(key)
@@ -1,6 +1,8 @@
+from accounts.models import UserProfile
 from friendships.models import Friendship
 from friendships.services import FriendshipService
 from testing.testcases import TestCase
+from utils.redis_client import RedisClient
 
 
 class FriendshipServiceTests(TestCase):
@@ -10,18 +12,88 @@ class FriendshipServiceTests(TestCase):
         self.user1 = self.create_user('user1')
         self.user2 = self.create_user('user2')
 
-    def test_get_followers(self):
+    def test_following_cache_deltas(self):
         user3 = self.create_user('user3')
-        user4 = self.create_user('user4')
-        for to_user in [self.user2, user3, user4]:
-            Friendship.objects.create(from_user=self.user1, to_user=to_user)
-
-        user_id_set = FriendshipService.get_following_user_id_set(
-            self.user1.id)
-        self.assertEqual(user_id_set, {self.user2.id, user3.id, user4.id})
-
-        Friendship.objects.filter(
-            from_user=self.user1, to_user=self.user2).delete()
-        user_id_set = FriendshipService.get_following_user_id_set(
-            self.user1.id)
-        self.assertEqual(user_id_set, {user3.id, user4.id})
+        Friendship.objects.create(from_user=self.user1, to_user=self.user2)
+        self.assertEqual(
+            FriendshipService.get_following_user_id_set(self.user1.id),
+            {self.user2.id},
+        )
+
+        # follow and unfollow are applied to the cached set, no reload
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.objects.create(from_user=self.user1, to_user=user3)
+        with self.assertNumQueries(0):
+            user_id_set = FriendshipService.get_following_user_id_set(
+                self.user1.id)
+        self.assertEqual(user_id_set, {self.user2.id, user3.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.objects.filter(from_user=self.user1).delete()
+        with self.assertNumQueries(0):
+            user_id_set = FriendshipService.get_following_user_id_set(
+                self.user1.id)
+        self.assertEqual(user_id_set, set())
+
+    def test_get_followed_user_ids(self):
+        user3 = self.create_user('user3')
+        self.assertEqual(
+            FriendshipService.get_followed_user_ids(
+                self.user1.id,
+                [self.user2.id, user3.id],
+            ),
+            set(),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.objects.create(from_user=self.user1, to_user=user3)
+        self.assertEqual(
+            FriendshipService.get_followed_user_ids(
+                self.user1.id,
+                [self.user2.id, user3.id],
+            ),
+            {user3.id},
+        )
+
+    def test_iter_follower_ids(self):
+        followers = [self.create_user('follower{}'.format(i)) for i in range(5)]
+        for follower in followers:
+            Friendship.objects.create(from_user=follower, to_user=self.user1)
+
+        # batch size dividing the count exactly or not
+        for batch_size in [1, 2, 5, 10]:
+            follower_ids = FriendshipService.iter_follower_ids(
+                self.user1.id,
+                batch_size,
+            )
+            self.assertEqual(
+                list(follower_ids),
+                [follower.id for follower in followers],
+            )
+        self.assertEqual(
+            list(FriendshipService.iter_follower_ids(self.user2.id)),
+            [],
+        )
+
+    def test_friendship_counts(self):
+        user3 = self.create_user('user3')
+        Friendship.objects.create(from_user=self.user1, to_user=self.user2)
+        Friendship.objects.create(from_user=user3, to_user=self.user2)
+        get_follower_count = FriendshipService.get_follower_count
+        get_following_count = FriendshipService.get_following_count
+        self.assertEqual(get_follower_count(self.user2.id), 2)
+        self.assertEqual(get_following_count(self.user1.id), 1)
+        self.assertEqual(get_follower_count(self.user1.id), 0)
+
+        Friendship.objects.filter(from_user=self.user1).delete()
+        self.assertEqual(get_follower_count(self.user2.id), 1)
+        self.assertEqual(get_following_count(self.user1.id), 0)
+
+        # The denormalized columns back fill redis
+        profile = UserProfile.objects.get(user=self.user2)
+        self.assertEqual(profile.followers_count, 1)
+        RedisClient.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                FriendshipService.get_follower_count(self.user2.id),
+                1,
+            )
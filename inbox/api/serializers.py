@@ -1,8 +1,19 @@
 from notifications.models import Notification
 from rest_framework import serializers
 
+from accounts.api.serializers import UserSerializerWithProfile
+from comments.api.serializers import CommentSerializerForNotification
+from comments.models import Comment
+from inbox.services import NotificationService
+from tweets.api.serializers import TweetSerializerForNotification
+from tweets.models import Tweet
+from utils.serializers import PrefetchListSerializer
+
 
 class NotificationSerializer(serializers.ModelSerializer):
+    # Number of users behind a coalesced notification, e.g. the actor and
+    # actors_count - 1 others liked your tweet
+    actors_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Notification
@@ -17,8 +28,47 @@ class NotificationSerializer(serializers.ModelSerializer):
             'target_object_id',
             'timestamp',
             'unread',
+            'actors_count',
         )
 
+    def get_actors_count(self, obj):
+        return (obj.data or {}).get('actors_count', 1)
+
+
+class NotificationSerializerWithObjects(NotificationSerializer):
+    # Saves the clients from fetching the actor and the target of every
+    # notification one by one
+    actor = serializers.SerializerMethodField()
+    target = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notification
+        list_serializer_class = PrefetchListSerializer
+        fields = NotificationSerializer.Meta.fields + ('actor', 'target')
+
+    def prefetch(self, notifications):
+        NotificationService.prefetch_actors_and_targets(notifications)
+
+    def _get_cached(self, obj, attr):
+        # Set by prefetch
+        if not hasattr(obj, attr):
+            self.prefetch([obj])
+        return getattr(obj, attr)
+
+    def get_actor(self, obj):
+        actor = self._get_cached(obj, '_cached_actor')
+        if actor is None:
+            return None
+        return UserSerializerWithProfile(actor, context=self.context).data
+
+    def get_target(self, obj):
+        target = self._get_cached(obj, '_cached_target')
+        if isinstance(target, Tweet):
+            return TweetSerializerForNotification(target).data
+        if isinstance(target, Comment):
+            return CommentSerializerForNotification(target).data
+        return None
+
 
 class NotificationSerializerForUpdate(serializers.ModelSerializer):
     unread = serializers.BooleanField(required=False)
@@ -28,6 +78,11 @@ class NotificationSerializerForUpdate(serializers.ModelSerializer):
         fields = ('unread',)
 
     def update(self, instance, validated_data):
+        was_unread = instance.unread
         instance.unread = validated_data['unread']
         instance.save()
+        if instance.unread and not was_unread:
+            NotificationService.incr_unread_count(instance.recipient_id)
+        if was_unread and not instance.unread:
+            NotificationService.decr_unread_count(instance.recipient_id)
         return instance
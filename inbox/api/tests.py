@@ -1,7 +1,11 @@
+from django.contrib.contenttypes.models import ContentType
 from notifications.models import Notification
 from rest_framework.test import APIClient
 
 from testing.testcases import TestCase
+from tweets.models import Tweet
+from utils.paginations import NotificationPagination
+from utils.time_helpers import utc_now
 
 COMMENT_URL = '/api/comments/'
 LIKE_URL = '/api/likes/'
@@ -70,6 +74,11 @@ class NotificationsAPITests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['unread_count'], 1)
 
+        # Polling is served from the redis counter
+        with self.assertNumQueries(0):
+            response = self.user1_client.get(url)
+        self.assertEqual(response.data['unread_count'], 1)
+
         comment = self.create_comment(self.user1, self.tweet, '1')
         self.user2_client.post(LIKE_URL, {
             'content_type': 'comment',
@@ -83,11 +92,11 @@ class NotificationsAPITests(TestCase):
         notification.unread = False
         notification.save()
         response = self.user1_client.get(NOTIFICATIONS_URL)
-        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(len(response.data['results']), 2)
         response = self.user1_client.get(NOTIFICATIONS_URL, {'unread': True})
-        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(len(response.data['results']), 1)
         response = self.user1_client.get(NOTIFICATIONS_URL, {'unread': False})
-        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_mark_all_as_read(self):
         self.user2_client.post(LIKE_URL, {
@@ -171,3 +180,79 @@ class NotificationsAPITests(TestCase):
         self.assertEqual(response.status_code, 200)
         notification.refresh_from_db()
         self.assertNotEqual(response.data['verb'], 'new verb')
+
+    def _create_notifications(self, count):
+        # All at the same timestamp, the id has to break the ties
+        timestamp = utc_now()
+        Notification.objects.bulk_create([
+            Notification(
+                recipient=self.user1,
+                actor_content_type=ContentType.objects.get_for_model(
+                    self.user2,
+                ),
+                actor_object_id=self.user2.id,
+                verb='liked your tweet',
+                target_content_type=ContentType.objects.get_for_model(Tweet),
+                target_object_id=self.tweet.id,
+                timestamp=timestamp,
+            )
+            for _ in range(count)
+        ])
+        return list(Notification.objects.order_by('-id'))
+
+    def test_list_pagination(self):
+        page_size = NotificationPagination.page_size
+        notifications = self._create_notifications(page_size + 2)
+
+        response = self.anonymous_client.get(NOTIFICATIONS_URL)
+        self.assertEqual(response.status_code, 403)
+
+        response = self.user1_client.get(NOTIFICATIONS_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [notification.id for notification in notifications[:page_size]],
+        )
+
+        response = self.user1_client.get(NOTIFICATIONS_URL, {
+            'cursor': response.data['next_cursor'],
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual(response.data['next_cursor'], None)
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [notification.id for notification in notifications[page_size:]],
+        )
+
+        # Others' notifications are never listed
+        response = self.user2_client.get(NOTIFICATIONS_URL)
+        self.assertEqual(response.data['results'], [])
+
+    def test_list_hydrated(self):
+        self._create_notifications(3)
+        comment = self.create_comment(self.user1, self.tweet, '1')
+        self.user2_client.post(LIKE_URL, {
+            'content_type': 'comment',
+            'object_id': comment.id,
+        })
+
+        response = self.user1_client.get(NOTIFICATIONS_URL)
+        self.assertNotIn('actor', response.data['results'][0])
+
+        # Warm up the caches, after that actors and targets are all cache
+        # hits and the page only takes the notifications query
+        self.user1_client.get(NOTIFICATIONS_URL, {'hydrate': 'true'})
+        with self.assertNumQueries(1):
+            response = self.user1_client.get(
+                NOTIFICATIONS_URL,
+                {'hydrate': 'true'},
+            )
+        results = response.data['results']
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0]['actor']['id'], self.user2.id)
+        self.assertEqual(results[0]['actor']['username'], 'user2')
+        self.assertEqual(results[0]['target']['id'], comment.id)
+        self.assertEqual(results[0]['target']['tweet_id'], self.tweet.id)
+        self.assertEqual(results[1]['target']['id'], self.tweet.id)
+        self.assertEqual(results[1]['target']['content'], self.tweet.content)
@@ -7,8 +7,11 @@ from rest_framework.response import Response
 from inbox.api.serializers import (
     NotificationSerializer,
     NotificationSerializerForUpdate,
+    NotificationSerializerWithObjects,
 )
+from inbox.services import NotificationService
 from utils.decorators import required_params
+from utils.paginations import NotificationPagination
 
 
 class NotificationViewSet(
@@ -18,20 +21,39 @@ class NotificationViewSet(
     serializer_class = NotificationSerializer
     permission_classes = (IsAuthenticated, )
     filterset_fields = ('unread',)
+    pagination_class = NotificationPagination
 
     def get_queryset(self):
         return Notification.objects.filter(recipient=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        # GET /api/notifications/?cursor=xxx&hydrate=true
+        # Paged by (timestamp, id) off the (recipient, timestamp, id) index,
+        # hydrate also returns the actor and the target of each notification
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer_class = NotificationSerializer
+        if request.query_params.get('hydrate', '').lower() in ('1', 'true'):
+            serializer_class = NotificationSerializerWithObjects
+        serializer = serializer_class(
+            page,
+            context={'request': request},
+            many=True,
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(methods=['GET'], detail=False, url_path='unread-count')
     def unread_count(self, request, *args, **kwargs):
         # GET /api/notifications/unread-count
-        count = self.get_queryset().filter(unread=True).count()
+        # Served from the redis counter, clients poll this every few seconds
+        count = NotificationService.get_unread_count(request.user.id)
         return Response({'unread_count': count}, status=status.HTTP_200_OK)
 
     @action(methods=['POST'], detail=False, url_path='mark-all-as-read')
     def mark_all_as_read(self, request, *args, **kwargs):
         # POST /api/notifications/mark-all-as-read
         marked_count = self.get_queryset().filter(unread=True).update(unread=False)
+        NotificationService.reset_unread_count(request.user.id)
         return Response({'marked_count': marked_count},
                         status=status.HTTP_200_OK)
 
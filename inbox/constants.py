@@ -0,0 +1,10 @@
+from django.conf import settings
+
+# Notification events are buffered for this many seconds before delivery, so
+# a burst of likes on the same tweet becomes a single notification
+NOTIFICATION_COALESCE_WINDOW = 10
+# Number of buffered events delivered per batch
+NOTIFICATION_DELIVERY_BATCH_SIZE = 1000 if not settings.TESTING else 2
+# Number of distinct actors remembered per notification, so an actor coming
+# back in a later batch is not counted twice
+NOTIFICATION_ACTOR_IDS_LIMIT = 100
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from inbox.services import NotificationService
+
+
+class Command(BaseCommand):
+    help = 'Resync the cached unread notification counters from db.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of counters checked per batch.',
+        )
+
+    def handle(self, *args, **options):
+        repaired = NotificationService.reconcile_unread_counts(
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(f'{repaired} unread counts repaired.')
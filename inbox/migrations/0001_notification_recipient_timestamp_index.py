@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+# Notification belongs to django-notifications-hq, the index which serves the
+# keyset pagination of the inbox is added from here
+INDEX = models.Index(
+    fields=['recipient', 'timestamp', 'id'],
+    name='notif_recipient_ts_id_idx',
+)
+
+
+def add_index(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    schema_editor.add_index(Notification, INDEX)
+
+
+def remove_index(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    schema_editor.remove_index(Notification, INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0008_index_together_recipient_unread'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_index, remove_index),
+    ]
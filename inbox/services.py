@@ -1,40 +1,357 @@
+import json
+from collections import defaultdict
+
+from dateutil import parser
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
-from notifications.signals import notify
+from django.db import transaction
+from django.db.models import Count
+from notifications.models import Notification
 
+from accounts.services import UserService
 from comments.models import Comment
+from inbox.constants import (
+    NOTIFICATION_ACTOR_IDS_LIMIT,
+    NOTIFICATION_COALESCE_WINDOW,
+    NOTIFICATION_DELIVERY_BATCH_SIZE,
+)
+from inbox.tasks import deliver_notifications_task
+from likes.content_types import LikeContentTypes
 from tweets.models import Tweet
+from twitter.cache import (
+    DELIVERING_NOTIFICATION_EVENTS_KEY,
+    NOTIFICATION_DELIVERY_LOCK_KEY,
+    NOTIFICATION_DELIVERY_SCHEDULED_KEY,
+    NOTIFICATION_EVENTS_KEY,
+    USER_UNREAD_NOTIFICATIONS_PATTERN,
+)
+from utils.memcached_helper import MemchachedHelper
+from utils.redis_client import RedisClient
+from utils.time_constants import ONE_HOUR
+from utils.time_helpers import utc_now
 
 
 class NotificationService(object):
 
     @classmethod
     def send_like_notification(cls, like):
-        target = like.content_object
-        if like.user == target.user:
+        # Only the ids are queued, the liked object and its owner are read
+        # when the events are delivered, off the request path
+        model_class = LikeContentTypes.get_model_class(like.content_type_id)
+        if model_class == Tweet:
+            verb = 'liked your tweet'
+        elif model_class == Comment:
+            verb = 'liked your comment'
+        else:
             return
-        if like.content_type == ContentType.objects.get_for_model(Tweet):
-            notify.send(
-                like.user,
-                recipient=target.user,
-                verb='liked your tweet',
-                target=target,
+        cls._queue_event(like.user_id, verb, model_class, like.object_id)
+
+    @classmethod
+    def send_comment_notification(cls, comment):
+        cls._queue_event(comment.user_id, 'commented on your tweet', Tweet,
+                         comment.tweet_id)
+
+    @classmethod
+    def _queue_event(cls, actor_id, verb, target_model, target_id):
+        conn = RedisClient.get_connection()
+        conn.rpush(NOTIFICATION_EVENTS_KEY, json.dumps({
+            'actor_id': actor_id,
+            'verb': verb,
+            'target_content_type_id': LikeContentTypes.get_id(target_model),
+            'target_id': target_id,
+            'timestamp': utc_now().isoformat(),
+        }))
+        # One delivery per window picks up all the events queued meanwhile
+        if conn.set(
+            NOTIFICATION_DELIVERY_SCHEDULED_KEY,
+            1,
+            nx=True,
+            ex=NOTIFICATION_COALESCE_WINDOW,
+        ):
+            deliver_notifications_task.apply_async(
+                countdown=NOTIFICATION_COALESCE_WINDOW,
             )
-        if like.content_type == ContentType.objects.get_for_model(Comment):
-            notify.send(
-                like.user,
-                recipient=target.user,
-                verb='liked your comment',
-                target=target,
+
+    @classmethod
+    def deliver_notifications(
+        cls,
+        batch_size=NOTIFICATION_DELIVERY_BATCH_SIZE,
+    ):
+        """
+        Drain the buffered notification events batch by batch. Each batch
+        is moved to a delivering list and only dropped once its
+        notifications are committed, a batch left by a failed delivery is
+        delivered again by the next one. Returns the number of
+        notifications created.
+        """
+        conn = RedisClient.get_connection()
+        # Events queued from now on schedule the next delivery
+        conn.delete(NOTIFICATION_DELIVERY_SCHEDULED_KEY)
+        # Deliveries must not overlap, they share the delivering list
+        if not conn.set(
+            NOTIFICATION_DELIVERY_LOCK_KEY,
+            1,
+            nx=True,
+            ex=ONE_HOUR,
+        ):
+            return 0
+        try:
+            created_count = 0
+            while True:
+                events = conn.lrange(DELIVERING_NOTIFICATION_EVENTS_KEY, 0, -1)
+                if not events:
+                    events = cls._move_events_to_delivering(batch_size)
+                if not events:
+                    return created_count
+                with transaction.atomic():
+                    created_count += cls._deliver_events(
+                        [json.loads(event) for event in events],
+                    )
+                conn.delete(DELIVERING_NOTIFICATION_EVENTS_KEY)
+        finally:
+            conn.delete(NOTIFICATION_DELIVERY_LOCK_KEY)
+
+    @classmethod
+    def _move_events_to_delivering(cls, batch_size):
+        # Every LMOVE takes one event atomically, events queued meanwhile
+        # are appended behind them
+        pipeline = RedisClient.get_connection().pipeline()
+        for _ in range(batch_size):
+            pipeline.lmove(
+                NOTIFICATION_EVENTS_KEY,
+                DELIVERING_NOTIFICATION_EVENTS_KEY,
+                'LEFT',
+                'RIGHT',
             )
+        return [event for event in pipeline.execute() if event is not None]
 
     @classmethod
-    def send_comment_notification(cls, comment):
-        if comment.user == comment.tweet.user:
-            return
+    def _get_target_owner_ids(cls, events):
+        # One query per target model instead of resolving every target
+        # through the generic foreign key
+        target_ids = defaultdict(set)
+        for event in events:
+            target_ids[event['target_content_type_id']].add(event['target_id'])
+        owner_ids = {}
+        for content_type_id, object_ids in target_ids.items():
+            model_class = LikeContentTypes.get_model_class(content_type_id)
+            rows = model_class.objects.filter(
+                id__in=object_ids,
+            ).values_list('id', 'user_id')
+            for object_id, user_id in rows:
+                owner_ids[(content_type_id, object_id)] = user_id
+        return owner_ids
+
+    @classmethod
+    def _deliver_events(cls, events):
+        owner_ids = cls._get_target_owner_ids(events)
+        # Coalesce the events per (recipient, target, verb)
+        grouped_events = defaultdict(list)
+        for event in events:
+            target = (event['target_content_type_id'], event['target_id'])
+            recipient_id = owner_ids.get(target)
+            if recipient_id is None or recipient_id == event['actor_id']:
+                continue
+            grouped_events[(recipient_id, *target, event['verb'])].append(
+                event,
+            )
+        if not grouped_events:
+            return 0
+
+        # Bursts are folded into the unread notification of the same
+        # recipient, target and verb, if there is one
+        unread_notifications = {}
+        for notification in Notification.objects.filter(
+            recipient_id__in={key[0] for key in grouped_events},
+            target_object_id__in={str(key[2]) for key in grouped_events},
+            verb__in={key[3] for key in grouped_events},
+            unread=True,
+        ):
+            key = (
+                notification.recipient_id,
+                notification.target_content_type_id,
+                int(notification.target_object_id),
+                notification.verb,
+            )
+            unread_notifications[key] = notification
+
+        actor_content_type = ContentType.objects.get_for_model(User)
+        new_notifications = []
+        for key, key_events in grouped_events.items():
+            recipient_id, content_type_id, target_id, verb = key
+            actor_ids = list(dict.fromkeys(
+                event['actor_id'] for event in key_events
+            ))
+            latest_event = key_events[-1]
+            timestamp = parser.isoparse(latest_event['timestamp'])
+            notification = unread_notifications.get(key)
+            if notification is None:
+                new_notifications.append(Notification(
+                    recipient_id=recipient_id,
+                    actor_content_type=actor_content_type,
+                    actor_object_id=latest_event['actor_id'],
+                    verb=verb,
+                    target_content_type_id=content_type_id,
+                    target_object_id=target_id,
+                    timestamp=timestamp,
+                    data={
+                        'actors_count': len(actor_ids),
+                        'actor_ids': actor_ids[:NOTIFICATION_ACTOR_IDS_LIMIT],
+                    },
+                ))
+                continue
+            data = notification.data or {}
+            # Actors already counted by an earlier batch are skipped. Past
+            # the limit new actors are only counted, not remembered.
+            known_actor_ids = data.get('actor_ids', [])
+            new_actor_ids = [
+                actor_id
+                for actor_id in actor_ids
+                if actor_id not in known_actor_ids
+            ]
+            data['actors_count'] = \
+                data.get('actors_count', 1) + len(new_actor_ids)
+            data['actor_ids'] = (known_actor_ids + new_actor_ids)[
+                :NOTIFICATION_ACTOR_IDS_LIMIT
+            ]
+            notification.data = data
+            notification.actor_object_id = latest_event['actor_id']
+            notification.timestamp = timestamp
+            notification.save(update_fields=[
+                'data',
+                'actor_object_id',
+                'timestamp',
+            ])
+
+        Notification.objects.bulk_create(new_notifications)
+        for notification in new_notifications:
+            cls.incr_unread_count(notification.recipient_id)
+        return len(new_notifications)
 
-        notify.send(
-            comment.user,
-            recipient=comment.tweet.user,
-            verb='commented on your tweet',
-            target=comment.tweet,
-        )
+    @classmethod
+    def prefetch_actors_and_targets(cls, notifications):
+        """
+        Memoize the actor of every notification as _cached_actor and its
+        target as _cached_target. Actors and their profiles are read through
+        the user caches, targets through the object cache of their model, so
+        a page takes one batch per model whatever its size.
+        """
+        user_content_type = ContentType.objects.get_for_model(User)
+        actor_ids = {
+            int(notification.actor_object_id)
+            for notification in notifications
+            if notification.actor_content_type_id == user_content_type.id
+        }
+        actors = MemchachedHelper.get_objects_through_cache(User, actor_ids)
+        profiles = UserService.get_profiles_through_cache(actors)
+        for actor in actors.values():
+            actor._cached_user_profile = profiles[actor.id]
+
+        target_ids = defaultdict(set)
+        for notification in notifications:
+            if notification.target_object_id is not None:
+                target_ids[notification.target_content_type_id].add(
+                    int(notification.target_object_id),
+                )
+        targets = {}
+        for content_type_id, object_ids in target_ids.items():
+            model_class = LikeContentTypes.get_model_class(content_type_id)
+            if model_class not in (Tweet, Comment):
+                continue
+            objects = MemchachedHelper.get_objects_through_cache(
+                model_class,
+                object_ids,
+            )
+            for object_id, obj in objects.items():
+                targets[(content_type_id, object_id)] = obj
+
+        for notification in notifications:
+            notification._cached_actor = None
+            if notification.actor_content_type_id == user_content_type.id:
+                notification._cached_actor = actors.get(
+                    int(notification.actor_object_id),
+                )
+            notification._cached_target = None
+            if notification.target_object_id is not None:
+                notification._cached_target = targets.get((
+                    notification.target_content_type_id,
+                    int(notification.target_object_id),
+                ))
+
+    @classmethod
+    def _load_unread_count(cls, user_id):
+        return Notification.objects.filter(
+            recipient_id=user_id,
+            unread=True,
+        ).count()
+
+    @classmethod
+    def get_unread_count(cls, user_id):
+        conn = RedisClient.get_connection()
+        key = USER_UNREAD_NOTIFICATIONS_PATTERN.format(user_id=user_id)
+        count = conn.get(key)
+        if count is None:
+            count = cls._load_unread_count(user_id)
+            conn.set(key, count, ex=settings.REDIS_KEY_EXPIRE_TIME)
+        # Concurrent decrements can briefly overshoot, never show below 0
+        return max(int(count), 0)
+
+    @classmethod
+    def incr_unread_count(cls, user_id, amount=1):
+        # A missing counter is loaded from db on the next read, which already
+        # counts the change, so only a cached counter is updated
+        conn = RedisClient.get_connection()
+        key = USER_UNREAD_NOTIFICATIONS_PATTERN.format(user_id=user_id)
+        if conn.exists(key):
+            conn.incrby(key, amount)
+
+    @classmethod
+    def decr_unread_count(cls, user_id, amount=1):
+        cls.incr_unread_count(user_id, -amount)
+
+    @classmethod
+    def reset_unread_count(cls, user_id):
+        conn = RedisClient.get_connection()
+        key = USER_UNREAD_NOTIFICATIONS_PATTERN.format(user_id=user_id)
+        conn.set(key, 0, ex=settings.REDIS_KEY_EXPIRE_TIME)
+
+    @classmethod
+    def reconcile_unread_counts(cls, batch_size=1000):
+        """
+        Resync the cached unread counters from db, fixing the drift left by
+        races and by notifications changed outside NotificationService. Only
+        cached counters are checked, SCAN walks them batch_size at a time.
+        Returns the number of repaired counters.
+        """
+        conn = RedisClient.get_connection()
+        pattern = USER_UNREAD_NOTIFICATIONS_PATTERN.format(user_id='*')
+        prefix = pattern[:-1]
+        keys = []
+        repaired = 0
+        for key in conn.scan_iter(match=pattern, count=batch_size):
+            keys.append(key.decode())
+            if len(keys) == batch_size:
+                repaired += cls._reconcile_unread_counts(keys, prefix)
+                keys = []
+        if keys:
+            repaired += cls._reconcile_unread_counts(keys, prefix)
+        return repaired
+
+    @classmethod
+    def _reconcile_unread_counts(cls, keys, prefix):
+        conn = RedisClient.get_connection()
+        user_ids = [int(key[len(prefix):]) for key in keys]
+        counts = dict(Notification.objects.filter(
+            recipient_id__in=user_ids,
+            unread=True,
+        ).values_list('recipient_id').annotate(count=Count('id')))
+        repaired = 0
+        for key, user_id, cached_count in zip(keys, user_ids, conn.mget(keys)):
+            count = counts.get(user_id, 0)
+            # The key might have expired since it was scanned
+            if cached_count is None or int(cached_count) == count:
+                continue
+            conn.set(key, count, ex=settings.REDIS_KEY_EXPIRE_TIME)
+            repaired += 1
+        return repaired
@@ -0,0 +1,21 @@
+from celery import shared_task
+
+from utils.time_constants import ONE_HOUR
+
+
+@shared_task(time_limit=ONE_HOUR)
+def deliver_notifications_task():
+    # Import inside the task to avoid circular dependency
+    from inbox.services import NotificationService
+
+    created_count = NotificationService.deliver_notifications()
+    return '{} notifications created.'.format(created_count)
+
+
+@shared_task(time_limit=ONE_HOUR)
+def reconcile_unread_counts_task():
+    # Import inside the task to avoid circular dependency
+    from inbox.services import NotificationService
+
+    repaired = NotificationService.reconcile_unread_counts()
+    return '{} unread counts repaired.'.format(repaired)
@@ -1,7 +1,14 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
 from notifications.models import Notification
 
 from inbox.services import NotificationService
+from inbox.tasks import reconcile_unread_counts_task
 from testing.testcases import TestCase
+from twitter.cache import NOTIFICATION_DELIVERY_SCHEDULED_KEY
+from utils.redis_client import RedisClient
 
 
 class NotificationServiceTests(TestCase):
@@ -45,3 +52,100 @@ class NotificationServiceTests(TestCase):
         like = self.create_like(self.user2, comment)
         NotificationService.send_like_notification(like)
         self.assertEqual(Notification.objects.count(), 2)
+
+    def test_unread_count(self):
+        self.assertEqual(NotificationService.get_unread_count(self.user1.id), 0)
+        comment = self.create_comment(self.user2, self.tweet)
+        NotificationService.send_comment_notification(comment)
+        like = self.create_like(self.user2, self.tweet)
+        NotificationService.send_like_notification(like)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                NotificationService.get_unread_count(self.user1.id),
+                2,
+            )
+
+        NotificationService.decr_unread_count(self.user1.id)
+        self.assertEqual(NotificationService.get_unread_count(self.user1.id), 1)
+        NotificationService.reset_unread_count(self.user1.id)
+        self.assertEqual(NotificationService.get_unread_count(self.user1.id), 0)
+
+    def test_reconcile_unread_counts(self):
+        comment = self.create_comment(self.user2, self.tweet)
+        NotificationService.send_comment_notification(comment)
+        NotificationService.get_unread_count(self.user1.id)
+        NotificationService.get_unread_count(self.user2.id)
+        # Changes made outside NotificationService are not counted
+        Notification.objects.update(unread=False)
+        self.assertEqual(NotificationService.get_unread_count(self.user1.id), 1)
+
+        out = StringIO()
+        call_command('reconcile_unread_counts', stdout=out)
+        self.assertEqual(out.getvalue(), '1 unread counts repaired.\n')
+        self.assertEqual(NotificationService.get_unread_count(self.user1.id), 0)
+        self.assertEqual(
+            reconcile_unread_counts_task(),
+            '0 unread counts repaired.',
+        )
+
+    def test_coalesce_notifications(self):
+        # Hold the delivery back as if it was scheduled for later
+        conn = RedisClient.get_connection()
+        conn.set(NOTIFICATION_DELIVERY_SCHEDULED_KEY, 1)
+        NotificationService.get_unread_count(self.user1.id)
+        likers = [self.create_user(f'liker{i}') for i in range(3)]
+        for liker in likers:
+            like = self.create_like(liker, self.tweet)
+            NotificationService.send_like_notification(like)
+        comment = self.create_comment(self.user2, self.tweet)
+        NotificationService.send_comment_notification(comment)
+        self.assertEqual(Notification.objects.count(), 0)
+
+        self.assertEqual(NotificationService.deliver_notifications(), 2)
+        like_notification = Notification.objects.get(verb='liked your tweet')
+        self.assertEqual(like_notification.data['actors_count'], 3)
+        self.assertEqual(like_notification.actor_object_id, str(likers[-1].id))
+        self.assertEqual(NotificationService.get_unread_count(self.user1.id), 2)
+
+        # Later events are folded into the unread notification
+        like = self.create_like(self.user2, self.tweet)
+        NotificationService.send_like_notification(like)
+        like_notification.refresh_from_db()
+        self.assertEqual(like_notification.data['actors_count'], 4)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(NotificationService.get_unread_count(self.user1.id), 2)
+
+        # An actor who is counted already is not counted again
+        comment = self.create_comment(self.user2, self.tweet)
+        NotificationService.send_comment_notification(comment)
+        comment_notification = Notification.objects.get(
+            verb='commented on your tweet',
+        )
+        self.assertEqual(comment_notification.data['actors_count'], 1)
+
+        # Once read, a new notification is created
+        like_notification.unread = False
+        like_notification.save()
+        like = self.create_like(self.create_user('user3'), self.tweet)
+        NotificationService.send_like_notification(like)
+        self.assertEqual(Notification.objects.count(), 3)
+
+    def test_failed_delivery_is_retried(self):
+        conn = RedisClient.get_connection()
+        conn.set(NOTIFICATION_DELIVERY_SCHEDULED_KEY, 1)
+        comment = self.create_comment(self.user2, self.tweet)
+        NotificationService.send_comment_notification(comment)
+
+        with mock.patch.object(
+            NotificationService,
+            '_deliver_events',
+            side_effect=RuntimeError,
+        ):
+            with self.assertRaises(RuntimeError):
+                NotificationService.deliver_notifications()
+        self.assertEqual(Notification.objects.count(), 0)
+
+        # The events taken by the failed delivery are not lost
+        self.assertEqual(NotificationService.deliver_notifications(), 1)
+        self.assertEqual(NotificationService.deliver_notifications(), 0)
+        self.assertEqual(Notification.objects.count(), 1)
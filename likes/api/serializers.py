@@ -1,11 +1,17 @@
-from django.contrib.contenttypes.models import ContentType
+from django.conf import settings
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from accounts.api.serializers import UserSerializerForLike
+from accounts.services import UserService
 from comments.models import Comment
+from likes.content_types import LikeContentTypes
 from likes.models import Like
+from likes.service import LikeService
 from tweets.models import Tweet
+from utils.memcached_helper import MemchachedHelper
+from utils.serializers import PrefetchListSerializer
+from utils.time_helpers import utc_now
 
 
 class LikeSerializer(serializers.ModelSerializer):
@@ -13,8 +19,12 @@ class LikeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Like
+        list_serializer_class = PrefetchListSerializer
         fields = ('user', 'created_at')
 
+    def prefetch(self, likes):
+        UserService.prefetch_users_through_cache(likes)
+
 
 class BaseLikeSerializerForCreateAndCancel(serializers.ModelSerializer):
     content_type = serializers.ChoiceField(choices=['comment', 'tweet'])
@@ -36,9 +46,14 @@ class BaseLikeSerializerForCreateAndCancel(serializers.ModelSerializer):
         if model_class is None:
             raise ValidationError(
                 {'content_type': 'content type does not exist'})
-        liked_object = model_class.objects.filter(
-            id=data['object_id']).first()
-        if liked_object is None:
+        # Read through the object cache, a like spike on a tweet does not
+        # query db for the tweet every time
+        try:
+            MemchachedHelper.get_object_through_cache(
+                model_class,
+                data['object_id'],
+            )
+        except model_class.DoesNotExist:
             raise ValidationError({'object_id': 'object does not exist'})
         return data
 
@@ -48,10 +63,25 @@ class LikeSerializerForCreate(BaseLikeSerializerForCreateAndCancel):
     def get_or_create(self):
         validated_data = self.validated_data
         model_class = self._get_model_class(validated_data)
+        user = self.context['request'].user
+        if settings.LIKE_WRITE_BEHIND:
+            created = LikeService.buffer_like(
+                user.id,
+                model_class,
+                validated_data['object_id'],
+            )
+            if created is not None:
+                # Not saved yet, it is written to db by the next flush
+                return Like(
+                    user=user,
+                    content_type_id=LikeContentTypes.get_id(model_class),
+                    object_id=validated_data['object_id'],
+                    created_at=utc_now().date(),
+                ), created
         return Like.objects.get_or_create(
-            content_type=ContentType.objects.get_for_model(model_class),
+            content_type_id=LikeContentTypes.get_id(model_class),
             object_id=validated_data['object_id'],
-            user=self.context['request'].user,
+            user=user,
         )
 
 
@@ -59,8 +89,16 @@ class LikeSerializerForCancel(BaseLikeSerializerForCreateAndCancel):
 
     def cancel(self):
         model_class = self._get_model_class(self.validated_data)
+        if settings.LIKE_WRITE_BEHIND:
+            deleted = LikeService.buffer_unlike(
+                self.context['request'].user.id,
+                model_class,
+                self.validated_data['object_id'],
+            )
+            if deleted is not None:
+                return int(deleted)
         instance, _ = Like.objects.filter(
-            content_type=ContentType.objects.get_for_model(model_class),
+            content_type_id=LikeContentTypes.get_id(model_class),
             object_id=self.validated_data['object_id'],
             user=self.context['request'].user,
         ).delete()
@@ -1,6 +1,11 @@
-from testing.testcases import TestCase
+from django.test import override_settings
 from rest_framework.test import APIClient
 
+from likes.service import LikeService
+from testing.testcases import TestCase
+from twitter.cache import LIKES_FLUSH_SCHEDULED_KEY
+from utils.redis_client import RedisClient
+
 
 LIKES_BASE_URL = '/api/likes/'
 LIKES_CANCEL_URL = '/api/likes/cancel/'
@@ -243,3 +248,54 @@ class LikeApiTests(TestCase):
                          [0]['user']['id'], self.user1.id)
         self.assertEqual(response.data['likes']
                          [1]['user']['id'], self.user2.id)
+
+    @override_settings(LIKE_WRITE_BEHIND=True)
+    def test_write_behind_likes(self):
+        tweet = self.create_tweet(self.user1)
+        data = {'content_type': 'tweet', 'object_id': tweet.id}
+        url = TWEET_DETAIL_API.format(tweet.id)
+        # Keep the likes in the buffer, the flush would run right away
+        RedisClient.get_connection().set(LIKES_FLUSH_SCHEDULED_KEY, 1)
+
+        response = self.user2_client.post(LIKES_BASE_URL, data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['user']['id'], self.user2.id)
+        self.user2_client.post(LIKES_BASE_URL, data)
+        self.user1_client.post(LIKES_BASE_URL, data)
+        self.assertEqual(tweet.like_set.count(), 0)
+        response = self.user2_client.get(url)
+        self.assertEqual(response.data['has_liked'], True)
+        self.assertEqual(response.data['likes_count'], 2)
+        # The buffered likes are listed before they are flushed
+        self.assertEqual(
+            [like['user']['id'] for like in response.data['likes']],
+            [self.user1.id, self.user2.id],
+        )
+
+        response = self.user1_client.post(LIKES_CANCEL_URL, data)
+        self.assertEqual(response.data['deleted'], 1)
+        response = self.user1_client.post(LIKES_CANCEL_URL, data)
+        self.assertEqual(response.data['deleted'], 0)
+        response = self.user1_client.get(url)
+        self.assertEqual(response.data['has_liked'], False)
+        self.assertEqual(response.data['likes_count'], 1)
+        self.assertEqual(
+            [like['user']['id'] for like in response.data['likes']],
+            [self.user2.id],
+        )
+
+        LikeService.flush_likes()
+        self.assertEqual(tweet.like_set.count(), 1)
+        response = self.user2_client.get(url)
+        self.assertEqual(response.data['likes_count'], 1)
+        self.assertEqual(
+            response.data['likes'][0]['user']['id'],
+            self.user2.id,
+        )
+
+        # A buffered unlike hides the like which is in db
+        RedisClient.get_connection().set(LIKES_FLUSH_SCHEDULED_KEY, 1)
+        self.user2_client.post(LIKES_CANCEL_URL, data)
+        response = self.user2_client.get(url)
+        self.assertEqual(response.data['likes_count'], 0)
+        self.assertEqual(response.data['likes'], [])
@@ -0,0 +1,6 @@
+from django.conf import settings
+
+# Buffered likes are written to db this many seconds after the first one
+LIKE_FLUSH_INTERVAL = 5
+# Number of buffered likes written to db per batch
+LIKE_FLUSH_BATCH_SIZE = 1000 if not settings.TESTING else 2
@@ -0,0 +1,43 @@
+from django.contrib.contenttypes.models import ContentType
+
+
+class LikeContentTypes:
+    """
+    Content type ids of the models which can be liked. They never change once
+    the contenttypes table is filled, so each of them is resolved only once
+    per process and read from a plain dict afterwards, without going through
+    ContentType.objects or the GenericForeignKey of Like. The db is not ready
+    at startup yet, so they are resolved on first use instead.
+    """
+
+    _ids = {}
+    _model_classes = {}
+
+    @classmethod
+    def _register(cls, model_class, content_type_id):
+        cls._ids[model_class] = content_type_id
+        cls._model_classes[content_type_id] = model_class
+
+    @classmethod
+    def get_id(cls, model_class):
+        content_type_id = cls._ids.get(model_class)
+        if content_type_id is None:
+            content_type_id = ContentType.objects.get_for_model(model_class).id
+            cls._register(model_class, content_type_id)
+        return content_type_id
+
+    @classmethod
+    def get_model_class(cls, content_type_id):
+        model_class = cls._model_classes.get(content_type_id)
+        if model_class is None:
+            model_class = ContentType.objects.get_for_id(
+                content_type_id,
+            ).model_class()
+            cls._register(model_class, content_type_id)
+        return model_class
+
+    @classmethod
+    def clear(cls):
+        # Content types can be recreated with new ids by a migrate or flush
+        cls._ids.clear()
+        cls._model_classes.clear()
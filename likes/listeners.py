@@ -0,0 +1,43 @@
+from django.db.models import F
+
+from likes.content_types import LikeContentTypes
+from utils.redis_helper import RedisHelper
+
+
+def incr_likes_count(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    # Tweet and Comment both have the likes_count field. Do not use
+    # obj.likes_count += 1; obj.save() since it is not atomic, update with F()
+    # is executed as a single sql UPDATE statement.
+    model_class = LikeContentTypes.get_model_class(instance.content_type_id)
+    model_class.objects.filter(id=instance.object_id).update(
+        likes_count=F('likes_count') + 1,
+    )
+    RedisHelper.incr_count(model_class, instance.object_id, 'likes_count')
+
+
+def decr_likes_count(sender, instance, **kwargs):
+    model_class = LikeContentTypes.get_model_class(instance.content_type_id)
+    model_class.objects.filter(id=instance.object_id).update(
+        likes_count=F('likes_count') - 1,
+    )
+    RedisHelper.decr_count(model_class, instance.object_id, 'likes_count')
+
+
+def add_to_liked_cache(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    from likes.service import LikeService
+    LikeService.add_to_liked_cache(instance)
+
+
+def remove_from_liked_cache(sender, instance, **kwargs):
+    from likes.service import LikeService
+    LikeService.remove_from_liked_cache(instance)
+
+
+def clear_content_types(sender, **kwargs):
+    LikeContentTypes.clear()
@@ -0,0 +1,77 @@
+import timeit
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+
+from likes.content_types import LikeContentTypes
+from likes.models import Like
+from likes.service import LikeService
+from tweets.models import Tweet
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the time the like hot paths spend on resolving content '
+        'types through ContentType against LikeContentTypes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=10000,
+            help='Number of calls timed per path.',
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        content_type_id = ContentType.objects.get_for_model(Tweet).id
+        tweet_ids = list(range(1, 21))
+        # Warm up both caches, only the steady state is compared
+        LikeContentTypes.get_id(Tweet)
+
+        def fk_model_class():
+            # What the listeners did with a like read from db, the
+            # content_type foreign key is not loaded yet
+            like = Like(content_type_id=content_type_id, object_id=1)
+            return like.content_type.model_class()
+
+        paths = [
+            (
+                'get id',
+                lambda: ContentType.objects.get_for_model(Tweet).id,
+                lambda: LikeContentTypes.get_id(Tweet),
+            ),
+            (
+                'get model',
+                lambda: ContentType.objects.get_for_id(
+                    content_type_id,
+                ).model_class(),
+                lambda: LikeContentTypes.get_model_class(content_type_id),
+            ),
+            (
+                'like model',
+                fk_model_class,
+                lambda: LikeContentTypes.get_model_class(
+                    Like(content_type_id=content_type_id).content_type_id,
+                ),
+            ),
+            (
+                'likes query',
+                lambda: str(Like.objects.filter(
+                    content_type=ContentType.objects.get_for_model(Tweet),
+                    object_id__in=tweet_ids,
+                ).query),
+                lambda: str(LikeService.likes_for_tweet_ids(tweet_ids).query),
+            ),
+        ]
+
+        self.stdout.write('{:<12} {:>12} {:>12}'.format(
+            'path', 'before us', 'after us',
+        ))
+        for name, before, after in paths:
+            self.stdout.write('{:<12} {:>12.2f} {:>12.2f}'.format(
+                name,
+                timeit.timeit(before, number=iterations) / iterations * 10 ** 6,
+                timeit.timeit(after, number=iterations) / iterations * 10 ** 6,
+            ))
@@ -2,7 +2,15 @@ from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db.models.signals import post_delete, post_migrate, post_save
 
+from likes.listeners import (
+    add_to_liked_cache,
+    clear_content_types,
+    decr_likes_count,
+    incr_likes_count,
+    remove_from_liked_cache,
+)
 from utils.memcached_helper import MemchachedHelper
 
 
@@ -31,5 +39,14 @@ class Like(models.Model):
 
     @property
     def cached_user(self):
-        from accounts.services import UserService
+        # Set by UserService.prefetch_users_through_cache
+        if hasattr(self, '_cached_user'):
+            return self._cached_user
         return MemchachedHelper.get_object_through_cache(User, self.user_id)
+
+
+post_save.connect(incr_likes_count, sender=Like)
+post_delete.connect(decr_likes_count, sender=Like)
+post_save.connect(add_to_liked_cache, sender=Like)
+post_delete.connect(remove_from_liked_cache, sender=Like)
+post_migrate.connect(clear_content_types)
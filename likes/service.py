@@ -1,16 +1,508 @@
-from django.contrib.contenttypes.models import ContentType
+from collections import defaultdict
+from functools import reduce
+from operator import or_
 
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from likes.constants import LIKE_FLUSH_BATCH_SIZE, LIKE_FLUSH_INTERVAL
+from likes.content_types import LikeContentTypes
 from likes.models import Like
+from likes.tasks import flush_likes_task
+from twitter.cache import (
+    FLUSHING_LIKES_KEY,
+    LIKES_FLUSH_LOCK_KEY,
+    LIKES_FLUSH_SCHEDULED_KEY,
+    OBJECT_BUFFERED_LIKES_PATTERN,
+    PENDING_LIKES_COUNTS_KEY,
+    PENDING_LIKES_KEY,
+    USER_BUFFERED_LIKES_PATTERN,
+    USER_LIKED_OBJECT_IDS_PATTERN,
+)
+from utils.redis_client import RedisClient
+from utils.redis_helper import RedisHelper
+from utils.time_constants import ONE_HOUR
+from utils.time_helpers import utc_now
+
+# Adds (delta 1) or removes (delta -1) the object in the liked set of the
+# user, and only if that changed the set, adds the delta to the buffered
+# like, to the buffered likes count of the object, to the buffered likes
+# of the user and to the buffered likes of the object, the last three are
+# dropped when they get back to 0. Returns -1 without doing anything if the
+# liked set is not cached.
+BUFFER_LIKE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local changed
+if ARGV[4] == '1' then
+    changed = redis.call('SADD', KEYS[1], ARGV[1])
+else
+    changed = redis.call('SREM', KEYS[1], ARGV[1])
+end
+if changed == 1 then
+    redis.call('HINCRBY', KEYS[2], ARGV[2], ARGV[4])
+    -- The likes of the object are keyed by user, the others by object
+    local fields = {ARGV[3], ARGV[3], ARGV[5]}
+    for index = 3, 5 do
+        local field = fields[index - 2]
+        if redis.call('HINCRBY', KEYS[index], field, ARGV[4]) == 0 then
+            redis.call('HDEL', KEYS[index], field)
+        end
+    end
+end
+return changed
+"""
+
+# Takes the flushed delta off a buffered likes count or a buffered like of
+# a user, and drops the field once nothing is left in the buffer for it
+UNBUFFER_COUNT_SCRIPT = """
+local count = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+if count == 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return count
+"""
 
 
 class LikeService(object):
 
+    @classmethod
+    def _likes_for_object_ids(cls, model_class, object_ids):
+        return Like.objects.filter(
+            content_type_id=LikeContentTypes.get_id(model_class),
+            object_id__in=object_ids,
+        )
+
+    @classmethod
+    def likes_for_tweet_ids(cls, tweet_ids):
+        from tweets.models import Tweet
+        return cls._likes_for_object_ids(Tweet, tweet_ids)
+
+    @classmethod
+    def likes_for_comment_ids(cls, comment_ids):
+        from comments.models import Comment
+        return cls._likes_for_object_ids(Comment, comment_ids)
+
     @classmethod
     def has_liked(cls, user, target):
         if user.is_anonymous:
             return False
+        if settings.LIKE_WRITE_BEHIND:
+            return target.id in cls.get_liked_object_ids(
+                user,
+                target.__class__,
+                [target.id],
+            )
         return Like.objects.filter(
-            content_type=ContentType.objects.get_for_model(target.__class__),
+            content_type_id=LikeContentTypes.get_id(target.__class__),
             object_id=target.id,
             user=user,
         ).exists()
+
+    @classmethod
+    def get_liked_object_ids(cls, user, model_class, object_ids):
+        """
+        Return the set of ids in object_ids that the user has liked. It takes
+        one query on the (user, content_type, object_id) unique index, or one
+        redis round trip when REDIS_CACHE_LIKED_OBJECT_IDS is on. The cached
+        set is always used with LIKE_WRITE_BEHIND, db lags behind it.
+        """
+        if user.is_anonymous or not object_ids:
+            return set()
+        if settings.REDIS_CACHE_LIKED_OBJECT_IDS or settings.LIKE_WRITE_BEHIND:
+            return cls._get_liked_object_ids_through_cache(
+                user.id,
+                model_class,
+                object_ids,
+            )
+        return set(cls._likes_for_object_ids(
+            model_class,
+            object_ids,
+        ).filter(
+            user_id=user.id,
+        ).values_list('object_id', flat=True))
+
+    @classmethod
+    def _get_liked_object_ids_key(cls, user_id, model_class):
+        return USER_LIKED_OBJECT_IDS_PATTERN.format(
+            model=model_class.__name__.lower(),
+            user_id=user_id,
+        )
+
+    @classmethod
+    def _get_liked_object_ids_through_cache(cls, user_id, model_class, object_ids):
+        key = cls._get_liked_object_ids_key(user_id, model_class)
+        object_ids = list(object_ids)
+        is_members = RedisHelper.check_set_members(
+            key,
+            object_ids,
+            lambda: cls._load_liked_object_ids(user_id, model_class),
+        )
+        return {
+            object_id
+            for object_id, is_member in zip(object_ids, is_members)
+            if is_member
+        }
+
+    @classmethod
+    def _get_buffered_like_field(cls, user_id, content_type_id, object_id):
+        return '{}:{}:{}'.format(user_id, content_type_id, object_id)
+
+    @classmethod
+    def _get_buffered_count_field(cls, content_type_id, object_id):
+        return '{}:{}'.format(content_type_id, object_id)
+
+    @classmethod
+    def _get_user_buffered_likes_key(cls, user_id):
+        return USER_BUFFERED_LIKES_PATTERN.format(user_id=user_id)
+
+    @classmethod
+    def _get_object_buffered_likes_key(cls, content_type_id, object_id):
+        return OBJECT_BUFFERED_LIKES_PATTERN.format(
+            content_type_id=content_type_id,
+            object_id=object_id,
+        )
+
+    @classmethod
+    def _load_liked_object_ids(cls, user_id, model_class):
+        content_type_id = LikeContentTypes.get_id(model_class)
+        object_ids = set(Like.objects.filter(
+            user_id=user_id,
+            content_type_id=content_type_id,
+        ).values_list('object_id', flat=True))
+        if not settings.LIKE_WRITE_BEHIND:
+            return object_ids
+
+        # Apply the likes which have not been flushed to db yet, the user's
+        # own hash holds their net delta per object
+        conn = RedisClient.get_connection()
+        prefix = cls._get_buffered_count_field(content_type_id, '')
+        buffered_likes = conn.hgetall(cls._get_user_buffered_likes_key(user_id))
+        for field, delta in buffered_likes.items():
+            field = field.decode()
+            if not field.startswith(prefix):
+                continue
+            object_id = int(field[len(prefix):])
+            if int(delta) > 0:
+                object_ids.add(object_id)
+            elif int(delta) < 0:
+                object_ids.discard(object_id)
+        return object_ids
+
+    @classmethod
+    def buffer_like(cls, user_id, model_class, object_id):
+        return cls._buffer_like(user_id, model_class, object_id, 1)
+
+    @classmethod
+    def buffer_unlike(cls, user_id, model_class, object_id):
+        return cls._buffer_like(user_id, model_class, object_id, -1)
+
+    @classmethod
+    def _buffer_like(cls, user_id, model_class, object_id, delta):
+        """
+        Record a like (delta 1) or an unlike (delta -1) in redis only, the
+        liked set of the user makes it idempotent. Returns whether it changed
+        anything, or None when the liked set could not be cached, in which
+        case the caller writes db directly.
+        """
+        key = cls._get_liked_object_ids_key(user_id, model_class)
+        content_type_id = LikeContentTypes.get_id(model_class)
+        # Make sure the liked set is cached, it tells the duplicates apart
+        RedisHelper.check_set_members(
+            key,
+            [object_id],
+            lambda: cls._load_liked_object_ids(user_id, model_class),
+        )
+        conn = RedisClient.get_connection()
+        changed = conn.eval(
+            BUFFER_LIKE_SCRIPT,
+            5,
+            key,
+            PENDING_LIKES_KEY,
+            PENDING_LIKES_COUNTS_KEY,
+            cls._get_user_buffered_likes_key(user_id),
+            cls._get_object_buffered_likes_key(content_type_id, object_id),
+            object_id,
+            cls._get_buffered_like_field(user_id, content_type_id, object_id),
+            cls._get_buffered_count_field(content_type_id, object_id),
+            delta,
+            user_id,
+        )
+        if changed == -1:
+            return None
+        # One flush per interval picks up all the likes buffered meanwhile
+        if changed and conn.set(
+            LIKES_FLUSH_SCHEDULED_KEY,
+            1,
+            nx=True,
+            ex=LIKE_FLUSH_INTERVAL,
+        ):
+            flush_likes_task.apply_async(countdown=LIKE_FLUSH_INTERVAL)
+        return bool(changed)
+
+    @classmethod
+    def flush_likes(cls, batch_size=LIKE_FLUSH_BATCH_SIZE):
+        """
+        Write the buffered likes and unlikes to db batch by batch. The
+        pending hash is renamed first, so likes buffered meanwhile go to the
+        next flush. Returns the number of likes created and deleted.
+        """
+        conn = RedisClient.get_connection()
+        # Likes buffered from now on schedule the next flush
+        conn.delete(LIKES_FLUSH_SCHEDULED_KEY)
+        # Flushes must not overlap, the same like could be written twice and
+        # a like and its unlike could be written in the wrong order
+        if not conn.set(LIKES_FLUSH_LOCK_KEY, 1, nx=True, ex=ONE_HOUR):
+            return 0
+        try:
+            # A flushing hash left by a failed flush is finished first
+            flushed_count = cls._flush_buffered_likes(batch_size)
+            if conn.exists(PENDING_LIKES_KEY):
+                conn.rename(PENDING_LIKES_KEY, FLUSHING_LIKES_KEY)
+                flushed_count += cls._flush_buffered_likes(batch_size)
+            return flushed_count
+        finally:
+            conn.delete(LIKES_FLUSH_LOCK_KEY)
+
+    @classmethod
+    def _flush_buffered_likes(cls, batch_size):
+        conn = RedisClient.get_connection()
+        flushed_count = 0
+        while True:
+            # Flushed fields are deleted, so scanning from the start again
+            # always finds the ones left
+            _, buffered_likes = conn.hscan(
+                FLUSHING_LIKES_KEY,
+                0,
+                count=batch_size,
+            )
+            if not buffered_likes:
+                return flushed_count
+            flushed_count += cls._flush_likes_batch(buffered_likes)
+
+    @classmethod
+    def _delete_likes(cls, like_ids):
+        # One DELETE without collecting the rows, Like.delete() would send
+        # post_delete and update the liked set and the counts in redis once
+        # more
+        if not like_ids:
+            return
+        Like.objects.filter(id__in=like_ids)._raw_delete(Like.objects.db)
+
+    @classmethod
+    def _flush_likes_batch(cls, buffered_likes):
+        # Net delta of each (user_id, content_type_id, object_id), likes and
+        # unlikes buffered meanwhile cancel out
+        like_deltas = {}
+        for field, delta in buffered_likes.items():
+            key = tuple(map(int, field.decode().split(':')))
+            like_deltas[key] = int(delta)
+        like_deltas = {
+            key: delta for key, delta in like_deltas.items() if delta
+        }
+
+        count_deltas = defaultdict(int)
+        with transaction.atomic():
+            existing_like_ids = {}
+            if like_deltas:
+                # Locking the unique index range also keeps a like written
+                # directly to db from being inserted in the meantime
+                conditions = [
+                    Q(
+                        user_id=user_id,
+                        content_type_id=content_type_id,
+                        object_id=object_id,
+                    )
+                    for user_id, content_type_id, object_id in like_deltas
+                ]
+                existing_likes = Like.objects.select_for_update().filter(
+                    reduce(or_, conditions),
+                ).values_list('id', 'user_id', 'content_type_id', 'object_id')
+                existing_like_ids = {
+                    (user_id, content_type_id, object_id): like_id
+                    for like_id, user_id, content_type_id, object_id
+                    in existing_likes
+                }
+
+            # Only the rows which are actually inserted or deleted change
+            # the counts, a like already in db is not counted twice
+            likes_to_create, like_ids_to_delete = [], []
+            for key, delta in like_deltas.items():
+                user_id, content_type_id, object_id = key
+                if delta > 0 and key not in existing_like_ids:
+                    likes_to_create.append(Like(
+                        user_id=user_id,
+                        content_type_id=content_type_id,
+                        object_id=object_id,
+                    ))
+                elif delta < 0 and key in existing_like_ids:
+                    like_ids_to_delete.append(existing_like_ids[key])
+                else:
+                    continue
+                count_deltas[(content_type_id, object_id)] += delta
+
+            # The liked sets and the counts in redis were updated when the
+            # likes were buffered, neither bulk_create nor _raw_delete
+            # sends the signals which would update them once more
+            Like.objects.bulk_create(likes_to_create)
+            cls._delete_likes(like_ids_to_delete)
+            for (content_type_id, object_id), delta in count_deltas.items():
+                model_class = LikeContentTypes.get_model_class(content_type_id)
+                model_class.objects.filter(id=object_id).update(
+                    likes_count=F('likes_count') + delta,
+                )
+
+        # The buffered counts hold what was buffered, take all of it off
+        buffered_deltas = defaultdict(int)
+        for (_, content_type_id, object_id), delta in like_deltas.items():
+            buffered_deltas[(content_type_id, object_id)] += delta
+
+        pipeline = RedisClient.get_connection().pipeline()
+        pipeline.hdel(FLUSHING_LIKES_KEY, *buffered_likes)
+        for (user_id, content_type_id, object_id), delta in like_deltas.items():
+            pipeline.eval(
+                UNBUFFER_COUNT_SCRIPT,
+                1,
+                cls._get_user_buffered_likes_key(user_id),
+                cls._get_buffered_count_field(content_type_id, object_id),
+                -delta,
+            )
+            pipeline.eval(
+                UNBUFFER_COUNT_SCRIPT,
+                1,
+                cls._get_object_buffered_likes_key(content_type_id, object_id),
+                user_id,
+                -delta,
+            )
+        for (content_type_id, object_id), delta in count_deltas.items():
+            if not delta:
+                continue
+            model_class = LikeContentTypes.get_model_class(content_type_id)
+            # The db counter holds the delta now, reload it on the next read
+            pipeline.delete(RedisHelper.get_count_key(
+                model_class,
+                object_id,
+                'likes_count',
+            ))
+        for (content_type_id, object_id), delta in buffered_deltas.items():
+            if not delta:
+                continue
+            pipeline.eval(
+                UNBUFFER_COUNT_SCRIPT,
+                1,
+                PENDING_LIKES_COUNTS_KEY,
+                cls._get_buffered_count_field(content_type_id, object_id),
+                -delta,
+            )
+        pipeline.execute()
+        return len(likes_to_create) + len(like_ids_to_delete)
+
+    @classmethod
+    def get_likes(cls, model_class, object_id):
+        """
+        Return the likes of an object, newest first. With LIKE_WRITE_BEHIND
+        the likes which are still buffered are merged in, so the list agrees
+        with get_likes_count. They go first as unsaved Like objects, the
+        flush creates them after every like already in db.
+        """
+        likes = list(cls._likes_for_object_ids(
+            model_class,
+            [object_id],
+        ).order_by('-created_at'))
+        if not settings.LIKE_WRITE_BEHIND:
+            return likes
+        content_type_id = LikeContentTypes.get_id(model_class)
+        conn = RedisClient.get_connection()
+        buffered_likes = {
+            int(user_id): int(delta)
+            for user_id, delta in conn.hgetall(
+                cls._get_object_buffered_likes_key(content_type_id, object_id),
+            ).items()
+        }
+        # A like being flushed can be in db and in the buffer at once
+        liked_user_ids = {like.user_id for like in likes}
+        today = utc_now().date()
+        buffered_like_objects = [
+            Like(
+                user_id=user_id,
+                content_type_id=content_type_id,
+                object_id=object_id,
+                created_at=today,
+            )
+            for user_id, delta in sorted(buffered_likes.items())
+            if delta > 0 and user_id not in liked_user_ids
+        ]
+        return buffered_like_objects + [
+            like for like in likes
+            if buffered_likes.get(like.user_id, 0) >= 0
+        ]
+
+    @classmethod
+    def get_likes_count(cls, model_class, object_id):
+        return cls.get_likes_counts(model_class, [object_id])[object_id]
+
+    @classmethod
+    def get_likes_counts(cls, model_class, object_ids):
+        """
+        Return a dict of object id to likes count, the likes which are still
+        buffered are added to the counts mirrored from db.
+        """
+        object_ids = list(object_ids)
+        counts = RedisHelper.get_counts(model_class, object_ids, 'likes_count')
+        if not settings.LIKE_WRITE_BEHIND or not object_ids:
+            return counts
+        content_type_id = LikeContentTypes.get_id(model_class)
+        conn = RedisClient.get_connection()
+        buffered_counts = conn.hmget(PENDING_LIKES_COUNTS_KEY, [
+            cls._get_buffered_count_field(content_type_id, object_id)
+            for object_id in object_ids
+        ])
+        for object_id, buffered_count in zip(object_ids, buffered_counts):
+            if buffered_count is not None:
+                counts[object_id] += int(buffered_count)
+        return counts
+
+    @classmethod
+    def add_to_liked_cache(cls, like):
+        key = cls._get_liked_object_ids_key(
+            like.user_id,
+            LikeContentTypes.get_model_class(like.content_type_id),
+        )
+        RedisHelper.add_to_set(key, like.object_id)
+
+    @classmethod
+    def remove_from_liked_cache(cls, like):
+        key = cls._get_liked_object_ids_key(
+            like.user_id,
+            LikeContentTypes.get_model_class(like.content_type_id),
+        )
+        RedisHelper.remove_from_set(key, like.object_id)
+
+    @classmethod
+    def prefetch_has_liked(cls, context, model_class, objects):
+        """
+        Look up whether the request user has liked each of the objects in one
+        go and store the result in the serializer context, so get_has_liked
+        becomes a dict lookup.
+        """
+        object_ids = [obj.id for obj in objects]
+        liked_object_ids = cls.get_liked_object_ids(
+            context['request'].user,
+            model_class,
+            object_ids,
+        )
+        has_liked_map = context.setdefault('has_liked', {})
+        for object_id in object_ids:
+            has_liked_map[(model_class, object_id)] = \
+                object_id in liked_object_ids
+
+    @classmethod
+    def has_liked_in_context(cls, context, target):
+        key = (target.__class__, target.id)
+        has_liked_map = context.get('has_liked', {})
+        if key in has_liked_map:
+            return has_liked_map[key]
+        # Not prefetched, e.g. when serializing a single object
+        return cls.has_liked(context['request'].user, target)
@@ -0,0 +1,12 @@
+from celery import shared_task
+
+from utils.time_constants import ONE_HOUR
+
+
+@shared_task(time_limit=ONE_HOUR)
+def flush_likes_task():
+    # Import inside the task to avoid circular dependency
+    from likes.service import LikeService
+
+    flushed_count = LikeService.flush_likes()
+    return '{} likes flushed.'.format(flushed_count)
@@ -1,3 +1,190 @@
-from django.test import TestCase
+from django.contrib.contenttypes.models import ContentType
+from django.test import override_settings
 
-# Create your tests here.
+from comments.models import Comment
+from likes.content_types import LikeContentTypes
+from likes.service import LikeService
+from testing.testcases import TestCase
+from likes.models import Like
+from tweets.models import Tweet
+from twitter.cache import (
+    LIKES_FLUSH_SCHEDULED_KEY,
+    PENDING_LIKES_COUNTS_KEY,
+    PENDING_LIKES_KEY,
+)
+from utils.redis_client import RedisClient
+
+
+class LikeServiceTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+        self.dongxie = self.create_user('dongxie')
+        self.tweets = [self.create_tweet(self.dongxie) for i in range(3)]
+
+    def test_get_liked_object_ids(self):
+        tweet_ids = [tweet.id for tweet in self.tweets]
+        self.assertEqual(
+            LikeService.get_liked_object_ids(self.linghu, Tweet, tweet_ids),
+            set(),
+        )
+        self.create_like(self.linghu, self.tweets[0])
+        self.create_like(self.linghu, self.tweets[2])
+        self.create_like(self.dongxie, self.tweets[1])
+        self.assertEqual(
+            LikeService.get_liked_object_ids(self.linghu, Tweet, tweet_ids),
+            {self.tweets[0].id, self.tweets[2].id},
+        )
+        self.assertEqual(
+            LikeService.get_liked_object_ids(self.dongxie, Tweet, tweet_ids),
+            {self.tweets[1].id},
+        )
+
+    @override_settings(REDIS_CACHE_LIKED_OBJECT_IDS=True)
+    def test_get_liked_object_ids_through_cache(self):
+        conn = RedisClient.get_connection()
+        key = LikeService._get_liked_object_ids_key(self.linghu.id, Tweet)
+        tweet_ids = [tweet.id for tweet in self.tweets]
+
+        # liked nothing is cached as well
+        self.assertEqual(
+            LikeService.get_liked_object_ids(self.linghu, Tweet, tweet_ids),
+            set(),
+        )
+        self.assertEqual(conn.exists(key), True)
+
+        # likes are written through to the cached set
+        like = self.create_like(self.linghu, self.tweets[1])
+        self.assertEqual(
+            LikeService.get_liked_object_ids(self.linghu, Tweet, tweet_ids),
+            {self.tweets[1].id},
+        )
+        like.delete()
+        self.assertEqual(
+            LikeService.get_liked_object_ids(self.linghu, Tweet, tweet_ids),
+            set(),
+        )
+
+        # cache miss loads the set from db
+        self.create_like(self.linghu, self.tweets[2])
+        conn.delete(key)
+        self.assertEqual(
+            LikeService.get_liked_object_ids(self.linghu, Tweet, tweet_ids),
+            {self.tweets[2].id},
+        )
+
+    def test_likes_for_object_ids(self):
+        comment = self.create_comment(self.linghu, self.tweets[0])
+        self.create_like(self.linghu, self.tweets[0])
+        self.create_like(self.dongxie, self.tweets[0])
+        self.create_like(self.linghu, self.tweets[1])
+        self.create_like(self.linghu, comment)
+
+        tweet_ids = [self.tweets[0].id, self.tweets[2].id]
+        self.assertEqual(
+            LikeService.likes_for_tweet_ids(tweet_ids).count(),
+            2,
+        )
+        self.assertEqual(
+            LikeService.likes_for_comment_ids([comment.id]).count(),
+            1,
+        )
+        self.assertEqual(LikeService.likes_for_tweet_ids([]).count(), 0)
+
+    @override_settings(LIKE_WRITE_BEHIND=True)
+    def test_buffer_and_flush_likes(self):
+        conn = RedisClient.get_connection()
+        # Keep the likes in the buffer, the flush would run right away
+        conn.set(LIKES_FLUSH_SCHEDULED_KEY, 1)
+        tweet0, tweet1, tweet2 = self.tweets
+        self.create_like(self.linghu, tweet2)
+
+        like, unlike = LikeService.buffer_like, LikeService.buffer_unlike
+        for buffer, user, tweet, changed in [
+            (like, self.linghu, tweet0, True),
+            (like, self.linghu, tweet0, False),
+            (like, self.dongxie, tweet0, True),
+            (unlike, self.linghu, tweet1, False),
+            (unlike, self.linghu, tweet2, True),
+            # Liked and unliked before the flush
+            (like, self.dongxie, tweet1, True),
+            (unlike, self.dongxie, tweet1, True),
+        ]:
+            self.assertEqual(buffer(user.id, Tweet, tweet.id), changed)
+
+        # Nothing reached db yet, the reads merge the buffer
+        self.assertEqual(Like.objects.count(), 1)
+        self.assertEqual(
+            LikeService.get_likes_counts(Tweet, [t.id for t in self.tweets]),
+            {tweet0.id: 2, tweet1.id: 0, tweet2.id: 0},
+        )
+        self.assertEqual(LikeService.has_liked(self.linghu, tweet0), True)
+        self.assertEqual(LikeService.has_liked(self.linghu, tweet2), False)
+        # The liked set is rebuilt from db and the buffer if it is gone
+        conn.delete(
+            LikeService._get_liked_object_ids_key(self.linghu.id, Tweet),
+        )
+        self.assertEqual(
+            LikeService.get_liked_object_ids(
+                self.linghu,
+                Tweet,
+                [t.id for t in self.tweets],
+            ),
+            {tweet0.id},
+        )
+
+        self.assertEqual(LikeService.flush_likes(), 3)
+        self.assertEqual(
+            set(Like.objects.values_list('user_id', 'object_id')),
+            {(self.linghu.id, tweet0.id), (self.dongxie.id, tweet0.id)},
+        )
+        for tweet, likes_count in zip(self.tweets, [2, 0, 0]):
+            tweet.refresh_from_db()
+            self.assertEqual(tweet.likes_count, likes_count)
+            self.assertEqual(
+                LikeService.get_likes_count(Tweet, tweet.id),
+                likes_count,
+            )
+        self.assertEqual(conn.exists(PENDING_LIKES_KEY), 0)
+        self.assertEqual(conn.exists(PENDING_LIKES_COUNTS_KEY), 0)
+        for user in [self.linghu, self.dongxie]:
+            key = LikeService._get_user_buffered_likes_key(user.id)
+            self.assertEqual(conn.exists(key), 0)
+        self.assertEqual(LikeService.flush_likes(), 0)
+
+    @override_settings(LIKE_WRITE_BEHIND=True)
+    def test_flush_counts_only_written_likes(self):
+        conn = RedisClient.get_connection()
+        conn.set(LIKES_FLUSH_SCHEDULED_KEY, 1)
+        tweet = self.tweets[0]
+        self.assertTrue(
+            LikeService.buffer_like(self.linghu.id, Tweet, tweet.id),
+        )
+        # The same like reached db directly before the flush
+        self.create_like(self.linghu, tweet)
+
+        self.assertEqual(LikeService.flush_likes(), 0)
+        self.assertEqual(Like.objects.count(), 1)
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 1)
+        self.assertEqual(LikeService.get_likes_count(Tweet, tweet.id), 1)
+
+
+class LikeContentTypesTests(TestCase):
+
+    def test_get_id_and_model_class(self):
+        LikeContentTypes.clear()
+        content_type = ContentType.objects.get_for_model(Comment)
+        self.assertEqual(LikeContentTypes.get_id(Comment), content_type.id)
+        # Resolved once, then never goes through ContentType again
+        ContentType.objects.clear_cache()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                LikeContentTypes.get_id(Comment),
+                content_type.id,
+            )
+            self.assertEqual(
+                LikeContentTypes.get_model_class(content_type.id),
+                Comment,
+            )
@@ -1,6 +1,10 @@
 from rest_framework import serializers
+
 from newsfeeds.models import NewsFeed
 from tweets.api.serializers import TweetSerializer
+from tweets.models import Tweet
+from utils.memcached_helper import MemchachedHelper
+from utils.serializers import PrefetchListSerializer
 
 
 class NewsFeedSerializer(serializers.ModelSerializer):
@@ -8,4 +12,22 @@ class NewsFeedSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = NewsFeed
+        list_serializer_class = PrefetchListSerializer
         fields = ('id', 'tweet', 'created_at')
+
+    def prefetch(self, newsfeeds):
+        MemchachedHelper.prefetch_objects_through_cache(
+            newsfeeds,
+            Tweet,
+            'tweet_id',
+            '_cached_tweet',
+        )
+        # The newsfeeds of a deleted tweet can be left in the cached lists,
+        # drop them from the list being serialized
+        newsfeeds[:] = [
+            newsfeed
+            for newsfeed in newsfeeds
+            if hasattr(newsfeed, '_cached_tweet')
+        ]
+        tweets = [newsfeed.cached_tweet for newsfeed in newsfeeds]
+        self.fields['tweet'].prefetch(tweets)
@@ -1,8 +1,17 @@
+from datetime import timedelta
+
+from django.conf import settings
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from friendships.models import Friendship
+from newsfeeds.constants import NEWSFEED_RETENTION_COUNT
+from newsfeeds.models import NewsFeed
+from newsfeeds.services import NewsFeedService
 from testing.testcases import TestCase
+from tweets.models import Tweet
 from utils.paginations import EndlessPagination
+from utils.time_helpers import utc_now
 
 NEWSFEEDS_URL = '/api/newsfeeds/'
 POST_TWEET_URL = '/api/tweets/'
@@ -105,7 +114,8 @@ class NewsFeedApiTests(TestCase):
     def test_user_cache(self):
         profile = self.user2.profile
         profile.nickname = 'new nickname'
-        profile.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
 
         self.assertEqual(self.user1.username, 'user1')
         self.create_newsfeed(self.user2, self.create_tweet(self.user1))
@@ -120,9 +130,10 @@ class NewsFeedApiTests(TestCase):
         self.assertEqual(results[1]['tweet']['user']['username'], 'user1')
 
         self.user1.username = 'new user1 name'
-        self.user1.save()
         profile.nickname = 'new user2 nickname'
-        profile.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user1.save()
+            profile.save()
 
         response = self.user2_client.get(NEWSFEEDS_URL)
         results = response.data['results']
@@ -145,7 +156,8 @@ class NewsFeedApiTests(TestCase):
 
         # Update username
         self.user1.username = 'new user1 name'
-        self.user1.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user1.save()
         response = self.user2_client.get(NEWSFEEDS_URL)
         results = response.data['results']
         self.assertEqual(results[0]['tweet']['user']
@@ -153,8 +165,169 @@ class NewsFeedApiTests(TestCase):
 
         # Update tweet content
         tweet.content = 'new tweet content'
-        tweet.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            tweet.save()
         response = self.user2_client.get(NEWSFEEDS_URL)
         results = response.data['results']
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0]['tweet']['content'], 'new tweet content')
+
+    def test_redis_list_limit(self):
+        list_limit = settings.REDIS_LIST_LENGTH_LIMIT
+        page_size = EndlessPagination.page_size
+        followed_user = self.create_user('followed_user')
+        newsfeeds = []
+        for i in range(list_limit + page_size):
+            tweet = self.create_tweet(followed_user, f'tweet {i}')
+            newsfeed = self.create_newsfeed(self.user1, tweet)
+            newsfeeds.append(newsfeed)
+        newsfeeds = newsfeeds[::-1]
+
+        # Only the newest list_limit newsfeeds are cached
+        cached_newsfeeds = NewsFeedService.get_cached_newsfeeds(self.user1.id)
+        self.assertEqual(len(cached_newsfeeds), list_limit)
+        queryset = NewsFeed.objects.filter(user=self.user1)
+        self.assertEqual(queryset.count(), list_limit + page_size)
+
+        # Paginate through the cache and then into db
+        results = self._paginate_to_end(self.user1_client)
+        self.assertEqual(len(results), list_limit + page_size)
+        for i in range(list_limit + page_size):
+            self.assertEqual(newsfeeds[i].id, results[i]['id'])
+
+        # A new newsfeed shows up on the first page served from cache
+        self.user1_client.post(FOLLOW_URL.format(followed_user.id))
+        new_tweet = self.create_tweet(followed_user, 'a new tweet')
+        new_newsfeed = self.create_newsfeed(self.user1, new_tweet)
+        results = self._paginate_to_end(self.user1_client)
+        self.assertEqual(results[0]['id'], new_newsfeed.id)
+        for i in range(list_limit + page_size):
+            self.assertEqual(newsfeeds[i].id, results[i + 1]['id'])
+
+    def test_celebrity_tweets_are_pulled(self):
+        celebrity = self.create_user('celebrity')
+        celebrity_client = APIClient()
+        celebrity_client.force_authenticate(celebrity)
+        for i in range(settings.CELEBRITY_FOLLOWERS_THRESHOLD - 1):
+            follower = self.create_user(f'follower{i}')
+            Friendship.objects.create(from_user=follower, to_user=celebrity)
+        self.user1_client.post(FOLLOW_URL.format(celebrity.id))
+        self.user1_client.post(FOLLOW_URL.format(self.user2.id))
+
+        # Celebrity tweets are not fanned out
+        response = celebrity_client.post(POST_TWEET_URL, {'content': 'Hi fans'})
+        celebrity_tweet_id = response.data['id']
+        self.assertEqual(
+            NewsFeed.objects.filter(tweet_id=celebrity_tweet_id).count(), 1)
+
+        # Regular tweets are still fanned out
+        response = self.user2_client.post(
+            POST_TWEET_URL, {'content': 'Hello World!'})
+        user2_tweet_id = response.data['id']
+        self.assertEqual(
+            NewsFeed.objects.filter(tweet_id=user2_tweet_id).count(), 2)
+
+        # Followers see both tweets merged by created_at
+        response = self.user1_client.get(NEWSFEEDS_URL)
+        results = response.data['results']
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]['tweet']['id'], user2_tweet_id)
+        self.assertEqual(results[1]['tweet']['id'], celebrity_tweet_id)
+
+        # Users not following the celebrity do not see the tweet
+        response = self.user2_client.get(NEWSFEEDS_URL)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_celebrity_tweets_pagination(self):
+        list_limit = settings.REDIS_LIST_LENGTH_LIMIT
+        page_size = EndlessPagination.page_size
+        celebrity = self.create_user('celebrity')
+        for i in range(settings.CELEBRITY_FOLLOWERS_THRESHOLD):
+            follower = self.create_user(f'follower{i}')
+            Friendship.objects.create(from_user=follower, to_user=celebrity)
+        Friendship.objects.create(from_user=self.user1, to_user=celebrity)
+        NewsFeedService.mark_as_celebrity(celebrity.id)
+
+        expected_tweet_ids = []
+        for i in range(list_limit + page_size):
+            tweet = self.create_tweet(celebrity, f'celebrity tweet {i}')
+            expected_tweet_ids.append(tweet.id)
+            if i % 3 == 0:
+                tweet = self.create_tweet(self.user2, f'tweet {i}')
+                self.create_newsfeed(self.user1, tweet)
+                expected_tweet_ids.append(tweet.id)
+        expected_tweet_ids = expected_tweet_ids[::-1]
+
+        results = self._paginate_to_end(self.user1_client)
+        self.assertEqual(
+            [result['tweet']['id'] for result in results],
+            expected_tweet_ids,
+        )
+
+    def test_pruned_newsfeeds_are_pulled(self):
+        page_size = EndlessPagination.page_size
+        Friendship.objects.create(from_user=self.user1, to_user=self.user2)
+        expected_tweet_ids = []
+        for i in range(page_size + 5):
+            tweet = self.create_tweet(self.user2, f'tweet {i}')
+            newsfeed = self.create_newsfeed(self.user1, tweet)
+            created_at = utc_now() - timedelta(days=100 - i)
+            Tweet.objects.filter(id=tweet.id).update(created_at=created_at)
+            NewsFeed.objects.filter(id=newsfeed.id).update(
+                created_at=created_at,
+            )
+            expected_tweet_ids.append(tweet.id)
+        expected_tweet_ids = expected_tweet_ids[::-1]
+
+        NewsFeedService.prune_newsfeeds()
+        self.assertEqual(
+            NewsFeed.objects.filter(user=self.user1).count(),
+            NEWSFEED_RETENTION_COUNT,
+        )
+
+        # Newsfeeds past the retained ones are pulled from the followings
+        results = self._paginate_to_end(self.user1_client)
+        self.assertEqual(
+            [result['tweet']['id'] for result in results],
+            expected_tweet_ids,
+        )
+
+    def test_cursor_pagination_with_celebrities(self):
+        page_size = EndlessPagination.page_size
+        celebrity = self.create_user('celebrity')
+        Friendship.objects.create(from_user=self.user1, to_user=celebrity)
+        NewsFeedService.mark_as_celebrity(celebrity.id)
+        for i in range(page_size + 5):
+            self.create_tweet(celebrity, f'celebrity tweet {i}')
+            tweet = self.create_tweet(self.user2, f'tweet {i}')
+            self.create_newsfeed(self.user1, tweet)
+        # Pushed and pulled newsfeeds created in the same microsecond are
+        # ordered by tweet id
+        created_at = Tweet.objects.first().created_at
+        Tweet.objects.update(created_at=created_at)
+        NewsFeed.objects.update(created_at=created_at)
+        self.clear_cache()
+        expected_tweet_ids = list(
+            Tweet.objects.order_by('-id').values_list('id', flat=True),
+        )
+
+        tweet_ids = []
+        params = {}
+        while True:
+            response = self.user1_client.get(NEWSFEEDS_URL, params)
+            results = response.data['results']
+            tweet_ids.extend(result['tweet']['id'] for result in results)
+            if not response.data['has_next_page']:
+                break
+            params['cursor'] = response.data['next_cursor']
+        self.assertEqual(tweet_ids, expected_tweet_ids)
+
+    def _paginate_to_end(self, client):
+        response = client.get(NEWSFEEDS_URL)
+        results = response.data['results']
+        while response.data['has_next_page']:
+            created_at__lt = response.data['results'][-1]['created_at']
+            response = client.get(
+                NEWSFEEDS_URL, {'created_at__lt': created_at__lt})
+            results.extend(response.data['results'])
+        return results
@@ -4,21 +4,67 @@ from rest_framework.permissions import IsAuthenticated
 
 from newsfeeds.api.serializers import NewsFeedSerializer
 from newsfeeds.models import NewsFeed
-from utils.paginations import EndlessPagination
+from newsfeeds.services import NewsFeedService
+from utils.paginations import NewsFeedPagination
 
 
 class NewsFeedViewSet(viewsets.GenericViewSet):
     permission_classes = (IsAuthenticated, )
-    pagination_class = EndlessPagination
+    pagination_class = NewsFeedPagination
 
     def get_queryset(self):
-        return NewsFeed.objects.filter(user=self.request.user).order_by('-created_at')
+        return NewsFeed.objects.for_user(self.request.user.id)
 
     def list(self, request):
-        page = self.paginate_queryset(self.get_queryset())
+        user_id = request.user.id
+        celebrity_ids = NewsFeedService.get_followed_celebrity_ids(user_id)
+        pruned_before = NewsFeedService.get_pruned_before(user_id)
+        if not celebrity_ids and pruned_before is None:
+            cached_newsfeeds = NewsFeedService.get_cached_newsfeeds(user_id)
+            page = self.paginator.paginate_cached_list(
+                cached_newsfeeds,
+                request,
+            )
+            if page is None:
+                # The requested page is beyond the cached window, read from db
+                page = self.paginate_queryset(self.get_queryset())
+        else:
+            page = self._paginate_merged(request, celebrity_ids, pruned_before)
+
         serializer = NewsFeedSerializer(
             page,
             context={'request': request},
             many=True,
         )
         return self.get_paginated_response(serializer.data)
+
+    def _paginate_merged(self, request, celebrity_ids, pruned_before):
+        # Pushed newsfeeds are merged with the tweets pulled from the
+        # celebrities the user follows, and with the tweets pulled from all
+        # the followings beyond the newsfeeds kept by the retention job
+        user_id = request.user.id
+        cached_newsfeeds, is_complete = \
+            NewsFeedService.get_cached_merged_newsfeeds(
+                user_id,
+                celebrity_ids,
+                # A page and the newsfeed which tells there is a next page,
+                # the merged list is cut before the oldest tweet read
+                limit=self.paginator.page_size + 2,
+                pruned_before=pruned_before,
+            )
+        page = self.paginator.paginate_cached_list(
+            cached_newsfeeds,
+            request,
+            is_complete=is_complete,
+        )
+        if page is not None:
+            return page
+
+        newsfeeds = NewsFeedService.get_merged_newsfeeds_from_db(
+            user_id,
+            celebrity_ids,
+            limit=self.paginator.page_size + 1,
+            cursor=self.paginator.get_cursor(request),
+            pruned_before=pruned_before,
+        )
+        return self.paginator.paginate_ordered_list(newsfeeds, request)
@@ -0,0 +1,17 @@
+from django.conf import settings
+
+# Number of followers handled by a single fanout batch task
+FANOUT_BATCH_SIZE = 1000 if not settings.TESTING else 3
+# Rows per INSERT statement when a batch task writes its newsfeeds, keeps the
+# statements under max_allowed_packet and the row locks short
+FANOUT_WRITE_BATCH_SIZE = 200 if not settings.TESTING else 2
+# Retention of the newsfeed rows. A newsfeed is deleted once it is older
+# than NEWSFEED_RETENTION_DAYS and not among the NEWSFEED_RETENTION_COUNT
+# newest newsfeeds of its user. Older pages are pulled from tweets instead.
+NEWSFEED_RETENTION_DAYS = 30
+NEWSFEED_RETENTION_COUNT = 1000 if not settings.TESTING else 3
+# Rows scanned per primary key range when deleting old newsfeeds
+NEWSFEED_RETENTION_CHUNK_SIZE = 1000 if not settings.TESTING else 2
+# Number of threads writing the INSERTs of one batch task in parallel, each
+# with its own db connection. 1 writes them one after another.
+FANOUT_WRITE_WORKERS = 1
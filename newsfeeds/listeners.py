@@ -0,0 +1,20 @@
+def push_newsfeed_to_cache(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    from newsfeeds.services import NewsFeedService
+    NewsFeedService.push_newsfeed_to_cache(instance)
+
+
+def delete_newsfeeds_of_user(sender, instance, **kwargs):
+    from newsfeeds.services import NewsFeedService
+    from utils.transactions import run_on_commit
+    user_id = instance.id
+    run_on_commit(lambda: NewsFeedService.delete_newsfeeds_of_user(user_id))
+
+
+def delete_newsfeeds_of_tweet(sender, instance, **kwargs):
+    from newsfeeds.services import NewsFeedService
+    from utils.transactions import run_on_commit
+    tweet_id = instance.id
+    run_on_commit(lambda: NewsFeedService.delete_newsfeeds_of_tweet(tweet_id))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from newsfeeds.constants import NEWSFEED_RETENTION_CHUNK_SIZE
+from newsfeeds.services import NewsFeedService
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the newsfeeds out of retention, keeping the newest ones and '
+        'the recent ones of every user.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=NEWSFEED_RETENTION_CHUNK_SIZE,
+            help='Number of primary keys scanned per delete.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the newsfeeds out of retention, do not delete.',
+        )
+
+    def handle(self, *args, **options):
+        deleted = NewsFeedService.prune_newsfeeds(
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+        )
+        self.stdout.write(f'{deleted} newsfeeds deleted.')
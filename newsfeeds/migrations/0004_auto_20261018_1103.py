@@ -0,0 +1,20 @@
+# Generated by Django 3.1.13 on 2026-10-18 11:03
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tweets', '0006_auto_20261018_1103'),
+        ('newsfeeds', '0003_auto_20261018_1055'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='newsfeed',
+            index_together={('user', 'created_at', 'tweet')},
+        ),
+    ]
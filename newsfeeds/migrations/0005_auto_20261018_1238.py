@@ -0,0 +1,19 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:38
+
+from django.db import migrations, models
+import utils.time_helpers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsfeeds', '0004_auto_20261018_1103'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='newsfeed',
+            name='created_at',
+            field=models.DateTimeField(default=utils.time_helpers.utc_now),
+        ),
+    ]
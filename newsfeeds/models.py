@@ -1,18 +1,61 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 
+from newsfeeds.listeners import (
+    delete_newsfeeds_of_tweet,
+    delete_newsfeeds_of_user,
+    push_newsfeed_to_cache,
+)
+from newsfeeds.sharding import get_shard
 from tweets.models import Tweet
 from utils.memcached_helper import MemchachedHelper
+from utils.time_helpers import utc_now
+
+
+class NewsFeedQuerySet(models.QuerySet):
+
+    def for_user(self, user_id):
+        # Newsfeeds of a user only live on the shard of the user
+        return self.using(get_shard(user_id)).filter(user_id=user_id)
+
+    def create(self, **kwargs):
+        # QuerySet.create saves to the default database, save() without
+        # using lets the router pick the shard of the user
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
 
 
 class NewsFeed(models.Model):
-    # This user defines who can see this news feed
-    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
-    tweet = models.ForeignKey(Tweet, on_delete=models.SET_NULL, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # This user defines who can see this news feed. Newsfeeds are sharded
+    # while users and tweets are not, so no foreign key constraints. The
+    # delete collector only looks in default, the listeners below delete
+    # the newsfeeds of a user or a tweet from every shard instead.
+    user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        null=True,
+        db_constraint=False,
+    )
+    tweet = models.ForeignKey(
+        Tweet,
+        on_delete=models.DO_NOTHING,
+        null=True,
+        db_constraint=False,
+    )
+    # The created_at of the tweet rather than the time of the fanout, which
+    # lags behind it, so the pushed newsfeeds sort the same way as the
+    # tweets pulled at read time
+    created_at = models.DateTimeField(default=utc_now)
+
+    objects = NewsFeedQuerySet.as_manager()
 
     class Meta:
-        index_together = (('user', 'created_at'), )
+        # tweet breaks created_at ties for keyset pagination, pulled
+        # newsfeeds are not saved and only have a tweet id
+        index_together = (('user', 'created_at', 'tweet'), )
         unique_together = (('user', 'tweet'), )
         ordering = ('-created_at', )
 
@@ -21,4 +64,12 @@ class NewsFeed(models.Model):
 
     @property
     def cached_tweet(self):
+        # Set by MemchachedHelper.prefetch_objects_through_cache
+        if hasattr(self, '_cached_tweet'):
+            return self._cached_tweet
         return MemchachedHelper.get_object_through_cache(Tweet, self.tweet_id)
+
+
+post_save.connect(push_newsfeed_to_cache, sender=NewsFeed)
+post_delete.connect(delete_newsfeeds_of_user, sender=User)
+post_delete.connect(delete_newsfeeds_of_tweet, sender=Tweet)
@@ -1,24 +1,424 @@
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Min
+
+from accounts.models import UserProfile
+from accounts.services import UserService
 from friendships.services import FriendshipService
+from newsfeeds.constants import (
+    FANOUT_WRITE_BATCH_SIZE,
+    FANOUT_WRITE_WORKERS,
+    NEWSFEED_RETENTION_CHUNK_SIZE,
+    NEWSFEED_RETENTION_COUNT,
+    NEWSFEED_RETENTION_DAYS,
+)
 from newsfeeds.models import NewsFeed
+from newsfeeds.sharding import group_by_shard
+from newsfeeds.tasks import fanout_newsfeeds_main_task
+from tweets.models import Tweet
+from tweets.services import TweetService
+from twitter.cache import CELEBRITY_USER_IDS_KEY, USER_NEWSFEEDS_PATTERN
+from utils.redis_client import RedisClient
+from utils.paginations import filter_by_cursor
+from utils.redis_helper import RedisHelper
+from utils.time_helpers import utc_now
+
 
 class NewsFeedService(object):
 
     @classmethod
     def fanout_to_followers(cls, tweet):
-        # It's not allow to use for loop and query together
-        # since it would result in slow query
-        # for follower in FriendshipService.get_followers(tweet.user):
-        #     newsfeed = NewsFeed.objects.create(
-        #         user=follower,
-        #         tweet=tweet,
-        #     )
-
-        # Corret way is to use bulk_create, it will combine all insert into one query
-        # and it will be much faster
-        newsfeeds = [
-            NewsFeed(user=follower, tweet=tweet)
-            for follower in FriendshipService.get_followers(tweet.user)
+        # Only the author's own newsfeed is created in the request, it goes
+        # through post_save and gets pushed to cache. Fanout to followers can
+        # take a long time for users with many followers, so it is done
+        # asynchronously by celery workers in batches.
+        NewsFeed.objects.create(
+            user_id=tweet.user_id,
+            tweet_id=tweet.id,
+            created_at=tweet.created_at,
+        )
+        fanout_newsfeeds_main_task.delay(tweet.id, tweet.user_id)
+
+    @classmethod
+    def _write_newsfeeds(cls, shard, newsfeeds, close_connection=False):
+        start = time.time()
+        try:
+            # ignore_conflicts so a retried write skips the rows it already
+            # created instead of failing on unique_together(user, tweet)
+            NewsFeed.objects.using(shard).bulk_create(
+                newsfeeds,
+                ignore_conflicts=True,
+            )
+        finally:
+            # Threads of the pool open their own connections, close them or
+            # they are leaked
+            if close_connection:
+                connections[shard].close()
+        return shard, len(newsfeeds), time.time() - start
+
+    @classmethod
+    def bulk_create_newsfeeds(
+        cls,
+        tweet,
+        user_ids,
+        batch_size=FANOUT_WRITE_BATCH_SIZE,
+        workers=FANOUT_WRITE_WORKERS,
+    ):
+        """
+        Create the newsfeeds of a tweet for the users with one INSERT per
+        batch_size rows on the shard of the users, on a pool of workers
+        threads when workers > 1.
+        Returns a (shard, rows, seconds) tuple for each INSERT.
+        """
+        batches = []
+        for shard, shard_user_ids in group_by_shard(user_ids).items():
+            newsfeeds = [
+                NewsFeed(
+                    user_id=user_id,
+                    tweet_id=tweet.id,
+                    created_at=tweet.created_at,
+                )
+                for user_id in shard_user_ids
+            ]
+            batches.extend(
+                (shard, newsfeeds[index: index + batch_size])
+                for index in range(0, len(newsfeeds), batch_size)
+            )
+        if workers <= 1 or len(batches) <= 1:
+            return [
+                cls._write_newsfeeds(shard, newsfeeds)
+                for shard, newsfeeds in batches
+            ]
+
+        def write_in_thread(batch):
+            shard, newsfeeds = batch
+            return cls._write_newsfeeds(
+                shard,
+                newsfeeds,
+                close_connection=True,
+            )
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(write_in_thread, batches))
+
+    @classmethod
+    def delete_newsfeeds_of_user(cls, user_id):
+        NewsFeed.objects.for_user(user_id).delete()
+        RedisClient.get_connection().delete(
+            USER_NEWSFEEDS_PATTERN.format(user_id=user_id),
+        )
+
+    @classmethod
+    def delete_newsfeeds_of_tweet(cls, tweet_id):
+        # The tweet was fanned out to users on every shard, each shard finds
+        # its rows through the tweet_id index. The newsfeeds left in cached
+        # lists are skipped by NewsFeedSerializer.
+        for shard in settings.NEWSFEED_SHARDS:
+            NewsFeed.objects.using(shard).filter(tweet_id=tweet_id).delete()
+
+    @classmethod
+    def get_cached_newsfeeds(cls, user_id):
+        queryset = NewsFeed.objects.for_user(user_id).order_by(
+            '-created_at',
+            '-tweet_id',
+        )
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=user_id)
+        newsfeeds = RedisHelper.load_objects(key, queryset)
+        # Newsfeeds are pushed in the order their fanout runs, a tweet whose
+        # fanout lagged can land before newer ones
+        return sorted(
+            newsfeeds,
+            key=lambda newsfeed: (newsfeed.created_at, newsfeed.tweet_id),
+            reverse=True,
+        )
+
+    @classmethod
+    def push_newsfeed_to_cache(cls, newsfeed):
+        queryset = NewsFeed.objects.for_user(
+            newsfeed.user_id,
+        ).order_by('-created_at', '-tweet_id')
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=newsfeed.user_id)
+        RedisHelper.push_object(key, newsfeed, queryset)
+
+    @classmethod
+    def push_newsfeeds_to_cache(cls, newsfeeds):
+        # Fanout only pushes into the lists of users who read their newsfeeds
+        # lately, a newsfeed already in the list is not pushed again
+        RedisHelper.push_objects_if_cached({
+            USER_NEWSFEEDS_PATTERN.format(user_id=newsfeed.user_id): newsfeed
+            for newsfeed in newsfeeds
+        })
+
+    @classmethod
+    def _load_celebrity_ids(cls):
+        return UserProfile.objects.filter(
+            is_celebrity=True,
+        ).values_list('user_id', flat=True)
+
+    @classmethod
+    def is_celebrity(cls, user_id):
+        return RedisHelper.check_set_members(
+            CELEBRITY_USER_IDS_KEY,
+            [user_id],
+            cls._load_celebrity_ids,
+        )[0]
+
+    @classmethod
+    def mark_as_celebrity(cls, user_id):
+        # Celebrity status is sticky, once a user's tweets stop being fanned
+        # out they are always pulled, so no tweet goes missing from newsfeeds.
+        # The db holds the flag, the cached set is only read in front of it.
+        profile = UserService.get_profile_through_cache(user_id)
+        UserProfile.objects.filter(id=profile.id).update(is_celebrity=True)
+        UserService.invalidate_profile_cache(user_id)
+        RedisHelper.add_to_set(CELEBRITY_USER_IDS_KEY, user_id)
+
+    @classmethod
+    def should_fanout(cls, user_id, followers_count):
+        if cls.is_celebrity(user_id):
+            return False
+        if followers_count >= settings.CELEBRITY_FOLLOWERS_THRESHOLD:
+            cls.mark_as_celebrity(user_id)
+            return False
+        return True
+
+    @classmethod
+    def get_followed_celebrity_ids(cls, user_id):
+        celebrity_ids = RedisHelper.load_set(
+            CELEBRITY_USER_IDS_KEY,
+            cls._load_celebrity_ids,
+        )
+        # Celebrities are few, check them against the following set instead
+        # of fetching the whole following set
+        return sorted(FriendshipService.get_followed_user_ids(
+            user_id,
+            celebrity_ids,
+        ))
+
+    @classmethod
+    def _pull_pruned_newsfeeds(cls, user_id, pruned_before, limit,
+                               cursor=None):
+        # Same as fanout, the user's own tweets are in their newsfeeds too
+        user_ids = FriendshipService.get_following_user_id_set(user_id)
+        user_ids.add(user_id)
+        tweets = Tweet.objects.filter(
+            user_id__in=user_ids,
+            created_at__lt=pruned_before,
+        )
+        if cursor is not None:
+            tweets = filter_by_cursor(tweets, cursor)
+        tweets = tweets.order_by('-created_at', '-id')[:limit]
+        return cls._tweets_to_newsfeeds(user_id, tweets)
+
+    @classmethod
+    def get_pruned_before(cls, user_id):
+        """
+        Return the created_at before which the newsfeeds of the user have
+        been deleted by the retention job, None if none were deleted.
+        """
+        profile = UserService.get_profile_through_cache(user_id)
+        return profile.newsfeeds_pruned_before
+
+    @classmethod
+    def _mark_as_pruned(cls, user_id, pruned_before):
+        profile = UserService.get_profile_through_cache(user_id)
+        UserProfile.objects.filter(id=profile.id).update(
+            newsfeeds_pruned_before=pruned_before,
+        )
+        UserService.invalidate_profile_cache(user_id)
+        # The cached list might still hold the deleted newsfeeds
+        conn = RedisClient.get_connection()
+        conn.delete(USER_NEWSFEEDS_PATTERN.format(user_id=user_id))
+
+    @classmethod
+    def _get_retention_threshold(cls, shard, user_id, cutoff):
+        # Newsfeeds older than both the cutoff and the Nth newest newsfeed
+        # of the user can be deleted
+        nth_created_at = list(NewsFeed.objects.using(shard).filter(
+            user_id=user_id,
+        ).order_by('-created_at').values_list('created_at', flat=True)[
+            NEWSFEED_RETENTION_COUNT - 1:NEWSFEED_RETENTION_COUNT
+        ])
+        if not nth_created_at:
+            return None
+        return min(cutoff, nth_created_at[0])
+
+    @classmethod
+    def prune_newsfeeds(
+        cls,
+        chunk_size=NEWSFEED_RETENTION_CHUNK_SIZE,
+        dry_run=False,
+    ):
+        """
+        Delete the newsfeeds out of retention on every shard. Rows are
+        scanned and deleted chunk_size primary keys at a time, so every
+        DELETE is short and only locks a small range. Returns the number of
+        deleted newsfeeds.
+        """
+        cutoff = utc_now() - timedelta(days=NEWSFEED_RETENTION_DAYS)
+        deleted_count = 0
+        for shard in settings.NEWSFEED_SHARDS:
+            deleted_count += cls._prune_shard(
+                shard,
+                cutoff,
+                chunk_size,
+                dry_run,
+            )
+        return deleted_count
+
+    @classmethod
+    def _prune_shard(cls, shard, cutoff, chunk_size, dry_run):
+        newsfeeds = NewsFeed.objects.using(shard)
+        id_range = newsfeeds.aggregate(min_id=Min('id'), max_id=Max('id'))
+        if id_range['min_id'] is None:
+            return 0
+
+        deleted_count = 0
+        for start_id in range(
+            id_range['min_id'],
+            id_range['max_id'] + 1,
+            chunk_size,
+        ):
+            # Thresholds are kept for the current chunk only, so memory is
+            # bound by chunk_size however many users the shard holds
+            thresholds, pruned_user_ids = {}, set()
+            rows = newsfeeds.filter(
+                id__gte=start_id,
+                id__lt=start_id + chunk_size,
+                created_at__lt=cutoff,
+            ).values_list('id', 'user_id', 'created_at')
+            newsfeed_ids = []
+            for newsfeed_id, user_id, created_at in rows:
+                if user_id not in thresholds:
+                    thresholds[user_id] = cls._get_retention_threshold(
+                        shard,
+                        user_id,
+                        cutoff,
+                    )
+                threshold = thresholds[user_id]
+                if threshold is None or created_at >= threshold:
+                    continue
+                newsfeed_ids.append(newsfeed_id)
+                # Mark before deleting, so readers pull the deleted ones
+                if user_id not in pruned_user_ids and not dry_run:
+                    cls._mark_as_pruned(user_id, threshold)
+                pruned_user_ids.add(user_id)
+
+            deleted_count += len(newsfeed_ids)
+            if newsfeed_ids and not dry_run:
+                newsfeeds.filter(id__in=newsfeed_ids).delete()
+        return deleted_count
+
+    @classmethod
+    def _tweets_to_newsfeeds(cls, user_id, tweets):
+        # Tweets pulled from celebrities are not stored as newsfeeds, wrap
+        # them in unsaved NewsFeed objects (with id None) so they can be
+        # merged and serialized together with the pushed newsfeeds
+        return [
+            NewsFeed(
+                user_id=user_id,
+                tweet_id=tweet.id,
+                created_at=tweet.created_at,
+            )
+            for tweet in tweets
         ]
-        newsfeeds.append(NewsFeed(user=tweet.user, tweet=tweet))
-        NewsFeed.objects.bulk_create(newsfeeds)
-        
\ No newline at end of file
+
+    @classmethod
+    def _merge_newsfeeds(cls, newsfeed_lists):
+        # K-way merge of lists ordered by (created_at, tweet_id) desc. A
+        # tweet could be both pushed and pulled if its author became a
+        # celebrity after it was fanned out, keep only the first (pushed) one.
+        merged_newsfeeds = []
+        seen_tweet_ids = set()
+        for newsfeed in heapq.merge(
+            *newsfeed_lists,
+            key=lambda newsfeed: (newsfeed.created_at, newsfeed.tweet_id),
+            reverse=True,
+        ):
+            if newsfeed.tweet_id in seen_tweet_ids:
+                continue
+            seen_tweet_ids.add(newsfeed.tweet_id)
+            merged_newsfeeds.append(newsfeed)
+        return merged_newsfeeds
+
+    @classmethod
+    def get_cached_merged_newsfeeds(
+        cls,
+        user_id,
+        celebrity_ids,
+        limit,
+        pruned_before=None,
+    ):
+        """
+        Merge the cached pushed newsfeeds with the newest limit cached tweets
+        of each followed celebrity. Returns the merged list and whether it
+        holds all the newsfeeds of the user.
+        """
+        newsfeed_lists = [cls.get_cached_newsfeeds(user_id)]
+        read_limits = [settings.REDIS_LIST_LENGTH_LIMIT]
+        for celebrity_id in celebrity_ids:
+            tweets = TweetService.get_cached_tweets(celebrity_id, limit)
+            newsfeed_lists.append(cls._tweets_to_newsfeeds(user_id, tweets))
+            read_limits.append(min(limit, settings.REDIS_LIST_LENGTH_LIMIT))
+
+        # A list read up to its limit might miss older objects, the merged
+        # list is only correct for newsfeeds newer than the oldest object of
+        # such a list
+        truncated_lists = [
+            newsfeeds
+            for newsfeeds, read_limit in zip(newsfeed_lists, read_limits)
+            if len(newsfeeds) >= read_limit
+        ]
+        merged_newsfeeds = cls._merge_newsfeeds(newsfeed_lists)
+        if not truncated_lists:
+            # Newsfeeds older than the pruned ones are pulled from db
+            return merged_newsfeeds, pruned_before is None
+
+        cutoff = max(newsfeeds[-1].created_at for newsfeeds in truncated_lists)
+        merged_newsfeeds = [
+            newsfeed
+            for newsfeed in merged_newsfeeds
+            if newsfeed.created_at > cutoff
+        ]
+        return merged_newsfeeds, False
+
+    @classmethod
+    def get_merged_newsfeeds_from_db(
+        cls,
+        user_id,
+        celebrity_ids,
+        limit,
+        cursor=None,
+        pruned_before=None,
+    ):
+        # Each source reads at most limit objects through its own
+        # (user, created_at, id) index, merging them gives the newest limit
+        # newsfeeds overall. The tweet id of a newsfeed is the id of the
+        # pulled tweet, so one cursor positions every source.
+        newsfeeds = NewsFeed.objects.for_user(user_id)
+        if cursor is not None:
+            newsfeeds = filter_by_cursor(newsfeeds, cursor, 'tweet_id')
+        newsfeed_lists = [list(
+            newsfeeds.order_by('-created_at', '-tweet_id')[:limit],
+        )]
+        if pruned_before is not None and len(newsfeed_lists[0]) < limit:
+            # The retained newsfeeds run out within this page, continue with
+            # the tweets of the followed users older than the pruned ones
+            newsfeed_lists.append(cls._pull_pruned_newsfeeds(
+                user_id,
+                pruned_before,
+                limit,
+                cursor,
+            ))
+        for celebrity_id in celebrity_ids:
+            tweets = Tweet.objects.filter(user_id=celebrity_id)
+            if cursor is not None:
+                tweets = filter_by_cursor(tweets, cursor)
+            tweets = tweets.order_by('-created_at', '-id')[:limit]
+            newsfeed_lists.append(cls._tweets_to_newsfeeds(user_id, tweets))
+        return cls._merge_newsfeeds(newsfeed_lists)[:limit]
@@ -0,0 +1,60 @@
+from collections import defaultdict
+
+from django.conf import settings
+
+NEWSFEEDS_APP_LABEL = 'newsfeeds'
+
+
+def get_shard(user_id):
+    """
+    Return the database alias holding the newsfeeds of the user. Changing
+    NEWSFEED_SHARDS remaps users to other shards, their rows have to be
+    moved before that.
+    """
+    shards = settings.NEWSFEED_SHARDS
+    return shards[user_id % len(shards)]
+
+
+def group_by_shard(user_ids):
+    shard_to_user_ids = defaultdict(list)
+    for user_id in user_ids:
+        shard_to_user_ids[get_shard(user_id)].append(user_id)
+    return shard_to_user_ids
+
+
+class NewsFeedRouter:
+    """
+    Route NewsFeed rows to the shard of their user. Querysets can not be
+    routed by the user_id they filter on, use NewsFeed.objects.for_user(),
+    or .using(get_shard(user_id)) for bulk operations.
+
+    Every database alias other than default is a newsfeed shard and only
+    gets the newsfeeds tables.
+    """
+
+    def _get_instance_shard(self, model, hints):
+        if model._meta.app_label != NEWSFEEDS_APP_LABEL:
+            return None
+        # The hint can also be a related object, e.g. the user being
+        # assigned to newsfeed.user
+        instance = hints.get('instance')
+        if not isinstance(instance, model) or instance.user_id is None:
+            return None
+        return get_shard(instance.user_id)
+
+    def db_for_read(self, model, **hints):
+        return self._get_instance_shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._get_instance_shard(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Newsfeeds point to users and tweets living in default
+        if NEWSFEEDS_APP_LABEL in (obj1._meta.app_label, obj2._meta.app_label):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == 'default':
+            return None
+        return app_label == NEWSFEEDS_APP_LABEL
@@ -0,0 +1,112 @@
+from celery import shared_task
+from celery.utils.log import get_task_logger
+
+from friendships.services import FriendshipService
+from newsfeeds.constants import FANOUT_BATCH_SIZE
+from newsfeeds.models import NewsFeed
+from newsfeeds.sharding import group_by_shard
+from tweets.models import Tweet
+from utils.memcached_helper import MemchachedHelper
+from utils.time_constants import ONE_DAY, ONE_HOUR
+
+logger = get_task_logger(__name__)
+
+
+@shared_task(
+    time_limit=ONE_HOUR,
+    autoretry_for=(Exception, ),
+    retry_backoff=True,
+    max_retries=3,
+)
+def fanout_newsfeeds_batch_task(tweet_id, follower_ids):
+    # Import inside the task to avoid circular dependency
+    from newsfeeds.services import NewsFeedService
+
+    try:
+        tweet = MemchachedHelper.get_object_through_cache(Tweet, tweet_id)
+    except Tweet.DoesNotExist:
+        return 'Tweet deleted, no newsfeeds created'
+
+    # A retried batch must not create or push the same newsfeed twice. Skip
+    # the followers fanned out by a previous attempt, unique_together(user,
+    # tweet) together with ignore_conflicts guards against concurrent runs.
+    existing_user_ids = set()
+    for shard, shard_user_ids in group_by_shard(follower_ids).items():
+        existing_user_ids.update(NewsFeed.objects.using(shard).filter(
+            tweet_id=tweet_id,
+            user_id__in=shard_user_ids,
+        ).values_list('user_id', flat=True))
+    new_follower_ids = [
+        follower_id
+        for follower_id in follower_ids
+        if follower_id not in existing_user_ids
+    ]
+    timings = NewsFeedService.bulk_create_newsfeeds(tweet, new_follower_ids)
+    for shard, rows, seconds in timings:
+        logger.info(
+            'Tweet %s: inserted %s newsfeeds into %s in %.1f ms',
+            tweet_id,
+            rows,
+            shard,
+            seconds * 1000,
+        )
+
+    # bulk_create does not trigger post_save and does not set the primary
+    # keys, so read the rows back and push them to cache manually. All the
+    # followers are pushed, a previous attempt might have created the rows
+    # and failed before pushing them, the push skips what is cached already.
+    for shard, shard_user_ids in group_by_shard(follower_ids).items():
+        NewsFeedService.push_newsfeeds_to_cache(
+            NewsFeed.objects.using(shard).filter(
+                tweet_id=tweet_id,
+                user_id__in=shard_user_ids,
+            ),
+        )
+    return '{} newsfeeds created'.format(len(new_follower_ids))
+
+
+@shared_task(time_limit=ONE_HOUR)
+def fanout_newsfeeds_main_task(tweet_id, tweet_user_id):
+    # Import inside the task to avoid circular dependency
+    from newsfeeds.services import NewsFeedService
+
+    followers_count = FriendshipService.get_follower_count(tweet_user_id)
+    # Tweets of celebrities are pulled by their followers at read time
+    if not NewsFeedService.should_fanout(tweet_user_id, followers_count):
+        return 'Celebrity tweet, fanout to {} followers skipped.'.format(
+            followers_count,
+        )
+
+    # Stream the follower ids and hand them out batch by batch, so no more
+    # than one batch of ids is held in memory
+    follower_ids = FriendshipService.iter_follower_ids(
+        tweet_user_id,
+        FANOUT_BATCH_SIZE,
+    )
+    fanout_count, batch_count = 0, 0
+    batch_ids = []
+    for follower_id in follower_ids:
+        batch_ids.append(follower_id)
+        if len(batch_ids) == FANOUT_BATCH_SIZE:
+            fanout_newsfeeds_batch_task.delay(tweet_id, batch_ids)
+            fanout_count += len(batch_ids)
+            batch_count += 1
+            batch_ids = []
+    if batch_ids:
+        fanout_newsfeeds_batch_task.delay(tweet_id, batch_ids)
+        fanout_count += len(batch_ids)
+        batch_count += 1
+
+    return '{} newsfeeds going to fanout, {} batches created.'.format(
+        fanout_count,
+        batch_count,
+    )
+
+
+@shared_task(time_limit=ONE_DAY)
+def prune_newsfeeds_task():
+    # Import inside the task to avoid circular dependency
+    from newsfeeds.services import NewsFeedService
+
+    deleted_count = NewsFeedService.prune_newsfeeds()
+    return '{} newsfeeds deleted.'.format(deleted_count)
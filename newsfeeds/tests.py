@@ -0,0 +1,444 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from friendships.models import Friendship
+from newsfeeds.constants import (
+    FANOUT_BATCH_SIZE,
+    NEWSFEED_RETENTION_COUNT,
+    NEWSFEED_RETENTION_DAYS,
+)
+from newsfeeds.models import NewsFeed
+from newsfeeds.services import NewsFeedService
+from newsfeeds.sharding import get_shard, group_by_shard
+from newsfeeds.tasks import (
+    fanout_newsfeeds_batch_task,
+    fanout_newsfeeds_main_task,
+    prune_newsfeeds_task,
+)
+from testing.testcases import TestCase
+from tweets.models import Tweet
+from twitter.cache import USER_NEWSFEEDS_PATTERN
+from utils.redis_client import RedisClient
+from utils.time_helpers import utc_now
+
+
+class NewsFeedServiceTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.user1 = self.create_user('user1')
+        self.user2 = self.create_user('user2')
+
+    def test_get_cached_newsfeeds(self):
+        newsfeed_ids = []
+        for i in range(3):
+            tweet = self.create_tweet(self.user2)
+            newsfeed = self.create_newsfeed(self.user1, tweet)
+            newsfeed_ids.append(newsfeed.id)
+        newsfeed_ids = newsfeed_ids[::-1]
+
+        RedisClient.clear()
+
+        # Cache miss
+        newsfeeds = NewsFeedService.get_cached_newsfeeds(self.user1.id)
+        self.assertEqual([f.id for f in newsfeeds], newsfeed_ids)
+
+        # Cache hit
+        newsfeeds = NewsFeedService.get_cached_newsfeeds(self.user1.id)
+        self.assertEqual([f.id for f in newsfeeds], newsfeed_ids)
+
+        # New newsfeed is pushed to the cached list
+        tweet = self.create_tweet(self.user1)
+        new_newsfeed = self.create_newsfeed(self.user1, tweet)
+        newsfeeds = NewsFeedService.get_cached_newsfeeds(self.user1.id)
+        newsfeed_ids.insert(0, new_newsfeed.id)
+        self.assertEqual([f.id for f in newsfeeds], newsfeed_ids)
+
+    def test_fanout_pushes_to_cache(self):
+        Friendship.objects.create(from_user=self.user1, to_user=self.user2)
+        # Warm up the cache of user1 so fanout has to push into it
+        NewsFeedService.get_cached_newsfeeds(self.user1.id)
+
+        tweet = self.create_tweet(self.user2)
+        NewsFeedService.fanout_to_followers(tweet)
+
+        for user in [self.user1, self.user2]:
+            newsfeeds = NewsFeedService.get_cached_newsfeeds(user.id)
+            self.assertEqual(len(newsfeeds), 1)
+            self.assertEqual(newsfeeds[0].tweet_id, tweet.id)
+            self.assertEqual(
+                newsfeeds[0].id,
+                NewsFeed.objects.get(user=user, tweet=tweet).id,
+            )
+
+        conn = RedisClient.get_connection()
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=self.user1.id)
+        self.assertEqual(conn.llen(key), 1)
+
+    def test_bulk_create_newsfeeds(self):
+        tweet = self.create_tweet(self.user1)
+        users = [self.create_user('user{}'.format(i)) for i in range(3, 8)]
+        user_ids = [user.id for user in users]
+        # 5 rows in INSERTs of 2 rows at most
+        with self.assertNumQueries(3):
+            timings = NewsFeedService.bulk_create_newsfeeds(
+                tweet,
+                user_ids,
+                batch_size=2,
+            )
+        self.assertEqual([rows for _, rows, _ in timings], [2, 2, 1])
+        self.assertEqual(
+            NewsFeed.objects.filter(tweet=tweet).count(),
+            len(user_ids),
+        )
+
+        # existing rows are skipped
+        NewsFeedService.bulk_create_newsfeeds(tweet, user_ids)
+        self.assertEqual(
+            NewsFeed.objects.filter(tweet=tweet).count(),
+            len(user_ids),
+        )
+
+    def test_bulk_create_newsfeeds_in_threads(self):
+        tweet = self.create_tweet(self.user1)
+        # The test db is not shared between threads, only check the batches
+        # are spread on the pool
+        with mock.patch.object(
+            NewsFeedService,
+            '_write_newsfeeds',
+            side_effect=lambda shard, batch, **kwargs: (shard, len(batch), 0),
+        ) as write_newsfeeds:
+            timings = NewsFeedService.bulk_create_newsfeeds(
+                tweet,
+                range(1, 6),
+                batch_size=2,
+                workers=2,
+            )
+        self.assertEqual([rows for _, rows, _ in timings], [2, 2, 1])
+        self.assertEqual(write_newsfeeds.call_count, 3)
+        for call in write_newsfeeds.call_args_list:
+            self.assertEqual(call.kwargs, {'close_connection': True})
+
+
+class NewsFeedTaskTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.user1 = self.create_user('user1')
+        self.user2 = self.create_user('user2')
+
+    def test_fanout_main_task(self):
+        tweet = self.create_tweet(self.user1, 'tweet 1')
+        msg = fanout_newsfeeds_main_task(tweet.id, self.user1.id)
+        self.assertEqual(msg, '0 newsfeeds going to fanout, 0 batches created.')
+        self.assertEqual(NewsFeed.objects.count(), 0)
+
+        followers = []
+        for i in range(FANOUT_BATCH_SIZE * 2 + 1):
+            follower = self.create_user(f'follower{i}')
+            Friendship.objects.create(from_user=follower, to_user=self.user1)
+            followers.append(follower)
+        msg = fanout_newsfeeds_main_task(tweet.id, self.user1.id)
+        self.assertEqual(
+            msg,
+            '{} newsfeeds going to fanout, 3 batches created.'.format(
+                len(followers),
+            ),
+        )
+        self.assertEqual(NewsFeed.objects.count(), len(followers))
+        for follower in followers:
+            cached_newsfeeds = NewsFeedService.get_cached_newsfeeds(follower.id)
+            self.assertEqual(len(cached_newsfeeds), 1)
+            self.assertEqual(cached_newsfeeds[0].tweet_id, tweet.id)
+
+    def test_fanout_batch_task_is_idempotent(self):
+        tweet = self.create_tweet(self.user1)
+        follower_ids = [self.user2.id]
+        # Only cached lists are pushed to
+        NewsFeedService.get_cached_newsfeeds(self.user2.id)
+        msg = fanout_newsfeeds_batch_task(tweet.id, follower_ids)
+        self.assertEqual(msg, '1 newsfeeds created')
+
+        # Retrying the same batch does not create or cache duplicates
+        msg = fanout_newsfeeds_batch_task(tweet.id, follower_ids)
+        self.assertEqual(msg, '0 newsfeeds created')
+        self.assertEqual(
+            NewsFeed.objects.filter(user=self.user2, tweet=tweet).count(),
+            1,
+        )
+        cached_newsfeeds = NewsFeedService.get_cached_newsfeeds(self.user2.id)
+        self.assertEqual(len(cached_newsfeeds), 1)
+
+    def test_fanout_batch_task_retry_pushes_created_rows(self):
+        tweet = self.create_tweet(self.user1)
+        NewsFeedService.get_cached_newsfeeds(self.user2.id)
+        # A previous attempt created the row and failed before the push
+        NewsFeedService.bulk_create_newsfeeds(tweet, [self.user2.id])
+
+        msg = fanout_newsfeeds_batch_task(tweet.id, [self.user2.id])
+        self.assertEqual(msg, '0 newsfeeds created')
+        cached_newsfeeds = NewsFeedService.get_cached_newsfeeds(self.user2.id)
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in cached_newsfeeds],
+            [tweet.id],
+        )
+
+    def test_fanout_keeps_tweet_created_at(self):
+        tweet = self.create_tweet(self.user1)
+        # The fanout lags behind the tweet
+        Tweet.objects.filter(id=tweet.id).update(
+            created_at=tweet.created_at - timedelta(minutes=1),
+        )
+        tweet.refresh_from_db()
+        self.clear_cache()
+        fanout_newsfeeds_batch_task(tweet.id, [self.user2.id])
+        newsfeed = NewsFeed.objects.get(user=self.user2, tweet=tweet)
+        self.assertEqual(newsfeed.created_at, tweet.created_at)
+
+        tweet.delete()
+        msg = fanout_newsfeeds_batch_task(tweet.id, [self.user2.id])
+        self.assertEqual(msg, 'Tweet deleted, no newsfeeds created')
+
+    def test_fanout_skips_lists_not_cached(self):
+        tweet = self.create_tweet(self.user1)
+        fanout_newsfeeds_batch_task(tweet.id, [self.user2.id])
+        conn = RedisClient.get_connection()
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=self.user2.id)
+        self.assertEqual(conn.exists(key), 0)
+
+    def test_celebrity_flag_is_persisted(self):
+        self.assertFalse(NewsFeedService.is_celebrity(self.user2.id))
+        NewsFeedService.mark_as_celebrity(self.user2.id)
+        self.assertTrue(self.user2.profile.is_celebrity)
+
+        # The cached set is reloaded from db
+        RedisClient.clear()
+        self.assertTrue(NewsFeedService.is_celebrity(self.user2.id))
+        self.assertFalse(NewsFeedService.is_celebrity(self.user1.id))
+        Friendship.objects.create(from_user=self.user1, to_user=self.user2)
+        self.assertEqual(
+            NewsFeedService.get_followed_celebrity_ids(self.user1.id),
+            [self.user2.id],
+        )
+
+    def test_merged_newsfeeds_read_celebrity_head(self):
+        tweet_ids = [self.create_tweet(self.user2).id for i in range(5)]
+        tweet_ids = tweet_ids[::-1]
+
+        newsfeeds, is_complete = NewsFeedService.get_cached_merged_newsfeeds(
+            self.user1.id,
+            [self.user2.id],
+            limit=3,
+        )
+        # Only tweets newer than the oldest one read are known to be complete
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+            tweet_ids[:2],
+        )
+        self.assertFalse(is_complete)
+
+        newsfeeds, is_complete = NewsFeedService.get_cached_merged_newsfeeds(
+            self.user1.id,
+            [self.user2.id],
+            limit=10,
+        )
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+            tweet_ids,
+        )
+        self.assertTrue(is_complete)
+
+
+@override_settings(NEWSFEED_SHARDS=['default', 'newsfeed_shard_1'])
+class NewsFeedShardingTests(TestCase):
+    databases = {'default', 'newsfeed_shard_1'}
+
+    def setUp(self):
+        self.clear_cache()
+        self.users = [self.create_user('user{}'.format(i)) for i in range(4)]
+        self.tweet = self.create_tweet(self.users[0])
+
+    def test_shard_map(self):
+        self.assertEqual(get_shard(2), 'default')
+        self.assertEqual(get_shard(3), 'newsfeed_shard_1')
+        self.assertEqual(
+            group_by_shard([1, 2, 3, 4]),
+            {'default': [2, 4], 'newsfeed_shard_1': [1, 3]},
+        )
+
+    def test_newsfeeds_are_routed(self):
+        for user in self.users:
+            self.create_newsfeed(user, self.tweet)
+        for user in self.users:
+            shard = get_shard(user.id)
+            self.assertEqual(
+                NewsFeed.objects.using(shard).filter(user=user).count(),
+                1,
+            )
+            self.assertEqual(NewsFeed.objects.for_user(user.id).count(), 1)
+            # the newsfeed points to a tweet in default
+            newsfeed = NewsFeed.objects.for_user(user.id).first()
+            self.assertEqual(newsfeed.cached_tweet.id, self.tweet.id)
+        self.assertEqual(
+            NewsFeed.objects.using('default').count()
+            + NewsFeed.objects.using('newsfeed_shard_1').count(),
+            len(self.users),
+        )
+
+    def test_bulk_create_newsfeeds_per_shard(self):
+        user_ids = [user.id for user in self.users]
+        timings = NewsFeedService.bulk_create_newsfeeds(
+            self.tweet,
+            user_ids,
+        )
+        self.assertEqual(
+            sorted(shard for shard, _, _ in timings),
+            ['default', 'newsfeed_shard_1'],
+        )
+        for user_id in user_ids:
+            self.assertEqual(
+                NewsFeed.objects.for_user(user_id).filter(
+                    tweet=self.tweet,
+                ).count(),
+                1,
+            )
+
+    def test_fanout_batch_task(self):
+        user_ids = [user.id for user in self.users[1:]]
+        msg = fanout_newsfeeds_batch_task(self.tweet.id, user_ids)
+        self.assertEqual(msg, '3 newsfeeds created')
+        msg = fanout_newsfeeds_batch_task(self.tweet.id, user_ids)
+        self.assertEqual(msg, '0 newsfeeds created')
+        for user_id in user_ids:
+            cached_newsfeeds = NewsFeedService.get_cached_newsfeeds(user_id)
+            self.assertEqual(len(cached_newsfeeds), 1)
+
+    def test_list_reads_owning_shard(self):
+        user = next(
+            user for user in self.users
+            if get_shard(user.id) == 'newsfeed_shard_1'
+        )
+        newsfeed = self.create_newsfeed(user, self.tweet)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/newsfeeds/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['id'] for result in response.data['results']],
+            [newsfeed.id],
+        )
+
+    def test_delete_cleans_every_shard(self):
+        for user in self.users:
+            self.create_newsfeed(user, self.tweet)
+        client = APIClient()
+        client.force_authenticate(self.users[1])
+        # Cache the list of users[1] with the newsfeed in it
+        client.get('/api/newsfeeds/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tweet.delete()
+        for shard in ['default', 'newsfeed_shard_1']:
+            self.assertFalse(NewsFeed.objects.using(shard).exists())
+        # The newsfeed left in the cached list is skipped
+        response = client.get('/api/newsfeeds/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+        user = next(
+            user for user in self.users
+            if get_shard(user.id) == 'newsfeed_shard_1'
+        )
+        user_id = user.id
+        self.create_newsfeed(user, self.create_tweet(self.users[0]))
+        with self.captureOnCommitCallbacks(execute=True):
+            user.delete()
+        self.assertFalse(NewsFeed.objects.for_user(user_id).exists())
+
+
+class NewsFeedRetentionTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.user1 = self.create_user('user1')
+        self.user2 = self.create_user('user2')
+
+    def create_old_newsfeed(self, user, days):
+        tweet = self.create_tweet(user)
+        newsfeed = self.create_newsfeed(user, tweet)
+        created_at = utc_now() - timedelta(days=days)
+        NewsFeed.objects.filter(id=newsfeed.id).update(created_at=created_at)
+        return newsfeed
+
+    def test_prune_newsfeeds(self):
+        recent_newsfeed = self.create_old_newsfeed(self.user1, 1)
+        old_newsfeeds = [
+            self.create_old_newsfeed(self.user1, NEWSFEED_RETENTION_DAYS + i)
+            for i in range(1, 5)
+        ]
+        # Fewer newsfeeds than NEWSFEED_RETENTION_COUNT are all kept
+        for i in range(NEWSFEED_RETENTION_COUNT - 1):
+            self.create_old_newsfeed(self.user2, NEWSFEED_RETENTION_DAYS + 1)
+        NewsFeedService.get_cached_newsfeeds(self.user1.id)
+
+        self.assertEqual(NewsFeedService.prune_newsfeeds(dry_run=True), 2)
+        self.assertEqual(NewsFeed.objects.count(), 5 + 2)
+        self.assertIsNone(NewsFeedService.get_pruned_before(self.user1.id))
+
+        self.assertEqual(NewsFeedService.prune_newsfeeds(), 2)
+        kept_ids = set(NewsFeed.objects.filter(
+            user=self.user1,
+        ).values_list('id', flat=True))
+        self.assertEqual(kept_ids, {
+            recent_newsfeed.id,
+            old_newsfeeds[0].id,
+            old_newsfeeds[1].id,
+        })
+        self.assertEqual(NewsFeed.objects.filter(user=self.user2).count(), 2)
+        self.assertEqual(
+            NewsFeedService.get_pruned_before(self.user1.id),
+            NewsFeed.objects.get(id=old_newsfeeds[1].id).created_at,
+        )
+        self.assertIsNone(NewsFeedService.get_pruned_before(self.user2.id))
+        # The watermark is kept in db
+        self.clear_cache()
+        self.assertEqual(
+            NewsFeedService.get_pruned_before(self.user1.id),
+            NewsFeed.objects.get(id=old_newsfeeds[1].id).created_at,
+        )
+        # The cached list holding the deleted newsfeeds is dropped
+        conn = RedisClient.get_connection()
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=self.user1.id)
+        self.assertFalse(conn.exists(key))
+
+        self.assertEqual(NewsFeedService.prune_newsfeeds(), 0)
+
+    def test_prune_newsfeeds_in_chunks(self):
+        for user in [self.user1, self.user2]:
+            for i in range(1, 6):
+                self.create_old_newsfeed(user, NEWSFEED_RETENTION_DAYS + i)
+        self.assertEqual(NewsFeedService.prune_newsfeeds(chunk_size=2), 4)
+        for user in [self.user1, self.user2]:
+            self.assertEqual(
+                NewsFeed.objects.filter(user=user).count(),
+                NEWSFEED_RETENTION_COUNT,
+            )
+            self.assertIsNotNone(NewsFeedService.get_pruned_before(user.id))
+
+    def test_prune_newsfeeds_command_and_task(self):
+        for i in range(1, 6):
+            self.create_old_newsfeed(self.user1, NEWSFEED_RETENTION_DAYS + i)
+
+        out = StringIO()
+        call_command('prune_newsfeeds', '--dry-run', stdout=out)
+        self.assertEqual(out.getvalue(), '2 newsfeeds deleted.\n')
+        self.assertEqual(NewsFeed.objects.count(), 5)
+
+        msg = prune_newsfeeds_task()
+        self.assertEqual(msg, '2 newsfeeds deleted.')
+        self.assertEqual(NewsFeed.objects.count(), NEWSFEED_RETENTION_COUNT)
@@ -1,6 +1,9 @@
+from contextlib import contextmanager
+
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.test import TestCase as DjangoTestCase
 from rest_framework.test import APIClient
 
@@ -8,14 +11,35 @@ from comments.models import Comment
 from likes.models import Like
 from newsfeeds.models import NewsFeed
 from tweets.models import Tweet
+from utils.local_cache import LocalCache
 from utils.redis_client import RedisClient
 
 
 class TestCase(DjangoTestCase):
+
+    @classmethod
+    @contextmanager
+    def captureOnCommitCallbacks(cls, *, using=DEFAULT_DB_ALIAS,
+                                 execute=False):
+        # Backport of the Django 3.2 method. Tests run in a transaction which
+        # is never committed, so on_commit callbacks are captured, and run
+        # when execute is True, once the block exits.
+        callbacks = []
+        start_count = len(connections[using].run_on_commit)
+        try:
+            yield callbacks
+        finally:
+            run_on_commit = connections[using].run_on_commit[start_count:]
+            callbacks[:] = [func for sids, func in run_on_commit]
+            if execute:
+                for callback in callbacks:
+                    callback()
+
     def clear_cache(self):
         # clear cache before each test case
         caches['testing'].clear()
         RedisClient.clear()
+        LocalCache.clear()
 
     @property
     def anonymous_client(self):
@@ -51,5 +75,8 @@ class TestCase(DjangoTestCase):
         return instance
 
     def create_newsfeed(self, user, tweet):
-        instance, _ = NewsFeed.objects.get_or_create(user=user, tweet=tweet)
+        instance, _ = NewsFeed.objects.for_user(user.id).get_or_create(
+            user=user,
+            tweet=tweet,
+        )
         return instance
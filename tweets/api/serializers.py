@@ -2,12 +2,15 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from accounts.api.serializers import UserSerializerForTweet
+from accounts.services import UserService
 from comments.api.serializers import CommentSerializer
 from likes.api.serializers import LikeSerializer
 from likes.service import LikeService
 from tweets.constants import TWEET_PHOTOS_UPLOAD_LIMIT
 from tweets.models import Tweet
 from tweets.services import TweetService
+from utils.redis_helper import RedisHelper
+from utils.serializers import PrefetchListSerializer
 
 
 class TweetSerializer(serializers.ModelSerializer):
@@ -19,6 +22,7 @@ class TweetSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Tweet
+        list_serializer_class = PrefetchListSerializer
         fields = (
             'id',
             'user',
@@ -31,26 +35,48 @@ class TweetSerializer(serializers.ModelSerializer):
         )
 
     def get_comments_count(self, obj):
-        # comment_set property is provided by Django since Tweet is a
-        # foreign key for Comment
-        return obj.comment_set.count()
+        # Read the denormalized counter from redis instead of running
+        # obj.comment_set.count(), the tweet itself might come from a cache
+        # and hold a stale comments_count. Set by prefetch.
+        if hasattr(obj, '_cached_comments_count'):
+            return obj._cached_comments_count
+        return RedisHelper.get_count(Tweet, obj.id, 'comments_count')
 
     def get_likes_count(self, obj):
-        return obj.like_set.count()
+        # Set by prefetch
+        if hasattr(obj, '_cached_likes_count'):
+            return obj._cached_likes_count
+        return LikeService.get_likes_count(Tweet, obj.id)
 
     def get_has_liked(self, obj):
-        return LikeService.has_liked(self.context['request'].user, obj)
+        return LikeService.has_liked_in_context(self.context, obj)
+
+    def prefetch(self, tweets):
+        UserService.prefetch_users_through_cache(tweets)
+        LikeService.prefetch_has_liked(self.context, Tweet, tweets)
+        tweet_ids = [tweet.id for tweet in tweets]
+        photo_urls = TweetService.get_photo_urls(tweet_ids)
+        comments_counts = RedisHelper.get_counts(
+            Tweet,
+            tweet_ids,
+            'comments_count',
+        )
+        likes_counts = LikeService.get_likes_counts(Tweet, tweet_ids)
+        for tweet in tweets:
+            tweet._cached_photo_urls = photo_urls[tweet.id]
+            tweet._cached_comments_count = comments_counts[tweet.id]
+            tweet._cached_likes_count = likes_counts[tweet.id]
 
     def get_photo_urls(self, obj):
-        photo_urls = []
-        for photo in obj.tweetphoto_set.all().order_by('order'):
-            photo_urls.append(photo.file.url)
-        return photo_urls
+        # Set by prefetch
+        if hasattr(obj, '_cached_photo_urls'):
+            return obj._cached_photo_urls
+        return TweetService.get_photo_urls([obj.id])[obj.id]
 
 
 class TweetSerializerForDetail(TweetSerializer):
     comments = CommentSerializer(source='comment_set', many=True)
-    likes = LikeSerializer(source='like_set', many=True)
+    likes = serializers.SerializerMethodField()
 
     class Meta:
         model = Tweet
@@ -67,6 +93,22 @@ class TweetSerializerForDetail(TweetSerializer):
             'created_at',
         )
 
+    def get_likes(self, obj):
+        # Merges the likes which are still buffered, same as likes_count
+        return LikeSerializer(
+            LikeService.get_likes(Tweet, obj.id),
+            many=True,
+            context=self.context,
+        ).data
+
+
+class TweetSerializerForNotification(serializers.ModelSerializer):
+    # Only what the cached tweet holds, no counters or user to look up
+
+    class Meta:
+        model = Tweet
+        fields = ('id', 'user_id', 'content', 'created_at')
+
 
 class TweetSerializerForCreate(serializers.ModelSerializer):
     content = serializers.CharField(min_length=6, max_length=144)
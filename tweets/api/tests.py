@@ -3,6 +3,7 @@ from rest_framework.test import APIClient
 
 from testing.testcases import TestCase
 from tweets.models import Tweet, TweetPhoto
+from tweets.services import TweetService
 from utils.paginations import EndlessPagination
 
 # Caution: has to add '/' at end to avoid 301 redirect
@@ -33,6 +34,8 @@ class TweetApiTests(TestCase):
         # User_id required
         response = self.anonymous_client.get(TWEET_LIST_API)
         self.assertEqual(response.status_code, 400)
+        response = self.anonymous_client.get(TWEET_LIST_API, {'user_id': 'a'})
+        self.assertEqual(response.status_code, 400)
 
         # Normal request
         response = self.anonymous_client.get(
@@ -204,3 +207,33 @@ class TweetApiTests(TestCase):
         self.assertEqual(response.data['has_next_page'], False)
         self.assertEqual(len(response.data['results']), 1)
         self.assertEqual(response.data['results'][0]['id'], new_tweet.id)
+
+    def test_cursor_pagination(self):
+        page_size = EndlessPagination.page_size
+        for i in range(2 * page_size):
+            self.tweets1.append(self.create_tweet(self.user1, f'tweet{i}'))
+        # Tweets created in the same microsecond are neither skipped nor
+        # duplicated across pages
+        Tweet.objects.filter(user=self.user1).update(
+            created_at=self.tweets1[0].created_at,
+        )
+        TweetService.invalidate_cached_tweets(self.user1.id)
+        expected_ids = [tweet.id for tweet in self.tweets1[::-1]]
+
+        tweet_ids = []
+        params = {'user_id': self.user1.id}
+        while True:
+            response = self.anonymous_client.get(TWEET_LIST_API, params)
+            self.assertEqual(response.status_code, 200)
+            tweet_ids.extend(tweet['id'] for tweet in response.data['results'])
+            if not response.data['has_next_page']:
+                self.assertIsNone(response.data['next_cursor'])
+                break
+            params['cursor'] = response.data['next_cursor']
+        self.assertEqual(tweet_ids, expected_ids)
+
+        response = self.anonymous_client.get(TWEET_LIST_API, {
+            'user_id': self.user1.id,
+            'cursor': 'not a cursor',
+        })
+        self.assertEqual(response.status_code, 400)
@@ -12,3 +12,7 @@ TWEET_PHOTO_STATUS_CHOICES = (
 
 
 TWEET_PHOTOS_UPLOAD_LIMIT = 9
+
+# Signed S3 urls expire after AWS_QUERYSTRING_EXPIRE (1 hour by default), the
+# cached photo urls must expire before them
+TWEET_PHOTO_URLS_CACHE_TIMEOUT = 30 * 60
@@ -0,0 +1,25 @@
+def push_tweet_to_cache(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    from tweets.services import TweetService
+    TweetService.push_tweet_to_cache(instance)
+
+
+def invalidate_cached_tweets(sender, instance, created=False, **kwargs):
+    # Newly created tweets are pushed by push_tweet_to_cache, an update or a
+    # delete would leave a stale copy in the cached list, so drop the list and
+    # let the next read load it from db again
+    if created:
+        return
+
+    from tweets.services import TweetService
+    TweetService.invalidate_cached_tweets(instance.user_id)
+
+
+def invalidate_photo_urls(sender, instance, **kwargs):
+    if instance.tweet_id is None:
+        return
+
+    from tweets.services import TweetService
+    TweetService.invalidate_photo_urls(instance.tweet_id)
@@ -0,0 +1,79 @@
+import pickle
+import timeit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from accounts.models import UserProfile
+from tweets.models import Tweet
+from utils.cache_serializers import CompactModelSerializer
+from utils.time_helpers import utc_now
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the size and the encode/decode time of the cached model '
+        'objects between pickle and CompactModelSerializer.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=10000,
+            help='Number of encodes and decodes timed per object.',
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        now = utc_now()
+        user = User(
+            id=1,
+            username='linghu',
+            email='linghu@twitter.com',
+            password='pbkdf2_sha256$216000$salt$' + 'x' * 44,
+            date_joined=now,
+        )
+        profile = UserProfile(
+            id=1,
+            user_id=user.id,
+            nickname='linghu',
+            avatar='avatar.png',
+            created_at=now,
+            updated_at=now,
+        )
+        # What the objects look like after being serialized once, pickle
+        # takes the memoized attributes along
+        user._cached_user_profile = profile
+        tweet = Tweet(id=1, user_id=user.id, content='x' * 140, created_at=now)
+        tweet._cached_user = user
+
+        self.stdout.write('{:<12} {:>12} {:>12} {:>12} {:>12}'.format(
+            'object', 'pickle B', 'compact B', 'pickle us', 'compact us',
+        ))
+        for obj in [user, profile, tweet]:
+            self.benchmark(obj, iterations)
+
+    def benchmark(self, obj, iterations):
+        model_class = obj.__class__
+        pickled = pickle.dumps(obj)
+        compact = CompactModelSerializer.serialize(obj)
+
+        pickle_seconds = timeit.timeit(
+            lambda: pickle.loads(pickle.dumps(obj)),
+            number=iterations,
+        )
+        compact_seconds = timeit.timeit(
+            lambda: CompactModelSerializer.deserialize(
+                model_class,
+                CompactModelSerializer.serialize(obj),
+            ),
+            number=iterations,
+        )
+        self.stdout.write('{:<12} {:>12} {:>12} {:>12.2f} {:>12.2f}'.format(
+            model_class.__name__,
+            len(pickled),
+            len(compact),
+            pickle_seconds / iterations * 10 ** 6,
+            compact_seconds / iterations * 10 ** 6,
+        ))
@@ -0,0 +1,131 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db.models import F, Func, IntegerField, OuterRef, Subquery
+
+from accounts.models import UserProfile
+from comments.models import Comment
+from friendships.models import Friendship
+from likes.models import Like
+from tweets.models import Tweet
+from utils.redis_helper import RedisHelper
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the denormalized likes_count and comments_count of tweets '
+        'and comments, the followers_count and followings_count of user '
+        'profiles, and repair the rows that drifted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of objects recomputed per batch.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the drifted objects, do not repair them.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        repaired = self.repair(
+            Tweet,
+            {
+                'likes_count': self.count_likes(Tweet),
+                'comments_count': self.count_comments(),
+            },
+            batch_size,
+            dry_run,
+        )
+        self.stdout.write(f'{repaired} tweet counters repaired.')
+
+        repaired = self.repair(
+            Comment,
+            {'likes_count': self.count_likes(Comment)},
+            batch_size,
+            dry_run,
+        )
+        self.stdout.write(f'{repaired} comment counters repaired.')
+
+        repaired = self.repair(
+            UserProfile,
+            {
+                'followers_count': self.count_friendships('to_user_id'),
+                'followings_count': self.count_friendships('from_user_id'),
+            },
+            batch_size,
+            dry_run,
+        )
+        self.stdout.write(f'{repaired} user profile counters repaired.')
+
+    @classmethod
+    def count_subquery(cls, queryset):
+        # SELECT COUNT(id) without a GROUP BY, it is 0 for an empty subquery
+        return Subquery(
+            queryset.order_by().annotate(
+                count=Func(F('id'), function='COUNT'),
+            ).values('count'),
+            output_field=IntegerField(),
+        )
+
+    @classmethod
+    def count_likes(cls, model_class):
+        content_type = ContentType.objects.get_for_model(model_class)
+        return cls.count_subquery(Like.objects.filter(
+            content_type=content_type,
+            object_id=OuterRef('id'),
+        ))
+
+    @classmethod
+    def count_comments(cls):
+        return cls.count_subquery(Comment.objects.filter(
+            tweet_id=OuterRef('id'),
+        ))
+
+    @classmethod
+    def count_friendships(cls, user_id_field):
+        return cls.count_subquery(Friendship.objects.filter(**{
+            user_id_field: OuterRef('user_id'),
+        }))
+
+    @classmethod
+    def repair(cls, model_class, counters, batch_size, dry_run):
+        repaired = 0
+        attrs = list(counters.keys())
+        last_id = 0
+        while True:
+            # Walk the table by primary key ranges to keep every query small
+            rows = list(
+                model_class.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .annotate(**{
+                    'actual_' + attr: count
+                    for attr, count in counters.items()
+                })
+                .values('id', *attrs, *['actual_' + attr for attr in attrs])
+                [:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+
+            for row in rows:
+                for attr in attrs:
+                    if row[attr] == row['actual_' + attr]:
+                        continue
+                    repaired += 1
+                    if dry_run:
+                        continue
+                    # Recount inside the UPDATE itself, a like or comment
+                    # created since the row was read is counted exactly once
+                    model_class.objects.filter(id=row['id']).update(**{
+                        attr: counters[attr],
+                    })
+                    RedisHelper.invalidate_count(model_class, row['id'], attr)
+        return repaired
@@ -0,0 +1,19 @@
+# Generated by Django 3.1.13 on 2026-10-18 11:03
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tweets', '0005_auto_20261018_1035'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='tweet',
+            index_together={('user', 'created_at', 'id')},
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+from django.db.models import F, Func, OuterRef, Subquery
+
+
+def count_subquery(queryset):
+    return Subquery(
+        queryset.order_by().annotate(
+            count=Func(F('id'), function='COUNT'),
+        ).values('count'),
+        output_field=models.IntegerField(),
+    )
+
+
+def backfill_counters(apps, schema_editor):
+    # The counters were added with 0 for every existing tweet, count the
+    # likes and comments which already exist
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Like = apps.get_model('likes', 'Like')
+    Comment = apps.get_model('comments', 'Comment')
+    Tweet = apps.get_model('tweets', 'Tweet')
+    counters = {
+        'comments_count': count_subquery(Comment.objects.filter(
+            tweet_id=OuterRef('id'),
+        )),
+    }
+    content_type = ContentType.objects.filter(
+        app_label='tweets',
+        model='tweet',
+    ).first()
+    # Content types are only created after the first migrate, there are no
+    # likes before that
+    if content_type is not None:
+        counters['likes_count'] = count_subquery(Like.objects.filter(
+            content_type_id=content_type.id,
+            object_id=OuterRef('id'),
+        ))
+    Tweet.objects.update(**counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('comments', '0004_auto_20261018_1103'),
+        ('likes', '0002_auto_20230301_1952'),
+        ('tweets', '0006_auto_20261018_1103'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
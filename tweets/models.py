@@ -1,11 +1,15 @@
 from django.contrib.auth.models import User
-from django.contrib.contenttypes.models import ContentType
 from django.db import models
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_delete, post_save, pre_delete
 
-from likes.models import Like
+from likes.service import LikeService
 from tweets.constants import TWEET_PHOTO_STATUS_CHOICES, TweetPhotoStatus
-from utils.listeners import invalidate_object_cache
+from tweets.listeners import (
+    invalidate_cached_tweets,
+    invalidate_photo_urls,
+    push_tweet_to_cache,
+)
+from utils.listeners import invalidate_object_cache, update_object_cache
 from utils.memcached_helper import MemchachedHelper
 from utils.time_helpers import utc_now
 
@@ -15,8 +19,16 @@ class Tweet(models.Model):
     content = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized counters so serializers don't run COUNT(*) per tweet.
+    # They are updated atomically with F() expressions by the like and
+    # comment listeners. The rows which existed before the columns were
+    # added are back filled by a data migration.
+    likes_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
+
     class Meta:
-        index_together = (('user', 'created_at'), )
+        # id breaks created_at ties for keyset pagination
+        index_together = (('user', 'created_at', 'id'), )
         ordering = ('user', '-created_at')
 
     def __str__(self):
@@ -28,13 +40,15 @@ class Tweet(models.Model):
 
     @property
     def like_set(self):
-        return Like.objects.filter(
-            content_type=ContentType.objects.get_for_model(Tweet),
-            object_id=self.id,
-        ).order_by('-created_at')
+        return LikeService.likes_for_tweet_ids([self.id]).order_by(
+            '-created_at',
+        )
 
     @property
     def cached_user(self):
+        # Set by UserService.prefetch_users_through_cache
+        if hasattr(self, '_cached_user'):
+            return self._cached_user
         return MemchachedHelper.get_object_through_cache(User, self.user_id)
 
 
@@ -74,5 +88,10 @@ class TweetPhoto(models.Model):
         return f'{self.tweet_id}: {self.file}'
 
 
-post_save.connect(invalidate_object_cache, sender=Tweet)
+post_save.connect(update_object_cache, sender=Tweet)
 pre_delete.connect(invalidate_object_cache, sender=Tweet)
+post_save.connect(push_tweet_to_cache, sender=Tweet)
+post_save.connect(invalidate_cached_tweets, sender=Tweet)
+pre_delete.connect(invalidate_cached_tweets, sender=Tweet)
+post_save.connect(invalidate_photo_urls, sender=TweetPhoto)
+post_delete.connect(invalidate_photo_urls, sender=TweetPhoto)
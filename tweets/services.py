@@ -1,4 +1,13 @@
+from urllib.parse import urljoin
+
+from django.conf import settings
+
+from tweets.constants import TWEET_PHOTO_URLS_CACHE_TIMEOUT, TweetPhotoStatus
 from tweets.models import Tweet, TweetPhoto
+from twitter.cache import TWEET_PHOTO_URLS_PATTERN, USER_TWEETS_PATTERN
+from utils.memcached_helper import cache
+from utils.redis_client import RedisClient
+from utils.redis_helper import RedisHelper
 
 
 class TweetService(object):
@@ -15,3 +24,73 @@ class TweetService(object):
             )
             photos.append(photo)
         TweetPhoto.objects.bulk_create(photos)
+        # bulk_create does not send post_save
+        cls.invalidate_photo_urls(tweet.id)
+
+    @classmethod
+    def get_photo_url(cls, photo):
+        if settings.TWEET_PHOTO_CDN_URL:
+            return urljoin(settings.TWEET_PHOTO_CDN_URL, photo.file.name)
+        return photo.file.url
+
+    @classmethod
+    def get_photo_urls(cls, tweet_ids):
+        """
+        Return a dict of tweet id to the urls of its photos in order. Urls are
+        cached per tweet, the misses are read with one tweet_id__in query off
+        the (tweet, order) index. Deleted and rejected photos are left out.
+        """
+        key_to_tweet_id = {
+            TWEET_PHOTO_URLS_PATTERN.format(tweet_id=tweet_id): tweet_id
+            for tweet_id in set(tweet_ids)
+        }
+        photo_urls = {
+            key_to_tweet_id[key]: urls
+            for key, urls in cache.get_many(list(key_to_tweet_id)).items()
+        }
+        missing_ids = set(key_to_tweet_id.values()) - set(photo_urls)
+        if not missing_ids:
+            return photo_urls
+
+        missing_photo_urls = {tweet_id: [] for tweet_id in missing_ids}
+        photos = TweetPhoto.objects.filter(
+            tweet_id__in=missing_ids,
+            has_deleted=False,
+        ).exclude(
+            status=TweetPhotoStatus.REJECTED,
+        ).order_by('tweet_id', 'order')
+        for photo in photos:
+            missing_photo_urls[photo.tweet_id].append(cls.get_photo_url(photo))
+        cache.set_many({
+            TWEET_PHOTO_URLS_PATTERN.format(tweet_id=tweet_id): urls
+            for tweet_id, urls in missing_photo_urls.items()
+        }, timeout=TWEET_PHOTO_URLS_CACHE_TIMEOUT)
+        photo_urls.update(missing_photo_urls)
+        return photo_urls
+
+    @classmethod
+    def invalidate_photo_urls(cls, tweet_id):
+        cache.delete(TWEET_PHOTO_URLS_PATTERN.format(tweet_id=tweet_id))
+
+    @classmethod
+    def get_cached_tweets(cls, user_id, limit=None):
+        # Queryset is lazy, db is only hit when the cache misses
+        queryset = Tweet.objects.filter(user_id=user_id).order_by(
+            '-created_at',
+            '-id',
+        )
+        key = USER_TWEETS_PATTERN.format(user_id=user_id)
+        return RedisHelper.load_objects(key, queryset, limit)
+
+    @classmethod
+    def push_tweet_to_cache(cls, tweet):
+        queryset = Tweet.objects.filter(
+            user_id=tweet.user_id,
+        ).order_by('-created_at', '-id')
+        key = USER_TWEETS_PATTERN.format(user_id=tweet.user_id)
+        RedisHelper.push_object(key, tweet, queryset)
+
+    @classmethod
+    def invalidate_cached_tweets(cls, user_id):
+        conn = RedisClient.get_connection()
+        conn.delete(USER_TWEETS_PATTERN.format(user_id=user_id))
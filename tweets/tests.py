@@ -1,9 +1,18 @@
 from datetime import timedelta
+from io import StringIO
 
+from django.conf import settings
+from django.core.management import call_command
+from django.test import override_settings
+
+from comments.models import Comment
 from testing.testcases import TestCase
 from tweets.constants import TWEET_PHOTO_STATUS_CHOICES, TweetPhotoStatus
-from tweets.models import TweetPhoto
+from tweets.models import Tweet, TweetPhoto
+from tweets.services import TweetService
+from utils.memcached_helper import MemchachedHelper
 from utils.redis_client import RedisClient
+from utils.redis_helper import RedisHelper
 from utils.redis_serializers import DjangoModelSerializer
 from utils.time_helpers import utc_now
 
@@ -30,6 +39,76 @@ class TweetTests(TestCase):
         self.create_like(user2, self.tweet)
         self.assertEqual(self.tweet.like_set.count(), 2)
 
+    def test_denormalized_counts(self):
+        user2 = self.create_user('user2')
+        like = self.create_like(user2, self.tweet)
+        self.create_like(self.user1, self.tweet)
+        comment = self.create_comment(user2, self.tweet)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.likes_count, 2)
+        self.assertEqual(self.tweet.comments_count, 1)
+        self.assertEqual(
+            RedisHelper.get_count(Tweet, self.tweet.id, 'likes_count'), 2)
+        self.assertEqual(
+            RedisHelper.get_count(Tweet, self.tweet.id, 'comments_count'), 1)
+
+        like.delete()
+        comment.delete()
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.likes_count, 1)
+        self.assertEqual(self.tweet.comments_count, 0)
+        self.assertEqual(
+            RedisHelper.get_count(Tweet, self.tweet.id, 'likes_count'), 1)
+        self.assertEqual(
+            RedisHelper.get_count(Tweet, self.tweet.id, 'comments_count'), 0)
+
+        # Counts are back filled from db when missing in redis
+        RedisClient.clear()
+        self.assertEqual(
+            RedisHelper.get_count(Tweet, self.tweet.id, 'likes_count'), 1)
+
+        # A missing counter is back filled, not created from the delta
+        RedisClient.clear()
+        self.create_like(user2, self.tweet)
+        self.assertEqual(
+            RedisHelper.get_count(Tweet, self.tweet.id, 'likes_count'), 2)
+        # A counter cached meanwhile is not overwritten by the back fill
+        conn = RedisClient.get_connection()
+        key = RedisHelper.get_count_key(Tweet, self.tweet.id, 'likes_count')
+        conn.set(key, 3)
+        self.assertEqual(
+            RedisHelper._load_count_to_cache(Tweet, self.tweet.id,
+                                             'likes_count'),
+            3,
+        )
+        self.assertEqual(int(conn.get(key)), 3)
+
+    def test_repair_counters(self):
+        comment = self.create_comment(self.user1, self.tweet)
+        self.create_like(self.user1, self.tweet)
+        self.create_like(self.user1, comment)
+        Tweet.objects.filter(id=self.tweet.id).update(
+            likes_count=5,
+            comments_count=0,
+        )
+        Comment.objects.filter(id=comment.id).update(likes_count=0)
+
+        call_command('repair_counters', '--dry-run', stdout=StringIO())
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.likes_count, 5)
+
+        out = StringIO()
+        call_command('repair_counters', '--batch-size', '1', stdout=out)
+        self.assertIn('2 tweet counters repaired.', out.getvalue())
+        self.assertIn('1 comment counters repaired.', out.getvalue())
+        self.tweet.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(self.tweet.likes_count, 1)
+        self.assertEqual(self.tweet.comments_count, 1)
+        self.assertEqual(comment.likes_count, 1)
+        self.assertEqual(
+            RedisHelper.get_count(Tweet, self.tweet.id, 'likes_count'), 1)
+
     def test_create_photo(self):
         photo = TweetPhoto.objects.create(
             tweet=self.tweet,
@@ -50,3 +129,111 @@ class TweetTests(TestCase):
         data = conn.get(f'tweet:{tweet.id}')
         cached_tweet = DjangoModelSerializer.deserialize(data)
         self.assertEqual(cached_tweet.id, tweet.id)
+
+    def test_tweet_write_through(self):
+        self.tweet.content = 'new content'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tweet.save()
+        with self.assertNumQueries(0):
+            cached_tweet = MemchachedHelper.get_object_through_cache(
+                Tweet,
+                self.tweet.id,
+            )
+        self.assertEqual(cached_tweet.content, 'new content')
+
+    def test_write_through_out_of_order(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.tweet.content = 'first content'
+            self.tweet.save()
+            self.tweet.content = 'second content'
+            self.tweet.save()
+        # The callback of the older write runs last, the cache still ends up
+        # with the latest row
+        for callback in reversed(callbacks):
+            callback()
+        cached_tweet = MemchachedHelper.get_object_through_cache(
+            Tweet,
+            self.tweet.id,
+        )
+        self.assertEqual(cached_tweet.content, 'second content')
+
+
+class TweetServiceTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.user1 = self.create_user('user1')
+
+    def test_get_cached_tweets(self):
+        tweet_ids = []
+        for i in range(3):
+            tweet = self.create_tweet(self.user1, f'tweet {i}')
+            tweet_ids.append(tweet.id)
+        tweet_ids = tweet_ids[::-1]
+
+        RedisClient.clear()
+
+        # Cache miss
+        tweets = TweetService.get_cached_tweets(self.user1.id)
+        self.assertEqual([t.id for t in tweets], tweet_ids)
+
+        # Cache hit
+        tweets = TweetService.get_cached_tweets(self.user1.id)
+        self.assertEqual([t.id for t in tweets], tweet_ids)
+
+        # New tweet is pushed to the cached list
+        new_tweet = self.create_tweet(self.user1, 'new tweet')
+        tweets = TweetService.get_cached_tweets(self.user1.id)
+        tweet_ids.insert(0, new_tweet.id)
+        self.assertEqual([t.id for t in tweets], tweet_ids)
+
+        # Updated tweet is not served stale from the cached list
+        new_tweet.content = 'updated content'
+        new_tweet.save()
+        tweets = TweetService.get_cached_tweets(self.user1.id)
+        self.assertEqual(tweets[0].content, 'updated content')
+
+    def test_cached_tweets_length_limit(self):
+        limit = settings.REDIS_LIST_LENGTH_LIMIT
+        tweets = [self.create_tweet(self.user1) for _ in range(limit + 2)]
+
+        cached_tweets = TweetService.get_cached_tweets(self.user1.id)
+        self.assertEqual(len(cached_tweets), limit)
+        self.assertEqual(cached_tweets[0].id, tweets[-1].id)
+        self.assertEqual(cached_tweets[-1].id, tweets[2].id)
+
+    def test_get_photo_urls(self):
+        tweet1 = self.create_tweet(self.user1)
+        tweet2 = self.create_tweet(self.user1)
+        photos = [
+            TweetPhoto.objects.create(
+                tweet=tweet1,
+                user=self.user1,
+                file=f'photo{i}.jpg',
+                order=i,
+            )
+            for i in range(4)
+        ]
+        photos[1].has_deleted = True
+        photos[1].save()
+        photos[2].status = TweetPhotoStatus.REJECTED
+        photos[2].save()
+
+        with self.assertNumQueries(1):
+            photo_urls = TweetService.get_photo_urls([tweet1.id, tweet2.id])
+        self.assertEqual(photo_urls, {
+            tweet1.id: [photos[0].file.url, photos[3].file.url],
+            tweet2.id: [],
+        })
+        with self.assertNumQueries(0):
+            TweetService.get_photo_urls([tweet1.id, tweet2.id])
+
+        # Photo changes invalidate the cached urls
+        photos[0].delete()
+        photo_urls = TweetService.get_photo_urls([tweet1.id])
+        self.assertEqual(photo_urls[tweet1.id], [photos[3].file.url])
+
+        TweetService.invalidate_photo_urls(tweet1.id)
+        with override_settings(TWEET_PHOTO_CDN_URL='https://cdn.test/'):
+            photo_urls = TweetService.get_photo_urls([tweet1.id])
+        self.assertEqual(photo_urls[tweet1.id], ['https://cdn.test/photo3.jpg'])
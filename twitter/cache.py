@@ -1,2 +1,21 @@
 FOLLOWINGS_PATTERN = 'followings:{user_id}'
 USER_PROFILE_PATTERN = 'user_profile:{user_id}'
+USER_TWEETS_PATTERN = 'user_tweets:{user_id}'
+TWEET_PHOTO_URLS_PATTERN = 'tweet_photo_urls:{tweet_id}'
+USER_NEWSFEEDS_PATTERN = 'user_newsfeeds:{user_id}'
+TWEET_COMMENTS_PATTERN = 'tweet_comments:{tweet_id}'
+CELEBRITY_USER_IDS_KEY = 'celebrity_user_ids'
+USER_LIKED_OBJECT_IDS_PATTERN = 'user_liked_{model}:{user_id}'
+USER_UNREAD_NOTIFICATIONS_PATTERN = 'unread_notifications:{user_id}'
+NOTIFICATION_EVENTS_KEY = 'notification_events'
+NOTIFICATION_DELIVERY_SCHEDULED_KEY = 'notification_delivery_scheduled'
+DELIVERING_NOTIFICATION_EVENTS_KEY = 'delivering_notification_events'
+NOTIFICATION_DELIVERY_LOCK_KEY = 'notification_delivery_lock'
+PENDING_LIKES_KEY = 'pending_likes'
+FLUSHING_LIKES_KEY = 'flushing_likes'
+PENDING_LIKES_COUNTS_KEY = 'pending_likes_counts'
+USER_BUFFERED_LIKES_PATTERN = 'user_buffered_likes:{user_id}'
+OBJECT_BUFFERED_LIKES_PATTERN = \
+    'object_buffered_likes:{content_type_id}:{object_id}'
+LIKES_FLUSH_SCHEDULED_KEY = 'likes_flush_scheduled'
+LIKES_FLUSH_LOCK_KEY = 'likes_flush_lock'
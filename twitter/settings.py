@@ -78,6 +78,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'utils.middlewares.LocalCacheMiddleware',
     # "debug_toolbar.middleware.DebugToolbarMiddleware",
 ]
 
@@ -170,9 +171,23 @@ if TESTING:
 # Based on your setup in AWS S3
 AWS_STORAGE_BUCKET_NAME = 'twitter-2.0'
 AWS_S3_REGION_NAME = 'us-west-1'
+# Serve tweet photos as unsigned urls under this CDN base url, e.g.
+# 'https://cdn.example.com/', instead of signing every url with boto
+TWEET_PHOTO_CDN_URL = None
 
 MEDIA_ROOT = '/media/'
 
+# NewsFeed rows are sharded by user_id over these database aliases, see
+# newsfeeds/sharding.py. Aliases other than default only hold newsfeeds.
+NEWSFEED_SHARDS = ['default']
+DATABASE_ROUTERS = ['newsfeeds.sharding.NewsFeedRouter']
+if TESTING:
+    # Extra shard for the sharding tests, see newsfeeds/tests.py
+    DATABASES['newsfeed_shard_1'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'newsfeed_shard_1',
+    }
+
 
 # https://docs.djangoproject.com/en/3.1/topics/cache/
 CACHES = {
@@ -189,14 +204,80 @@ CACHES = {
     }
 }
 
+# In-process caches in front of memcached, see utils/local_cache.py. The
+# request cache is dropped at the end of each request. The process cache is
+# shared across requests and can only expire by ttl, so keep the ttl short.
+REQUEST_LOCAL_CACHE_MAX_SIZE = 1000
+PROCESS_LOCAL_CACHE_ENABLED = False
+PROCESS_LOCAL_CACHE_MAX_SIZE = 500
+PROCESS_LOCAL_CACHE_TTL = 5  # seconds
+
+# Cache stampede protection, see MemchachedHelper.get_or_load. On a miss
+# only the holder of the lease reads db, the others serve the stale copy or
+# wait for it.
+CACHE_LEASE_TIMEOUT = 5  # seconds
+CACHE_LEASE_WAIT_TIMEOUT = 0.5  # seconds
+CACHE_LEASE_POLL_INTERVAL = 0.05  # seconds
+CACHE_STALE_TIMEOUT = 60  # seconds
+# Larger beta refreshes hot keys earlier before they expire
+CACHE_EARLY_REFRESH_BETA = 1.0
+# Write saved users, profiles and tweets into the cache on commit instead of
+# deleting them, so the next read does not have to hit db
+CACHE_WRITE_THROUGH = True
+
 # Redis
 REDIS_HOST = 'redis'
 REDIS_PORT = 6379
 REDIS_DB = 0 if TESTING else 1
 REDIS_KEY_EXPIRE_TIME = 7 * 86400  # 7 days
+# Max number of objects kept in a cached redis list, e.g. tweets of a user
+REDIS_LIST_LENGTH_LIMIT = 1000 if not TESTING else 20
+# Cache the ids of the objects each user has liked in redis sets, so has_liked
+# checks of a page don't hit the db at all
+REDIS_CACHE_LIKED_OBJECT_IDS = False
+# Acknowledge likes and unlikes once they are recorded in redis, and write
+# them to db in batches a few seconds later, see LikeService.flush_likes
+LIKE_WRITE_BEHIND = False
+
+# Users with at least this many followers are treated as celebrities. Their
+# tweets are not fanned out, followers pull them when reading newsfeeds.
+CELEBRITY_FOLLOWERS_THRESHOLD = 100000 if not TESTING else 10
+
+# Celery
+# https://docs.celeryq.dev/en/stable/django/first-steps-with-django.html
+CELERY_BROKER_URL = 'redis://{}:{}/{}'.format(
+    REDIS_HOST,
+    REDIS_PORT,
+    2 if not TESTING else 0,
+)
+CELERY_TIMEZONE = 'UTC'
+# Run tasks locally in the calling process when testing, no worker needed
+CELERY_TASK_ALWAYS_EAGER = TESTING
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'newsfeeds.tasks.fanout_newsfeeds_batch_task': {'queue': 'newsfeeds'},
+}
+CELERY_BEAT_SCHEDULE = {
+    'prune-newsfeeds': {
+        'task': 'newsfeeds.tasks.prune_newsfeeds_task',
+        'schedule': 24 * 60 * 60,
+    },
+    'reconcile-unread-counts': {
+        'task': 'inbox.tasks.reconcile_unread_counts_task',
+        'schedule': 60 * 60,
+    },
+}
 
 # Load local developing settings
 try:
     from .local_settings import *
 except:
     pass
+
+if LIKE_WRITE_BEHIND:
+    # Likes schedule their own flush, this picks up whatever a failed or
+    # skipped flush left in the buffer
+    CELERY_BEAT_SCHEDULE['flush-likes'] = {
+        'task': 'likes.tasks.flush_likes_task',
+        'schedule': 60,
+    }
@@ -0,0 +1,50 @@
+import pickle
+import zlib
+
+# Bump it when the encoding below changes. Field changes of a model are
+# picked up by get_schema_version automatically.
+CODEC_VERSION = 1
+
+
+class CompactModelSerializer:
+    """
+    Encode a model instance as the tuple of its concrete field values only,
+    instead of pickling the whole instance with its _state, model path and
+    any attributes memoized on it like _cached_user_profile. Cache keys
+    carry get_schema_version, so after a deploy which changes the fields
+    of a model the old values are never read, they simply expire.
+    """
+
+    _schema_versions = {}
+
+    @classmethod
+    def get_schema_version(cls, model_class):
+        if model_class not in cls._schema_versions:
+            attnames = ','.join(
+                field.attname
+                for field in model_class._meta.concrete_fields
+            )
+            cls._schema_versions[model_class] = 'v{}.{:x}'.format(
+                CODEC_VERSION,
+                zlib.crc32(attnames.encode()),
+            )
+        return cls._schema_versions[model_class]
+
+    @classmethod
+    def serialize(cls, instance):
+        # get_prep_value turns FieldFile into its name, everything else we
+        # have is already a builtin type
+        values = tuple(
+            field.get_prep_value(getattr(instance, field.attname))
+            for field in instance._meta.concrete_fields
+        )
+        return pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def deserialize(cls, model_class, serialized_data):
+        values = pickle.loads(serialized_data)
+        attnames = [
+            field.attname
+            for field in model_class._meta.concrete_fields
+        ]
+        return model_class.from_db(None, attnames, values)
@@ -2,3 +2,19 @@ def invalidate_object_cache(sender, instance, **kwargs):
     from utils.memcached_helper import MemchachedHelper
 
     MemchachedHelper.invalidate_object_cache(sender, instance.id)
+
+
+def update_object_cache(sender, instance, **kwargs):
+    from django.conf import settings
+    from utils.memcached_helper import MemchachedHelper
+    from utils.transactions import run_on_commit
+
+    if not settings.CACHE_WRITE_THROUGH:
+        MemchachedHelper.invalidate_object_cache(sender, instance.id)
+        return
+
+    # Write the committed row into the cache, so the next read is still a
+    # cache hit
+    run_on_commit(
+        lambda: MemchachedHelper.update_object_cache(sender, instance.id),
+    )
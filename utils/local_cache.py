@@ -0,0 +1,155 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+class LRUCache:
+    """
+    A small thread safe LRU dict. Entries older than ttl seconds are treated
+    as missing, ttl=None means they never expire.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            expire_at, value = self._data[key]
+            if expire_at is not None and expire_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expire_at = None
+        if self.ttl is not None:
+            expire_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expire_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Only set while a request is being handled, see LocalCacheMiddleware
+_request_cache = ContextVar('request_cache', default=None)
+_process_cache = None
+
+
+class LocalCache:
+    """
+    In-process L1 cache in front of memcached, keyed the same way.
+
+    The request cache lives for one request only, so within a request the
+    same User or Tweet is read from memcached at most once. It is off
+    outside requests, e.g. in celery tasks.
+
+    The process cache is shared by all requests of the process and only
+    used when PROCESS_LOCAL_CACHE_ENABLED is on. Other processes can not
+    invalidate it, so its entries live PROCESS_LOCAL_CACHE_TTL seconds at
+    most. Values are stored pickled, so requests never share an instance.
+    """
+
+    @classmethod
+    @contextmanager
+    def request_scope(cls):
+        token = _request_cache.set(
+            LRUCache(settings.REQUEST_LOCAL_CACHE_MAX_SIZE),
+        )
+        try:
+            yield
+        finally:
+            _request_cache.reset(token)
+
+    @classmethod
+    def _get_process_cache(cls):
+        global _process_cache
+        if not settings.PROCESS_LOCAL_CACHE_ENABLED:
+            return None
+        if _process_cache is None:
+            _process_cache = LRUCache(
+                settings.PROCESS_LOCAL_CACHE_MAX_SIZE,
+                settings.PROCESS_LOCAL_CACHE_TTL,
+            )
+        return _process_cache
+
+    @classmethod
+    def get(cls, key):
+        request_cache = _request_cache.get()
+        if request_cache is not None:
+            value = request_cache.get(key)
+            if value is not None:
+                return value
+
+        process_cache = cls._get_process_cache()
+        if process_cache is None:
+            return None
+        data = process_cache.get(key)
+        if data is None:
+            return None
+        value = pickle.loads(data)
+        if request_cache is not None:
+            request_cache.set(key, value)
+        return value
+
+    @classmethod
+    def get_many(cls, keys):
+        values = {}
+        for key in keys:
+            value = cls.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    @classmethod
+    def set(cls, key, value):
+        request_cache = _request_cache.get()
+        if request_cache is not None:
+            request_cache.set(key, value)
+        process_cache = cls._get_process_cache()
+        if process_cache is not None:
+            process_cache.set(key, pickle.dumps(value))
+
+    @classmethod
+    def set_many(cls, mapping):
+        for key, value in mapping.items():
+            cls.set(key, value)
+
+    @classmethod
+    def delete(cls, key):
+        request_cache = _request_cache.get()
+        if request_cache is not None:
+            request_cache.delete(key)
+        process_cache = cls._get_process_cache()
+        if process_cache is not None:
+            process_cache.delete(key)
+
+    @classmethod
+    def clear(cls):
+        request_cache = _request_cache.get()
+        if request_cache is not None:
+            request_cache.clear()
+        if _process_cache is not None:
+            _process_cache.clear()
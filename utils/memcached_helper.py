@@ -1,5 +1,13 @@
+import math
+import random
+import time
+
 from django.conf import settings
 from django.core.cache import caches
+from django.db import transaction
+
+from utils.cache_serializers import CompactModelSerializer
+from utils.local_cache import LocalCache
 
 cache = caches['testing'] if settings.TESTING else caches['default']
 
@@ -11,21 +19,236 @@ class MemchachedHelper:
         return '{}:{}'.format(model_class.__name__, object_id)
 
     @classmethod
-    def get_object_through_cache(cls, model_class, object_id):
-        key = cls.get_key(model_class, object_id)
+    def _get_versioned_key(cls, model_class, key):
+        return '{}:{}'.format(
+            key,
+            CompactModelSerializer.get_schema_version(model_class),
+        )
+
+    @classmethod
+    def _get_lease_key(cls, key):
+        return 'lease:{}'.format(key)
+
+    @classmethod
+    def _get_stale_key(cls, key):
+        return 'stale:{}'.format(key)
+
+    @classmethod
+    def _wrap(cls, value, delta=0):
+        # Remember when the value expires and how long it took to load, which
+        # is what the early refresh needs
+        expire_at = time.time() + cache.default_timeout
+        return expire_at, delta, value
+
+    @classmethod
+    def _should_refresh_early(cls, expire_at, delta):
+        # Probabilistic early expiration (XFetch). The closer to expire_at
+        # and the slower the load, the more likely a reader refreshes the
+        # value before it actually expires, so hot keys never expire for
+        # everyone at the same time.
+        if not delta:
+            return False
+        beta = settings.CACHE_EARLY_REFRESH_BETA
+        gap = -delta * beta * math.log(1 - random.random())
+        return time.time() + gap >= expire_at
+
+    @classmethod
+    def _load_and_set(cls, key, load, overwrite=False):
+        start = time.time()
+        value = load()
+        envelope = cls._wrap(value, time.time() - start)
+        if overwrite:
+            cache.set(key, envelope)
+        else:
+            # A value written through while we were reading db is newer than
+            # ours, add does not overwrite it
+            cache.add(key, envelope)
+        return value
+
+    @classmethod
+    def get_or_load(cls, key, load):
+        """
+        Read key from memcached and call load() to fill it on a miss. Only
+        the request holding the lease calls load(), the others serve the
+        stale copy kept by invalidate(), or wait for the loader for at most
+        CACHE_LEASE_WAIT_TIMEOUT seconds before loading by themselves.
+        """
+        lease_key = cls._get_lease_key(key)
+        envelope = cache.get(key)
+        if envelope is not None:
+            expire_at, delta, value = envelope
+            if not cls._should_refresh_early(expire_at, delta):
+                return value
+            # Refresh early only if no one else is, the others keep using
+            # the value which is still valid
+            if not cache.add(lease_key, 1, settings.CACHE_LEASE_TIMEOUT):
+                return value
+            try:
+                return cls._load_and_set(key, load, overwrite=True)
+            finally:
+                cache.delete(lease_key)
+
+        if cache.add(lease_key, 1, settings.CACHE_LEASE_TIMEOUT):
+            try:
+                return cls._load_and_set(key, load)
+            finally:
+                cache.delete(lease_key)
+
+        # Someone else is loading it
+        stale_envelope = cache.get(cls._get_stale_key(key))
+        if stale_envelope is not None:
+            return stale_envelope[2]
+        deadline = time.time() + settings.CACHE_LEASE_WAIT_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(settings.CACHE_LEASE_POLL_INTERVAL)
+            envelope = cache.get(key)
+            if envelope is not None:
+                return envelope[2]
+        # The loader is too slow or died, do not wait any longer
+        return cls._load_and_set(key, load)
+
+    @classmethod
+    def invalidate(cls, key):
+        # Keep a copy for CACHE_STALE_TIMEOUT seconds, which is served to the
+        # readers waiting for the lease holder to reload the key
+        envelope = cache.get(key)
+        if envelope is not None:
+            cache.set(
+                cls._get_stale_key(key),
+                envelope,
+                settings.CACHE_STALE_TIMEOUT,
+            )
+        cache.delete(key)
+
+    @classmethod
+    def load_object_through_cache(cls, model_class, key, load):
+        """
+        Read an object from the local cache, then from memcached, and call
+        load() to read it from db when both miss.
+        """
+        key = cls._get_versioned_key(model_class, key)
 
-        # Cache hit, return immediately
-        obj = cache.get(key)
+        # Local cache hit, no network round trip at all
+        obj = LocalCache.get(key)
         if obj is not None:
             return obj
 
-        # Cache miss, read from db
-        obj = model_class.objects.get(id=object_id)
-        cache.set(key, obj)
-
+        serialized_data = cls.get_or_load(
+            key,
+            lambda: CompactModelSerializer.serialize(load()),
+        )
+        obj = CompactModelSerializer.deserialize(model_class, serialized_data)
+        LocalCache.set(key, obj)
         return obj
 
+    @classmethod
+    def get_cached_objects(cls, model_class, keys):
+        # One get_many round trip for whatever the local cache misses
+        key_map = {cls._get_versioned_key(model_class, key): key
+                   for key in keys}
+        objects = LocalCache.get_many(key_map)
+        missing_keys = [key for key in key_map if key not in objects]
+        if missing_keys:
+            memcached_objects = {
+                key: CompactModelSerializer.deserialize(model_class, value)
+                for key, (_, _, value) in cache.get_many(missing_keys).items()
+            }
+            LocalCache.set_many(memcached_objects)
+            objects.update(memcached_objects)
+        return {key_map[key]: obj for key, obj in objects.items()}
+
+    @classmethod
+    def set_cached_objects(cls, model_class, key_to_object):
+        key_to_object = {
+            cls._get_versioned_key(model_class, key): obj
+            for key, obj in key_to_object.items()
+        }
+        cache.set_many({
+            key: cls._wrap(CompactModelSerializer.serialize(obj))
+            for key, obj in key_to_object.items()
+        })
+        LocalCache.set_many(key_to_object)
+
+    @classmethod
+    def delete_cached_object(cls, model_class, key):
+        key = cls._get_versioned_key(model_class, key)
+        cls.invalidate(key)
+        LocalCache.delete(key)
+
+    @classmethod
+    def write_through(cls, model_class, key, queryset):
+        """
+        Cache the row as it is in db now, not as the saved instance. The row
+        stays locked until it is cached, so when the on_commit callbacks of
+        two writes run out of order, the last committed row is still the
+        one cached.
+        """
+        with transaction.atomic():
+            obj = queryset.select_for_update().first()
+            if obj is None:
+                cls.delete_cached_object(model_class, key)
+                return
+            cls.set_cached_objects(model_class, {key: obj})
+
+    @classmethod
+    def update_object_cache(cls, model_class, object_id):
+        cls.write_through(
+            model_class,
+            cls.get_key(model_class, object_id),
+            model_class.objects.filter(id=object_id),
+        )
+
+    @classmethod
+    def get_object_through_cache(cls, model_class, object_id):
+        return cls.load_object_through_cache(
+            model_class,
+            cls.get_key(model_class, object_id),
+            lambda: model_class.objects.get(id=object_id),
+        )
+
+    @classmethod
+    def get_objects_through_cache(cls, model_class, object_ids):
+        """
+        Batch version of get_object_through_cache. Takes one get_many round
+        trip, one id__in query for the misses and one set_many to back fill
+        them. Returns a dict of object id to object, ids which do not exist
+        are left out.
+        """
+        object_ids = set(object_ids)
+        key_to_id = {cls.get_key(model_class, object_id): object_id
+                     for object_id in object_ids}
+        cached_objects = cls.get_cached_objects(model_class, key_to_id)
+        objects = {key_to_id[key]: obj for key, obj in cached_objects.items()}
+
+        missing_ids = object_ids - set(objects)
+        if not missing_ids:
+            return objects
+
+        db_objects = model_class.objects.filter(id__in=missing_ids)
+        cls.set_cached_objects(model_class, {
+            cls.get_key(model_class, obj.id): obj
+            for obj in db_objects
+        })
+        objects.update({obj.id: obj for obj in db_objects})
+        return objects
+
+    @classmethod
+    def prefetch_objects_through_cache(cls, objects, model_class, id_attr,
+                                       cached_attr):
+        """
+        Load the related objects of all the objects in one go and memoize
+        each of them on its owner as cached_attr, which the cached_xxx
+        properties of the models read first.
+        """
+        object_ids = {getattr(obj, id_attr) for obj in objects}
+        object_ids.discard(None)
+        related_objects = cls.get_objects_through_cache(model_class, object_ids)
+        for obj in objects:
+            related_object = related_objects.get(getattr(obj, id_attr))
+            if related_object is not None:
+                setattr(obj, cached_attr, related_object)
+
     @classmethod
     def invalidate_object_cache(cls, model_class, object_id):
         key = cls.get_key(model_class, object_id)
-        cache.delete(key)
+        cls.delete_cached_object(model_class, key)
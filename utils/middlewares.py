@@ -0,0 +1,15 @@
+from utils.local_cache import LocalCache
+
+
+class LocalCacheMiddleware:
+    """
+    Give every request its own L1 cache and drop it when the response is
+    ready, see utils.local_cache.LocalCache.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with LocalCache.request_scope():
+            return self.get_response(request)
@@ -1,56 +1,272 @@
+import base64
+import binascii
+import math
+
+from dateutil import parser
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
 
-class FriendshipPagination(PageNumberPagination):
-    # Default page size, can be overwritten by ?page_size=xxx
-    page_size = 20
+def encode_cursor(created_at, key):
+    # Opaque to clients, they only hand it back to get the next page
+    payload = '{}|{}'.format(created_at.isoformat(), key)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
 
-    # Page_size_query_param is set to None when not defined
-    # Use this to define wanted page size so that it can be used
-    # in the frontend to different page sizes for different clients
-    page_size_query_param = 'page_size'
 
-    # Maximum page size
-    max_page_size = 20
+def decode_cursor(cursor):
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        payload = base64.urlsafe_b64decode(cursor + padding).decode()
+        created_at, key = payload.split('|')
+        return parser.isoparse(created_at), int(key)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
 
-    def get_paginated_response(self, data):
-        return Response({
-            'total_results': self.page.paginator.count,
-            'total_pages': self.page.paginator.num_pages,
-            'page_number': self.page.number,
-            'has_next_page': self.page.has_next(),
-            'results': data,
+
+def filter_by_cursor(queryset, cursor, key_field='id', reverse=True,
+                     time_field='created_at'):
+    """
+    Keep the rows after the cursor in (created_at, key_field) order, which is
+    (created_at, key) < cursor when reverse is True. Both ranges are served by
+    an index on (..., created_at, key_field) without any offset. A cursor
+    with key None only compares created_at, as the legacy created_at params.
+    Models ordered by another datetime column pass it as time_field.
+    """
+    created_at, key = cursor
+    lookup = 'lt' if reverse else 'gt'
+    condition = Q(**{time_field + '__' + lookup: created_at})
+    if key is not None:
+        condition |= Q(**{
+            time_field: created_at,
+            key_field + '__' + lookup: key,
         })
+    return queryset.filter(condition)
 
 
 class EndlessPagination(PageNumberPagination):
     page_size = 20
+    cursor_query_param = 'cursor'
+    # Breaks the ties between objects created in the same microsecond
+    cursor_key_field = 'id'
+    # The datetime column the pages are ordered by
+    cursor_time_field = 'created_at'
+    # Newest first, set to False to page from the oldest
+    reverse = True
 
     def __init__(self):
         super(EndlessPagination, self).__init__()
         self.has_next_page = False
+        self.next_cursor = None
 
     def to_html(self):
         return ''
 
+    def get_ordering(self):
+        prefix = '-' if self.reverse else ''
+        return (
+            prefix + self.cursor_time_field,
+            prefix + self.cursor_key_field,
+        )
+
+    def is_first_page(self, request):
+        return self.get_cursor(request) is None and \
+            'created_at__gt' not in request.query_params
+
+    def get_cursor(self, request):
+        """
+        Return the (created_at, key) position the requested page starts
+        after, None for the first page. The legacy created_at__lt param
+        gives a position with key None, it only means "after" when the pages
+        are read from the newest.
+        """
+        if self.cursor_query_param in request.query_params:
+            return decode_cursor(request.query_params[self.cursor_query_param])
+        if 'created_at__lt' in request.query_params:
+            if not self.reverse:
+                raise ValidationError({
+                    'created_at__lt': 'Use cursor to page from the oldest.',
+                })
+            created_at__lt = request.query_params['created_at__lt']
+            return parser.isoparse(created_at__lt), None
+        return None
+
+    def _set_next_cursor(self, page):
+        self.next_cursor = None
+        if self.has_next_page and page:
+            last_obj = page[-1]
+            self.next_cursor = encode_cursor(
+                getattr(last_obj, self.cursor_time_field),
+                getattr(last_obj, self.cursor_key_field),
+            )
+
     def paginate_queryset(self, queryset, request, view=None):
         if 'created_at__gt' in request.query_params:
             created_at__gt = request.query_params['created_at__gt']
-            queryset = queryset.filter(created_at__gt=created_at__gt)
+            queryset = queryset.filter(**{
+                self.cursor_time_field + '__gt': created_at__gt,
+            })
             self.has_next_page = False
-            return queryset.order_by('-created_at')
+            self.next_cursor = None
+            return queryset.order_by(*self.get_ordering())
 
-        if 'created_at__lt' in request.query_params:
-            created_at__lt = request.query_params['created_at__lt']
-            queryset = queryset.filter(created_at__lt=created_at__lt)
+        cursor = self.get_cursor(request)
+        if cursor is not None:
+            queryset = filter_by_cursor(
+                queryset,
+                cursor,
+                self.cursor_key_field,
+                self.reverse,
+                self.cursor_time_field,
+            )
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.get_ordering())
+        page = list(queryset[:page_size + 1])
+        self.has_next_page = len(page) > page_size
+        page = page[:page_size]
+        self._set_next_cursor(page)
+        return page
+
+    def _is_after(self, obj, created_at, key):
+        obj_created_at = getattr(obj, self.cursor_time_field)
+        if obj_created_at != created_at:
+            return (obj_created_at < created_at) == self.reverse
+        if key is None:
+            return False
+        obj_key = getattr(obj, self.cursor_key_field)
+        return obj_key != key and (obj_key < key) == self.reverse
 
-        queryset = queryset.order_by('-created_at')[:self.page_size + 1]
-        self.has_next_page = len(queryset) > self.page_size
-        return queryset[:self.page_size]
+    def _bisect(self, reverse_ordered_list, is_after):
+        # The list is ordered by (created_at, key), binary search for the
+        # index of the first object for which is_after holds
+        low, high = 0, len(reverse_ordered_list)
+        while low < high:
+            mid = (low + high) // 2
+            if is_after(reverse_ordered_list[mid]):
+                high = mid
+            else:
+                low = mid + 1
+        return low
+
+    def paginate_ordered_list(self, reverse_ordered_list, request):
+        if 'created_at__gt' in request.query_params:
+            created_at__gt = parser.isoparse(
+                request.query_params['created_at__gt'],
+            )
+            # Every object before this index is newer than created_at__gt
+            index = self._bisect(
+                reverse_ordered_list,
+                lambda obj: getattr(
+                    obj,
+                    self.cursor_time_field,
+                ) <= created_at__gt,
+            )
+            self.has_next_page = False
+            self.next_cursor = None
+            return reverse_ordered_list[:index]
+
+        index = 0
+        cursor = self.get_cursor(request)
+        if cursor is not None:
+            index = self._bisect(
+                reverse_ordered_list,
+                lambda obj: self._is_after(obj, *cursor),
+            )
+        page_size = self.get_page_size(request)
+        self.has_next_page = len(reverse_ordered_list) > index + page_size
+        page = reverse_ordered_list[index: index + page_size]
+        self._set_next_cursor(page)
+        return page
+
+    def paginate_cached_list(self, cached_list, request, is_complete=None):
+        paginated_list = self.paginate_ordered_list(cached_list, request)
+        # Pulling the latest objects, everything newer than the newest cached
+        # object is already in the cache
+        if 'created_at__gt' in request.query_params:
+            return paginated_list
+        # There are more objects in the cache, no need to go to db
+        if self.has_next_page:
+            return paginated_list
+        # The cache holds less than the limit, so it holds all the objects.
+        # Callers merging several cached lists tell it through is_complete.
+        if is_complete is None:
+            is_complete = len(cached_list) < settings.REDIS_LIST_LENGTH_LIMIT
+        if is_complete:
+            return paginated_list
+        # The requested page might go beyond the cached window, return None
+        # and let the caller read from db
+        return None
+
+    def get_paginated_response(self, data):
+        return Response({
+            'has_next_page': self.has_next_page,
+            'next_cursor': self.next_cursor,
+            'results': data,
+        })
+
+
+class CommentPagination(EndlessPagination):
+    # Comments read from the oldest, as a conversation
+    reverse = False
+
+    def get_paginated_response(self, data):
+        return Response({
+            'has_next_page': self.has_next_page,
+            'next_cursor': self.next_cursor,
+            'comments': data,
+        })
+
+
+class NewsFeedPagination(EndlessPagination):
+    # Newsfeeds pulled from tweets are not saved and have no id, the tweet
+    # id is unique among the newsfeeds of a user as well
+    cursor_key_field = 'tweet_id'
+
+
+class NotificationPagination(EndlessPagination):
+    # Notifications have no created_at, a coalesced notification moves its
+    # timestamp forward to the latest event
+    cursor_time_field = 'timestamp'
+
+
+class FriendshipPagination(EndlessPagination):
+    # Default page size, can be overwritten by ?page_size=xxx
+    page_size = 20
+
+    # Page_size_query_param is set to None when not defined
+    # Use this to define wanted page size so that it can be used
+    # in the frontend to different page sizes for different clients
+    page_size_query_param = 'page_size'
+
+    # Maximum page size
+    max_page_size = 20
+
+    def __init__(self):
+        super(FriendshipPagination, self).__init__()
+        # Set by the views from the cached follower / following counters,
+        # no COUNT(*) over the friendships is needed
+        self.total_results = 0
+        self.page_size_used = self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size_used = self.get_page_size(request)
+        return super(FriendshipPagination, self).paginate_queryset(
+            queryset,
+            request,
+            view,
+        )
 
     def get_paginated_response(self, data):
         return Response({
+            'total_results': self.total_results,
+            # Same as django's Paginator, there is always at least one page
+            'total_pages': max(
+                1,
+                math.ceil(self.total_results / self.page_size_used),
+            ),
             'has_next_page': self.has_next_page,
+            'next_cursor': self.next_cursor,
             'results': data,
         })
@@ -0,0 +1,276 @@
+import time
+
+from django.conf import settings
+
+from utils.redis_client import RedisClient
+from utils.redis_serializers import DjangoModelSerializer
+
+# Redis can not store an empty set, object ids start from 1 so 0 is used as a
+# placeholder member to cache an empty set
+EMPTY_SET_PLACEHOLDER = 0
+
+# Push an object onto a cached list, unless the list is not cached, or the
+# object is in it already, e.g. pushed by a retried task
+PUSH_IF_CACHED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+if redis.call('LPOS', KEYS[1], ARGV[1]) then
+    return 0
+end
+redis.call('LPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], 0, ARGV[2])
+return 1
+"""
+
+# Add to a counter only if it is cached, checking and adding in one step so
+# the counter can not expire in between
+INCR_IF_CACHED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+return redis.call('INCRBY', KEYS[1], ARGV[1])
+"""
+
+
+class RedisHelper:
+
+    @classmethod
+    def _load_objects_to_cache(cls, key, objects):
+        conn = RedisClient.get_connection()
+
+        # Only cache the newest REDIS_LIST_LENGTH_LIMIT objects, anything
+        # older than that is read from db. Very few users page that deep so
+        # the db can easily handle those requests.
+        serialized_list = []
+        for obj in objects[:settings.REDIS_LIST_LENGTH_LIMIT]:
+            serialized_data = DjangoModelSerializer.serialize(obj)
+            serialized_list.append(serialized_data)
+
+        if serialized_list:
+            conn.rpush(key, *serialized_list)
+            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+
+    @classmethod
+    def load_objects(cls, key, queryset, limit=None):
+        """
+        Return the cached objects, or only the newest limit of them when
+        limit is given.
+        """
+        conn = RedisClient.get_connection()
+
+        # Cache hit, deserialize and return immediately
+        if conn.exists(key):
+            end = -1 if limit is None else limit - 1
+            serialized_list = conn.lrange(key, 0, end)
+            objects = []
+            for serialized_data in serialized_list:
+                deserialized_obj = DjangoModelSerializer.deserialize(
+                    serialized_data,
+                )
+                objects.append(deserialized_obj)
+            return objects
+
+        # Cache miss, load from db and fill the cache. Evaluate the queryset
+        # only once and return a list so the return type is the same as the
+        # cache hit case.
+        objects = list(queryset[:settings.REDIS_LIST_LENGTH_LIMIT])
+        cls._load_objects_to_cache(key, objects)
+        return objects[:limit]
+
+    @classmethod
+    def push_object(cls, key, obj, queryset):
+        conn = RedisClient.get_connection()
+
+        # If the list is not in cache yet, load it from db directly instead of
+        # pushing a single object, otherwise the cache would hold only the
+        # newest object and be treated as the full list.
+        if not conn.exists(key):
+            cls._load_objects_to_cache(key, queryset)
+            return
+
+        serialized_data = DjangoModelSerializer.serialize(obj)
+        conn.lpush(key, serialized_data)
+        conn.ltrim(key, 0, settings.REDIS_LIST_LENGTH_LIMIT - 1)
+
+    @classmethod
+    def push_objects_if_cached(cls, key_to_object):
+        """
+        Push each object onto its list in one pipeline. Lists which are not
+        cached are skipped, they are loaded from db as a whole on the next
+        read, so pushing to inactive users costs no db query at all.
+        """
+        if not key_to_object:
+            return
+        conn = RedisClient.get_connection()
+        pipeline = conn.pipeline(transaction=False)
+        for key, obj in key_to_object.items():
+            pipeline.eval(
+                PUSH_IF_CACHED_SCRIPT,
+                1,
+                key,
+                DjangoModelSerializer.serialize(obj),
+                settings.REDIS_LIST_LENGTH_LIMIT - 1,
+            )
+        pipeline.execute()
+
+    @classmethod
+    def _load_set_to_cache(cls, key, load):
+        """
+        Make sure the set is in cache. Only the request holding the lease
+        reads db, the others wait for it, or give up waiting and read db
+        without writing the cache, since they might overwrite deltas that
+        were applied in the meantime.
+        Returns the members read from db, or None when the set was cached.
+        """
+        conn = RedisClient.get_connection()
+        if conn.exists(key):
+            return None
+
+        lease_key = 'lease:{}'.format(key)
+        if conn.set(lease_key, 1, nx=True, ex=settings.CACHE_LEASE_TIMEOUT):
+            try:
+                members = set(load())
+                conn.sadd(key, EMPTY_SET_PLACEHOLDER, *members)
+                conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+                return members
+            finally:
+                conn.delete(lease_key)
+
+        deadline = time.time() + settings.CACHE_LEASE_WAIT_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(settings.CACHE_LEASE_POLL_INTERVAL)
+            if conn.exists(key):
+                return None
+        return set(load())
+
+    @classmethod
+    def load_set(cls, key, load):
+        """
+        Return the integer members of a cached set, load() is called to
+        read them from db when the set is not cached.
+        """
+        members = cls._load_set_to_cache(key, load)
+        if members is not None:
+            return members
+        conn = RedisClient.get_connection()
+        members = {int(member) for member in conn.smembers(key)}
+        members.discard(EMPTY_SET_PLACEHOLDER)
+        return members
+
+    @classmethod
+    def check_set_members(cls, key, members, load):
+        """
+        Check whether each of the members is in the cached set with a single
+        SMISMEMBER, returns a list of bools in the same order.
+        """
+        members = list(members)
+        if not members:
+            return []
+        loaded_members = cls._load_set_to_cache(key, load)
+        if loaded_members is not None:
+            return [member in loaded_members for member in members]
+        conn = RedisClient.get_connection()
+        return [bool(is_member) for is_member in conn.smismember(key, members)]
+
+    @classmethod
+    def add_to_set(cls, key, member):
+        # Only update a set which is already cached, a missing set is loaded
+        # from db as a whole on the next read
+        conn = RedisClient.get_connection()
+        if conn.exists(key):
+            conn.sadd(key, member)
+
+    @classmethod
+    def remove_from_set(cls, key, member):
+        conn = RedisClient.get_connection()
+        conn.srem(key, member)
+
+    @classmethod
+    def get_count_key(cls, model_class, object_id, attr):
+        return '{}.{}:{}'.format(model_class.__name__, attr, object_id)
+
+    @classmethod
+    def _load_count_to_cache(cls, model_class, object_id, attr):
+        conn = RedisClient.get_connection()
+        count = model_class.objects.filter(
+            id=object_id,
+        ).values_list(attr, flat=True).first() or 0
+        key = cls.get_count_key(model_class, object_id, attr)
+        # nx keeps a counter loaded and increased since the db was read
+        if conn.set(key, count, ex=settings.REDIS_KEY_EXPIRE_TIME, nx=True):
+            return count
+        cached_count = conn.get(key)
+        return count if cached_count is None else int(cached_count)
+
+    @classmethod
+    def get_counts(cls, model_class, object_ids, attr):
+        """
+        Batch version of get_count, one MGET for all the objects and one
+        query to back fill the misses. Returns a dict of object id to count.
+        """
+        object_ids = list(object_ids)
+        if not object_ids:
+            return {}
+        conn = RedisClient.get_connection()
+        keys = [
+            cls.get_count_key(model_class, object_id, attr)
+            for object_id in object_ids
+        ]
+        counts, missing_ids = {}, []
+        for object_id, count in zip(object_ids, conn.mget(keys)):
+            if count is None:
+                missing_ids.append(object_id)
+            else:
+                counts[object_id] = int(count)
+        if not missing_ids:
+            return counts
+
+        db_counts = dict(model_class.objects.filter(
+            id__in=missing_ids,
+        ).values_list('id', attr))
+        pipeline = conn.pipeline()
+        for object_id in missing_ids:
+            counts[object_id] = db_counts.get(object_id) or 0
+            # nx keeps a counter increased since the db was read
+            pipeline.set(
+                cls.get_count_key(model_class, object_id, attr),
+                counts[object_id],
+                ex=settings.REDIS_KEY_EXPIRE_TIME,
+                nx=True,
+            )
+        pipeline.execute()
+        return counts
+
+    @classmethod
+    def _add_to_count(cls, model_class, object_id, attr, amount):
+        conn = RedisClient.get_connection()
+        key = cls.get_count_key(model_class, object_id, attr)
+        count = conn.eval(INCR_IF_CACHED_SCRIPT, 1, key, amount)
+        if count is None:
+            # Back fill the cache from db. Do not add amount here, the db
+            # value has already been changed before the count is.
+            return cls._load_count_to_cache(model_class, object_id, attr)
+        return count
+
+    @classmethod
+    def incr_count(cls, model_class, object_id, attr):
+        return cls._add_to_count(model_class, object_id, attr, 1)
+
+    @classmethod
+    def decr_count(cls, model_class, object_id, attr):
+        return cls._add_to_count(model_class, object_id, attr, -1)
+
+    @classmethod
+    def get_count(cls, model_class, object_id, attr):
+        conn = RedisClient.get_connection()
+        key = cls.get_count_key(model_class, object_id, attr)
+        count = conn.get(key)
+        if count is not None:
+            return int(count)
+        return cls._load_count_to_cache(model_class, object_id, attr)
+
+    @classmethod
+    def invalidate_count(cls, model_class, object_id, attr):
+        conn = RedisClient.get_connection()
+        conn.delete(cls.get_count_key(model_class, object_id, attr))
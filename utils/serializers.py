@@ -0,0 +1,17 @@
+from django.db import models
+from rest_framework import serializers
+
+
+class PrefetchListSerializer(serializers.ListSerializer):
+    """
+    Give the child serializer a chance to load whatever it needs for the
+    whole list in batches, e.g. cached users or has_liked, before the rows
+    are rendered one by one. The child implements prefetch(objects).
+    """
+
+    def to_representation(self, data):
+        # Same as ListSerializer, related managers need to call .all() first
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        objects = list(iterable)
+        self.child.prefetch(objects)
+        return super().to_representation(objects)
@@ -1,4 +1,17 @@
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from rest_framework.exceptions import ValidationError
+
+from accounts.models import UserProfile
 from testing.testcases import TestCase
+from tweets.models import Tweet
+from utils.cache_serializers import CompactModelSerializer
+from utils.local_cache import LocalCache, LRUCache
+from utils.memcached_helper import MemchachedHelper, cache
+from utils.paginations import decode_cursor, encode_cursor, filter_by_cursor
 from utils.redis_client import RedisClient
 
 
@@ -17,3 +30,182 @@ class UtilsTests(TestCase):
         RedisClient.clear()
         cached_list = conn.lrange('redis_key', 0, -1)
         self.assertEqual(cached_list, [])
+
+    def test_get_objects_through_cache(self):
+        users = [self.create_user('user{}'.format(i)) for i in range(3)]
+        MemchachedHelper.get_object_through_cache(User, users[0].id)
+
+        user_ids = [user.id for user in users] + [0]
+        objects = MemchachedHelper.get_objects_through_cache(User, user_ids)
+        self.assertEqual(set(objects), {user.id for user in users})
+        for user in users:
+            self.assertEqual(objects[user.id].username, user.username)
+            key = MemchachedHelper.get_key(User, user.id)
+            self.assertEqual(
+                key in MemchachedHelper.get_cached_objects(User, [key]),
+                True,
+            )
+
+        # all hit the cache now
+        with self.assertNumQueries(0):
+            objects = MemchachedHelper.get_objects_through_cache(
+                User,
+                [user.id for user in users],
+            )
+        self.assertEqual(len(objects), 3)
+
+    def test_lru_cache(self):
+        lru = LRUCache(max_size=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        # b is the least recently used one
+        self.assertEqual(lru.get('b'), None)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.get('c'), 3)
+
+        lru = LRUCache(max_size=2, ttl=10)
+        with mock.patch('utils.local_cache.time.monotonic', return_value=0):
+            lru.set('a', 1)
+        with mock.patch('utils.local_cache.time.monotonic', return_value=5):
+            self.assertEqual(lru.get('a'), 1)
+        with mock.patch('utils.local_cache.time.monotonic', return_value=11):
+            self.assertEqual(lru.get('a'), None)
+
+    def test_request_local_cache(self):
+        user = self.create_user('user1')
+        key = MemchachedHelper._get_versioned_key(
+            User,
+            MemchachedHelper.get_key(User, user.id),
+        )
+
+        # off outside requests
+        MemchachedHelper.get_object_through_cache(User, user.id)
+        self.assertEqual(LocalCache.get(key), None)
+
+        with LocalCache.request_scope():
+            obj = MemchachedHelper.get_object_through_cache(User, user.id)
+            with mock.patch.object(cache, 'get') as cache_get:
+                cached = MemchachedHelper.get_object_through_cache(
+                    User,
+                    user.id,
+                )
+                self.assertEqual(cache_get.called, False)
+            self.assertIs(cached, obj)
+
+            MemchachedHelper.invalidate_object_cache(User, user.id)
+            self.assertEqual(LocalCache.get(key), None)
+        self.assertEqual(LocalCache.get(key), None)
+
+    @override_settings(PROCESS_LOCAL_CACHE_ENABLED=True)
+    def test_process_local_cache(self):
+        user = self.create_user('user1')
+        key = MemchachedHelper._get_versioned_key(
+            User,
+            MemchachedHelper.get_key(User, user.id),
+        )
+        MemchachedHelper.get_object_through_cache(User, user.id)
+
+        # shared across requests, but never the same instance
+        cached = LocalCache.get(key)
+        self.assertEqual(cached.username, 'user1')
+        self.assertIsNot(LocalCache.get(key), cached)
+
+        MemchachedHelper.invalidate_object_cache(User, user.id)
+        self.assertEqual(LocalCache.get(key), None)
+
+    def test_compact_model_serializer(self):
+        user = self.create_user('user1')
+        tweet = self.create_tweet(user)
+        tweet._cached_user = user
+        data = CompactModelSerializer.serialize(tweet)
+        cached_tweet = CompactModelSerializer.deserialize(Tweet, data)
+        self.assertEqual(cached_tweet.id, tweet.id)
+        self.assertEqual(cached_tweet.user_id, user.id)
+        self.assertEqual(cached_tweet.content, tweet.content)
+        self.assertEqual(cached_tweet.created_at, tweet.created_at)
+        self.assertEqual(hasattr(cached_tweet, '_cached_user'), False)
+
+        profile = UserProfile.objects.create(
+            user=user,
+            nickname='one',
+            avatar='avatar.png',
+        )
+        data = CompactModelSerializer.serialize(profile)
+        cached_profile = CompactModelSerializer.deserialize(UserProfile, data)
+        self.assertEqual(cached_profile.nickname, 'one')
+        self.assertEqual(cached_profile.avatar.name, 'avatar.png')
+
+        self.assertNotEqual(
+            CompactModelSerializer.get_schema_version(Tweet),
+            CompactModelSerializer.get_schema_version(UserProfile),
+        )
+
+    def test_get_or_load(self):
+        load = mock.Mock(return_value='value')
+        self.assertEqual(MemchachedHelper.get_or_load('key', load), 'value')
+        self.assertEqual(MemchachedHelper.get_or_load('key', load), 'value')
+        self.assertEqual(load.call_count, 1)
+        # lease is released after loading
+        self.assertEqual(cache.get(MemchachedHelper._get_lease_key('key')), None)
+
+        # someone else holds the lease, serve the stale copy
+        MemchachedHelper.invalidate('key')
+        cache.add(MemchachedHelper._get_lease_key('key'), 1)
+        load.return_value = 'new value'
+        self.assertEqual(MemchachedHelper.get_or_load('key', load), 'value')
+        self.assertEqual(load.call_count, 1)
+
+    @override_settings(CACHE_LEASE_WAIT_TIMEOUT=0.1)
+    def test_get_or_load_lease_timeout(self):
+        cache.add(MemchachedHelper._get_lease_key('key'), 1)
+        load = mock.Mock(return_value='value')
+        # no stale copy, gives up waiting for the lease holder
+        self.assertEqual(MemchachedHelper.get_or_load('key', load), 'value')
+        self.assertEqual(load.call_count, 1)
+
+    def test_get_or_load_early_refresh(self):
+        load = mock.Mock(return_value='new value')
+        # expires in 10 seconds and took 5 seconds to load
+        cache.set('key', (time.time() + 10, 5, 'value'))
+        with mock.patch('utils.memcached_helper.random.random',
+                        return_value=0.1):
+            self.assertEqual(
+                MemchachedHelper.get_or_load('key', load),
+                'value',
+            )
+        with mock.patch('utils.memcached_helper.random.random',
+                        return_value=0.9):
+            self.assertEqual(
+                MemchachedHelper.get_or_load('key', load),
+                'new value',
+            )
+        self.assertEqual(load.call_count, 1)
+
+    def test_cursor(self):
+        tweet = Tweet.objects.create(user=self.create_user('user'))
+        cursor = encode_cursor(tweet.created_at, tweet.id)
+        self.assertEqual(decode_cursor(cursor), (tweet.created_at, tweet.id))
+        with self.assertRaises(ValidationError):
+            decode_cursor('not a cursor')
+
+    def test_filter_by_cursor(self):
+        user = self.create_user('user')
+        tweets = [Tweet.objects.create(user=user) for i in range(4)]
+        created_at = tweets[0].created_at
+        Tweet.objects.update(created_at=created_at)
+
+        queryset = Tweet.objects.order_by('id')
+        cursor = (created_at, tweets[2].id)
+        self.assertEqual(
+            list(filter_by_cursor(queryset, cursor)),
+            tweets[:2],
+        )
+        self.assertEqual(
+            list(filter_by_cursor(queryset, cursor, reverse=False)),
+            tweets[3:],
+        )
+        # Without a key only created_at is compared
+        cursor = (created_at, None)
+        self.assertEqual(list(filter_by_cursor(queryset, cursor)), [])
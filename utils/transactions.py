@@ -0,0 +1,7 @@
+from django.db import transaction
+
+
+def run_on_commit(func):
+    # Tests capture and run the callbacks with captureOnCommitCallbacks of
+    # testing.testcases.TestCase
+    transaction.on_commit(func)